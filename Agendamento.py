@@ -1,43 +1,25 @@
-import os
 import streamlit as st
 import pandas as pd
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import plotly.express as px
 from utils import (
-    carregar_dados_dia, salvar_agendamento, remover_agendamento_por_pin, 
+    salvar_agendamento, remover_agendamento_do_aluno, 
     gerar_estrutura_horario, verificar_login, atualizar_senha, 
     recuperar_senha_email, criar_usuario, 
     get_aulas_pendentes_avaliacao, salvar_avaliacao_aluno, 
-    carregar_tudo_formatado
+    medir_execucao, horarios_funcionamento, buscar_vagas_livres,
+    get_engajamento_aluno, get_frequencia_aluno, carregar_historico_aluno, contar_modalidades_aluno,
+    aquecer_armazenamento, aplicar_fechamento, remover_fechamento, listar_bloqueios,
+    bloqueios_do_horario, motivo_bloqueio, data_para_dia, modalidades, numero_maximo_vaga, horas_possiveis,
+    modelos_horario_linhas, salvar_modelos_horario, entrar_lista_espera, sair_lista_espera,
+    lista_espera_do_horario, seletor_unidade
 )
-from utils import conn, hash_senha, atualizar_senha
+from capacidade import DIAS_SEMANA, HORAS_DO_DIA
 from admin_view import render_admin_page
-from sqlalchemy import text
-
-# ==========================================
-# CONFIGURAÇÃO DE CONEXÃO (ROBUSTA)
-# ==========================================
-
-# 1. Tenta pegar do Render
-db_url = os.environ.get("DATABASE_URL")
-
-# 2. Se não achou, tenta pegar do secrets.toml (Local)
-if not db_url:
-    if "connections" in st.secrets and "postgres" in st.secrets["connections"]:
-        db_url = st.secrets["connections"]["postgres"]["url"]
-    else:
-        st.error("⚠️ ERRO CRÍTICO: Não encontrei a URL do banco.")
-        st.info("Verifique se o arquivo `.streamlit/secrets.toml` existe e tem a seção `[connections.postgres]`.")
-        st.stop()
-
-# 3. Correção do bug postgres://
-if db_url and db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
-
-# 4. Conecta
-conn = st.connection("postgres", type="sql", url=db_url)
+from tempo_real import get_ocupacao_ao_vivo
 
 st.set_page_config(page_title="Agenda Naalli", page_icon="🏋️‍♀️", layout="wide")
+aquecer_armazenamento()
 
 # --- GERENCIAMENTO DE SESSÃO ---
 if "logged_in" not in st.session_state:
@@ -62,6 +44,7 @@ def login_screen():
         st.header("🔐 Agenda Naalli")
         st.write("Faça login para agendar.")
         
+        seletor_unidade("Unidade", "unidade_login")
         email = st.text_input("E-mail")
         senha = st.text_input("Senha", type="password")
         
@@ -125,6 +108,415 @@ def force_change_screen():
             else:
                 st.error("As senhas não conferem ou são muito curtas.")
 
+# --- ABA 1: AGENDAMENTO (fragmento: trocar data/horário não recarrega as outras abas) ---
+@st.fragment
+def aba_agendamento():
+    busca_vagas()
+
+    c1, c2 = st.columns(2)
+    with c1:
+        data_sel = st.date_input("Data:", date.today(), format="DD/MM/YYYY")
+        data_str = data_sel.strftime("%d/%m/%Y")
+    
+    dia_semana = data_sel.weekday() # 5 = Sábado, 6 = Domingo
+    
+    # Horários e capacidade vêm dos modelos de horário (bloco "Horários e Capacidade" do Admin)
+    horarios = horarios_funcionamento(data_sel)
+    if not horarios:
+        st.error("🚫 A academia não abre neste dia.")
+        return
+
+    with c2:
+        hora_sel = st.selectbox(f"Horário ({horarios[0][:2]}h às {horarios[-1][:2]}h):", horarios)
+
+    DIAS_PT = {0: "Segunda-feira", 1: "Terça-feira", 2: "Quarta-feira", 3: "Quinta-feira", 4: "Sexta-feira", 5: "Sábado", 6: "Domingo"}
+    nome_dia = DIAS_PT[dia_semana]
+    
+    st.markdown(f"""
+        <div style="background-color: #e8f4f8; padding: 15px; border-radius: 10px; text-align: center; margin: 20px 0; border: 1px solid #b8daff; color: #004085;">
+            <span style="font-size: 20px;">📅 <b>{nome_dia}, {data_str}</b></span>
+            &nbsp;|&nbsp;
+            <span style="font-size: 20px;">⏰ <b>{hora_sel}</b></span>
+        </div>
+    """, unsafe_allow_html=True)
+
+    st.divider()
+    grade_vagas(data_str, hora_sel)
+
+# --- BUSCA DE VAGAS (fragmento: uma consulta por busca, sem varrer dia a dia) ---
+@st.fragment
+def busca_vagas():
+    with st.expander("🔎 Buscar próximo horário livre"):
+        horas = horas_possiveis()
+        with st.form("form_busca_vagas", border=False):
+            c_tipo, c_de, c_ate, c_dias, c_qtd = st.columns([2, 1, 1, 1, 1])
+            tipo = c_tipo.selectbox("Modalidade:", modalidades())
+            hora_de = c_de.selectbox("De:", horas, index=horas.index("17:00") if "17:00" in horas else 0)
+            hora_ate = c_ate.selectbox("Até:", horas, index=len(horas) - 1)
+            dias = c_dias.number_input("Próximos dias:", min_value=1, max_value=60, value=14)
+            qtd = c_qtd.number_input("Resultados:", min_value=1, max_value=20, value=3)
+            if st.form_submit_button("Buscar", use_container_width=True):
+                st.session_state.resultado_busca = buscar_vagas_livres(tipo, hora_de, hora_ate, int(dias), int(qtd))
+
+        resultado = st.session_state.get("resultado_busca")
+        if resultado is not None:
+            if not resultado:
+                st.info("Nenhum horário livre encontrado nesse intervalo.")
+            for vaga in resultado:
+                c_txt, c_btn = st.columns([3, 1])
+                c_txt.write(f"📅 **{vaga['Data']}** às **{vaga['Horario']}** — {vaga['Tipo']} {vaga['Numero']} ({vaga['Livres']} livre(s))")
+                c_btn.button("Reservar", key=f"busca_{vaga['Data']}_{vaga['Horario']}", use_container_width=True,
+                             on_click=_reservar_da_busca, args=(vaga['Data'], vaga['Horario'], vaga['Numero'], vaga['Tipo']))
+
+# --- AÇÕES DA GRADE ---
+# Rodam como callback, antes da reexecução do fragmento: a grade já é
+# desenhada com o estado novo, sem precisar de um st.rerun() extra.
+def _reservar_vaga(data_str, hora_sel, num, tipo):
+    user = st.session_state.user
+    if salvar_agendamento(data_str, hora_sel, num, tipo, user['nome'], "LOGGED_USER", user['id']):
+        st.toast("Agendado!", icon="✅")
+    else:
+        st.toast("Essa vaga acabou de ser ocupada ou foi bloqueada.", icon="⚠️")
+    # O NOTIFY da própria escrita pode chegar depois do redesenho: relê o dia do banco
+    get_ocupacao_ao_vivo().invalidar(data_str)
+
+def _reservar_da_busca(data_str, hora_sel, num, tipo):
+    _reservar_vaga(data_str, hora_sel, num, tipo)
+    st.session_state.resultado_busca = None # A ocupação mudou: resultado antigo não vale mais
+
+def _liberar_vaga(data_str, hora_sel, num, tipo):
+    # Confere o dono pelo id, como o DELETE /agendamentos da API
+    user = st.session_state.user
+    resultado = remover_agendamento_do_aluno(data_str, hora_sel, num, tipo, user['id'])
+    if resultado == "Sucesso":
+        st.toast("Vaga liberada.", icon="🗑️")
+    else:
+        st.toast(resultado, icon="⚠️")
+    get_ocupacao_ao_vivo().invalidar(data_str)
+
+def _entrar_espera(data_str, hora_sel, tipo):
+    resultado = entrar_lista_espera(data_str, hora_sel, tipo, st.session_state.user)
+    if resultado == "Sucesso":
+        st.toast("Você entrou na lista de espera. Se abrir vaga, ela é sua e avisamos por e-mail.", icon="⏳")
+    else:
+        st.toast(resultado, icon="ℹ️")
+
+def _sair_espera(data_str, hora_sel, tipo):
+    sair_lista_espera(data_str, hora_sel, tipo, st.session_state.user['id'])
+    st.toast("Você saiu da lista de espera.", icon="👋")
+
+# --- GRADE DE VAGAS (fragmento: Reservar/Liberar só reexecuta a grade) ---
+# Redesenha sozinha a cada poucos segundos lendo a ocupação em memória
+# (mantida por LISTEN/NOTIFY em tempo_real.py), sem consultar o banco.
+@st.fragment(run_every=timedelta(seconds=5))
+def grade_vagas(data_str, hora_sel):
+    with medir_execucao("Grade de vagas"):
+        ocupacao_dia = get_ocupacao_ao_vivo().ocupacao_dia(data_str)
+
+        todas_vagas = gerar_estrutura_horario(data_para_dia(data_str), hora_sel)
+        bloqueios = bloqueios_do_horario(data_str, hora_sel)
+        
+        # Modalidades novas (criadas nos modelos de horário) aparecem com o próprio nome
+        titulos = {"Treino": "🏋️‍♂️ Musculação", "Esteira": "🏃 Esteiras", "Elíptico": "🚴 Elípticos"}
+        grupos = {}
+        for v in todas_vagas:
+            grupos.setdefault(titulos.get(v.Tipo, f"🏷️ {v.Tipo}"), []).append(v)
+
+        meu_id = st.session_state.user['id']
+        futuro = datetime.strptime(f"{data_str} {hora_sel}", "%d/%m/%Y %H:%M") > datetime.now()
+        fila = None # Lida só se algum tipo estiver lotado
+        for titulo, vagas in grupos.items():
+            if vagas:
+                st.markdown(f"### {titulo}")
+                cols = st.columns(4)
+                livres, ocupadas, minhas = 0, 0, 0
+                for idx, vaga in enumerate(vagas):
+                    num, tipo = vaga.Numero, vaga.Tipo
+                    ocupante = ocupacao_dia.get((hora_sel, num, tipo))
+                    
+                    with cols[idx % 4]:
+                        motivo = motivo_bloqueio(bloqueios, num, tipo)
+                        if motivo is not None:
+                            st.error(f"🚫 {num} - Fechado" + (f" ({motivo})" if motivo else ""))
+                        elif ocupante:
+                            ocupadas += 1
+                            ocupante_nome_full, ocupante_id = ocupante
+                            nome_exibicao = formatar_nome_curto(ocupante_nome_full)
+                            st.warning(f"🔒 {num} - {nome_exibicao}")
+                            
+                            if ocupante_id == meu_id:
+                                minhas += 1
+                                st.button("Liberar", key=f"lib_{tipo}_{num}",
+                                          on_click=_liberar_vaga, args=(data_str, hora_sel, num, tipo))
+                        else:
+                            livres += 1
+                            st.success(f"✅ {num} - Livre")
+                            st.button("Reservar", key=f"res_{tipo}_{num}", type="primary", use_container_width=True,
+                                      on_click=_reservar_vaga, args=(data_str, hora_sel, num, tipo))
+
+                # Tipo lotado: fila de espera em vez de ficar reabrindo a grade
+                tipo = vagas[0].Tipo
+                if futuro and ocupadas and not livres and not minhas:
+                    if fila is None:
+                        fila = lista_espera_do_horario(data_str, hora_sel)
+                    na_fila = fila.get(tipo, [])
+                    if meu_id in na_fila:
+                        st.info(f"⏳ Você é o {na_fila.index(meu_id) + 1}º da lista de espera. Se alguém liberar, a vaga é sua e avisamos por e-mail.")
+                        st.button("Sair da lista de espera", key=f"sair_espera_{tipo}",
+                                  on_click=_sair_espera, args=(data_str, hora_sel, tipo))
+                    else:
+                        st.button(f"⏳ Entrar na lista de espera ({len(na_fila)} na fila)", key=f"espera_{tipo}",
+                                  on_click=_entrar_espera, args=(data_str, hora_sel, tipo))
+                st.markdown("---")
+
+# --- ABA 2: AVALIAÇÃO ---
+@st.fragment
+def aba_avaliacao():
+    if st.session_state.user['tipo'] == 'admin':
+        st.info("Administradores não realizam avaliações de treino.")
+        return
+
+    st.subheader("⭐ Avalie seu Treino")
+    st.caption("Ajude a Naalli a melhorar. Avalie as aulas que você já concluiu.")
+    
+    aulas_pendentes = get_aulas_pendentes_avaliacao(st.session_state.user['id'])
+    
+    if aulas_pendentes:
+        opcoes = {f"{a['Data']} - {a['Horario']} | {a['Tipo']}": a for a in aulas_pendentes}
+        escolha = st.selectbox("Selecione a aula para avaliar:", list(opcoes.keys()), key="sel_aval")
+        dados_aula = opcoes[escolha]
+        
+        with st.form("form_avaliacao"):
+            c_stars, c_text = st.columns([1, 2])
+            with c_stars:
+                st.write("Sua nota:")
+                stars = st.feedback("stars")
+            with c_text:
+                comentario = st.text_area("Comentário (Opcional):", placeholder="O que achou do treino?")
+            
+            submit_aval = st.form_submit_button("Enviar Avaliação", type="primary")
+            
+            if submit_aval:
+                if stars is not None:
+                    user = st.session_state.user
+                    salvar_avaliacao_aluno(dados_aula['doc_id'], user['nome'], dados_aula['Data'], dados_aula['Tipo'], stars+1, comentario, user['id'])
+                    st.success("Obrigado pelo feedback!")
+                    st.rerun(scope="fragment")
+                else:
+                    st.warning("Por favor, selecione as estrelas.")
+    else:
+        st.info("🎉 Você não tem avaliações pendentes no momento.")
+
+# --- ABA 3: MEU PAINEL ---
+@st.fragment
+def aba_painel():
+    if st.session_state.user['tipo'] == 'admin':
+        st.info("👉 Use a aba 'Admin' para ver os dados gerais da academia.")
+        return
+
+    st.subheader("📊 Seu Painel de Atleta")
+    
+    # Resumo pré-calculado em engajamento_aluno (consulta por chave)
+    id_user = st.session_state.user['id']
+    eng = get_engajamento_aluno(id_user)
+    
+    if eng:
+        if eng['dias_sem_vir'] <= 7:
+            status_msg = "Você está mandando bem!"
+        elif eng['dias_sem_vir'] <= 30:
+            status_msg = f"Faz {eng['dias_sem_vir']} dias que não te vemos."
+        else:
+            status_msg = "Vamos voltar a treinar?"
+
+        with st.container(border=True):
+            c_head1, c_head2 = st.columns([3, 1])
+            c_head1.markdown(f"### Status: {eng['status']}")
+            c_head1.caption(status_msg)
+            
+            # Check-ins = presença confirmada na recepção; faltas = reservas passadas sem check-in
+            freq = get_frequencia_aluno(id_user)
+            m1, m2, m3, m4, m5 = st.columns(5)
+            m1.metric("Total Check-ins", freq['checkins'])
+            m2.metric("Último Treino", freq['ultimo_checkin'].strftime('%d/%m/%Y') if freq['ultimo_checkin'] else "-")
+            m3.metric("Primeiro Treino", eng['primeira_visita'].strftime('%d/%m/%Y'))
+            m4.metric("Média / Semana", eng['media_semanal'])
+            m5.metric("Faltas", f"{freq['taxa_faltas']:.0%}" if freq['taxa_faltas'] is not None else "-",
+                      help=f"{freq['faltas']} de {freq['reservas']} reservas sem check-in")
+            
+            st.divider()
+            
+            col_chart1, col_chart2 = st.columns(2)
+            with col_chart1:
+                st.markdown("**Sua Modalidade Favorita**")
+                df_modalidades = contar_modalidades_aluno(id_user)
+                if not df_modalidades.empty:
+                    fig_pizza = px.pie(df_modalidades, names='Tipo', values='Qtd', hole=0.5, height=250)
+                    fig_pizza.update_layout(margin=dict(t=0, b=0, l=0, r=0), showlegend=False)
+                    st.plotly_chart(fig_pizza, use_container_width=True)
+                    
+            with col_chart2:
+                st.markdown("**Seus Últimos Treinos**")
+                st.dataframe(
+                    carregar_historico_aluno(id_user, limite=5), 
+                    hide_index=True, 
+                    use_container_width=True
+                )
+    else:
+        st.info("Agende seu primeiro treino para ver suas estatísticas aqui!")
+
+# --- ABA 4: ADMIN (Layout Vertical Melhorado) ---
+@st.fragment
+def aba_admin():
+    st.subheader("🔐 Área de Gestão")
+    st.caption("Selecione uma ação administrativa abaixo.")
+    st.write("<br>", unsafe_allow_html=True) # Um pouco de espaço
+
+    # --- BLOCO 1: DASHBOARD GERAL ---
+    with st.container(border=True):
+        # Cria colunas dentro do container para alinhar texto e botão
+        c_txt, c_btn = st.columns([3, 1])
+        with c_txt:
+            st.markdown("### 📊 Dashboard e KPIs")
+            st.write("Visualize gráficos de frequência, horários de pico e métricas gerais da academia.")
+        with c_btn:
+            # Centraliza o botão verticalmente usando espaços em branco
+            st.write("") 
+            st.write("") 
+            if st.button("Acessar Painel ➡️", type="primary", use_container_width=True):
+                st.session_state.view = "admin"
+                st.rerun() # Troca de tela: precisa reexecutar o app inteiro
+
+    st.write("<br>", unsafe_allow_html=True) # Espaço entre os blocos
+
+    # --- BLOCO 2: CADASTRO RÁPIDO ---
+    with st.container(border=True):
+        st.markdown("### 👤 Cadastro Rápido de Aluno")
+        st.caption("Cria um novo usuário com a senha padrão: **mudar123**")
+        
+        with st.form("form_cadastro_rapido", border=False):
+            # Coloca os campos lado a lado para economizar altura
+            c_email, c_nome = st.columns(2)
+            with c_email:
+                new_email = st.text_input("E-mail do Aluno")
+            with c_nome:
+                new_nome = st.text_input("Nome Completo")
+            
+            st.write("") # Espacinho antes do botão
+            submit_cad = st.form_submit_button("Concluir Cadastro", use_container_width=True)
+            
+            if submit_cad:
+                # Verifica se os campos foram preenchidos
+                if new_email and new_nome:
+                    if criar_usuario(new_email, new_nome, "mudar123"):
+                        # st.toast é uma notificação mais elegante que some sozinha
+                        st.toast(f"✅ Usuário **{new_nome}** criado com sucesso!", icon="🎉") 
+                    else:
+                        st.error("Erro: Este e-mail já está cadastrado no sistema.")
+                else:
+                    st.warning("Preencha o e-mail e o nome.")
+
+    st.write("<br>", unsafe_allow_html=True)
+
+    # --- BLOCO 3: FECHAMENTOS ---
+    bloco_fechamentos()
+
+    st.write("<br>", unsafe_allow_html=True)
+
+    # --- BLOCO 4: HORÁRIOS E CAPACIDADE ---
+    bloco_modelos_horario()
+
+# --- FECHAMENTOS (feriado, manutenção de aparelho) ---
+@st.fragment
+def bloco_fechamentos():
+    with st.container(border=True):
+        st.markdown("### 🚧 Fechamentos")
+        st.caption("Bloqueia horários de um dia, cancela as reservas atingidas e avisa os alunos por e-mail.")
+
+        horas = horas_possiveis()
+        with st.form("form_fechamento", border=False):
+            c_dia, c_de, c_ate = st.columns([2, 1, 1])
+            dia = c_dia.date_input("Dia:", date.today(), format="DD/MM/YYYY")
+            hora_de = c_de.selectbox("De:", horas, index=0)
+            hora_ate = c_ate.selectbox("Até:", horas, index=len(horas) - 1)
+            c_tipo, c_num, c_motivo = st.columns([1, 1, 2])
+            tipo = c_tipo.selectbox("Aparelhos:", ["Todos"] + modalidades())
+            numero = c_num.number_input("Nº (0 = todos do tipo):", min_value=0, max_value=numero_maximo_vaga(), value=0)
+            motivo = c_motivo.text_input("Motivo:", placeholder="Ex.: Feriado, manutenção da esteira")
+            confirmar = st.checkbox("Confirmo o cancelamento das reservas nesse período")
+
+            if st.form_submit_button("Aplicar Fechamento", type="primary", use_container_width=True):
+                if hora_de > hora_ate:
+                    st.warning("O horário inicial deve ser antes do final.")
+                elif not confirmar:
+                    st.warning("Marque a confirmação para aplicar.")
+                elif tipo != "Todos" and numero and not any(
+                    v.Tipo == tipo and v.Numero == numero
+                    for hora in horarios_funcionamento(dia) if hora_de <= hora <= hora_ate
+                    for v in gerar_estrutura_horario(dia, hora)
+                ):
+                    st.warning(f"Não existe {tipo} {numero} nesse dia e período.")
+                else:
+                    cancelados = aplicar_fechamento(
+                        dia.strftime("%d/%m/%Y"), hora_de, hora_ate,
+                        None if tipo == "Todos" else tipo,
+                        numero if tipo != "Todos" and numero else None,
+                        motivo, st.session_state.user['email']
+                    )
+                    get_ocupacao_ao_vivo().invalidar(dia.strftime("%d/%m/%Y"))
+                    st.success(f"Fechamento aplicado: {len(cancelados)} reserva(s) cancelada(s).")
+                    if not cancelados.empty:
+                        st.dataframe(cancelados.drop(columns=["UserId"]), hide_index=True, use_container_width=True)
+
+        proximos = listar_bloqueios(date.today(), date.today() + timedelta(days=60))
+        if not proximos.empty:
+            st.markdown("**Próximos fechamentos**")
+            for b in proximos.itertuples(index=False):
+                alvo = "Todos" if pd.isna(b.tipo) else b.tipo + ("" if pd.isna(b.numero) else f" {int(b.numero)}")
+                c_txt, c_btn = st.columns([4, 1])
+                c_txt.write(f"📅 **{b.dia:%d/%m/%Y}** {b.hora_inicio}–{b.hora_fim} | {alvo}" + (f" — {b.motivo}" if b.motivo else ""))
+                c_btn.button("Reabrir", key=f"reabrir_{b.id}", use_container_width=True, on_click=remover_fechamento, args=(b.id,))
+
+# --- HORÁRIOS E CAPACIDADE (modelos_horario, ver capacidade.py) ---
+@st.fragment
+def bloco_modelos_horario():
+    with st.container(border=True):
+        st.markdown("### 🗓️ Horários e Capacidade")
+        st.caption(
+            "Uma linha por faixa de horário. Layout: `Treino:10,Esteira:2,Elíptico:1` (vazio = fechado). "
+            "Linhas com **Data** substituem o dia da semana naquela data (ex.: feriado). Horário sem linha = fechado."
+        )
+
+        df = pd.DataFrame(modelos_horario_linhas(), columns=["dia_semana", "dia", "hora_inicio", "hora_fim", "layout"])
+        df['dia_semana'] = df['dia_semana'].map(DIAS_SEMANA)
+        df['dia'] = pd.to_datetime(df['dia'])
+        editado = st.data_editor(
+            df, num_rows="dynamic", hide_index=True, use_container_width=True, key="editor_modelos_horario",
+            column_config={
+                "dia_semana": st.column_config.SelectboxColumn("Dia da Semana", options=list(DIAS_SEMANA.values())),
+                "dia": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                "hora_inicio": st.column_config.SelectboxColumn("De", options=HORAS_DO_DIA, required=True),
+                "hora_fim": st.column_config.SelectboxColumn("Até", options=HORAS_DO_DIA, required=True),
+                "layout": st.column_config.TextColumn("Layout"),
+            }
+        )
+
+        if st.button("Salvar Horários", type="primary", use_container_width=True):
+            numero_dia = {nome: num for num, nome in DIAS_SEMANA.items()}
+            linhas = [
+                {
+                    "dia_semana": None if pd.notna(r.dia) else numero_dia.get(r.dia_semana), # Data vence o dia da semana
+                    "dia": None if pd.isna(r.dia) else pd.Timestamp(r.dia).date(),
+                    "hora_inicio": r.hora_inicio, "hora_fim": r.hora_fim,
+                    "layout": "" if pd.isna(r.layout) else str(r.layout).strip(),
+                }
+                for r in editado.itertuples(index=False)
+            ]
+            try:
+                salvar_modelos_horario(linhas)
+                st.success("Horários atualizados. A grade de vagas já usa os novos valores.")
+            except ValueError as e:
+                st.error(f"Não salvo: {e}")
+
 # --- APLICAÇÃO PRINCIPAL ---
 def main_app():
     # --- HEADER & LOGOUT ---
@@ -138,6 +530,7 @@ def main_app():
                 st.write("🏋️‍♀️") 
         with col2:
             st.title(f"Olá, {formatar_nome_curto(st.session_state.user['nome'])}! 👋")
+            seletor_unidade("Unidade", "unidade_topo")
     with col_l:
         st.write("") 
         if st.button("Sair", type="secondary", use_container_width=True):
@@ -157,248 +550,20 @@ def main_app():
     
     tabs = st.tabs(lista_abas)
 
-    # Distribui as abas em variáveis
-    tab_agenda = tabs[0]
-    tab_avaliacao = tabs[1]
-    tab_painel = tabs[2]
+    # Cada aba é um fragmento: interações dentro dela (Reservar, Liberar,
+    # Enviar Avaliação...) reexecutam só a própria aba, sem refazer o
+    # cabeçalho nem as consultas das outras abas.
+    with tabs[0]:
+        aba_agendamento()
+    with tabs[1]:
+        aba_avaliacao()
+    with tabs[2]:
+        aba_painel()
     
-    # Se tiver a 4ª aba, pega ela, senão define como None
-    tab_admin = tabs[3] if len(tabs) > 3 else None
-
-    # ---------------------------------------------------------
-    # ABA 1: AGENDAMENTO
-    # ---------------------------------------------------------
-    with tab_agenda:
-        c1, c2 = st.columns(2)
-        with c1:
-            data_sel = st.date_input("Data:", date.today(), format="DD/MM/YYYY")
-            data_str = data_sel.strftime("%d/%m/%Y")
-        
-        dia_semana = data_sel.weekday() # 5 = Sábado, 6 = Domingo
-        
-        if dia_semana == 6:
-            st.error("🚫 A academia não abre aos Domingos.")
-        else:
-            if dia_semana == 5:
-                horarios = [f"{h:02d}:00" for h in range(8, 13)] 
-                aviso_sabado = " (Sábado: 08h às 12h)"
-            else:
-                horarios = [f"{h:02d}:00" for h in range(6, 21)]
-                aviso_sabado = ""
-
-            with c2:
-                hora_sel = st.selectbox(f"Horário{aviso_sabado}:", horarios)
-
-            DIAS_PT = {0: "Segunda-feira", 1: "Terça-feira", 2: "Quarta-feira", 3: "Quinta-feira", 4: "Sexta-feira", 5: "Sábado", 6: "Domingo"}
-            nome_dia = DIAS_PT[dia_semana]
-            
-            st.markdown(f"""
-                <div style="background-color: #e8f4f8; padding: 15px; border-radius: 10px; text-align: center; margin: 20px 0; border: 1px solid #b8daff; color: #004085;">
-                    <span style="font-size: 20px;">📅 <b>{nome_dia}, {data_str}</b></span>
-                    &nbsp;|&nbsp;
-                    <span style="font-size: 20px;">⏰ <b>{hora_sel}</b></span>
-                </div>
-            """, unsafe_allow_html=True)
-
-            df_dia = carregar_dados_dia(data_str)
-            agendamentos_horario = df_dia[df_dia['Horario'] == hora_sel] if not df_dia.empty else pd.DataFrame()
-
-            st.divider()
-            todas_vagas = gerar_estrutura_horario(hora_sel)
-            
-            grupos = {
-                "🏋️‍♂️ Musculação": [v for v in todas_vagas if v['Tipo'] == 'Treino'],
-                "🏃 Esteiras": [v for v in todas_vagas if v['Tipo'] == 'Esteira'],
-                "🚴 Elípticos": [v for v in todas_vagas if v['Tipo'] == 'Elíptico']
-            }
-
-            for titulo, vagas in grupos.items():
-                if vagas:
-                    st.markdown(f"### {titulo}")
-                    cols = st.columns(4)
-                    for idx, vaga in enumerate(vagas):
-                        num, tipo = vaga['Numero'], vaga['Tipo']
-                        ocupante_nome_full = None
-                        
-                        if not agendamentos_horario.empty:
-                            filtro = agendamentos_horario[(agendamentos_horario['Numero'] == num) & (agendamentos_horario['Tipo'] == tipo)]
-                            if not filtro.empty: 
-                                ocupante_nome_full = filtro.iloc[0]['Nome']
-                        
-                        with cols[idx % 4]:
-                            if ocupante_nome_full:
-                                nome_exibicao = formatar_nome_curto(ocupante_nome_full)
-                                st.warning(f"🔒 {num} - {nome_exibicao}")
-                                
-                                if ocupante_nome_full == st.session_state.user['nome']:
-                                    if st.button("Liberar", key=f"lib_{tipo}_{num}"):
-                                        remover_agendamento_por_pin(data_str, hora_sel, num, tipo, "", is_admin=True)
-                                        st.rerun()
-                            else:
-                                st.success(f"✅ {num} - Livre")
-                                if st.button("Reservar", key=f"res_{tipo}_{num}", type="primary", use_container_width=True):
-                                    salvar_agendamento(data_str, hora_sel, num, tipo, st.session_state.user['nome'], "LOGGED_USER")
-                                    st.success("Agendado!")
-                                    st.rerun()
-                    st.markdown("---")
-
-    # ---------------------------------------------------------
-    # ABA 2: AVALIAÇÃO
-    # ---------------------------------------------------------
-    with tab_avaliacao:
-        if st.session_state.user['tipo'] == 'admin':
-            st.info("Administradores não realizam avaliações de treino.")
-        else:
-            st.subheader("⭐ Avalie seu Treino")
-            st.caption("Ajude a Naalli a melhorar. Avalie as aulas que você já concluiu.")
-            
-            aulas_pendentes = get_aulas_pendentes_avaliacao(st.session_state.user['nome'])
-            
-            if aulas_pendentes:
-                opcoes = {f"{a['Data']} - {a['Horario']} | {a['Tipo']}": a for a in aulas_pendentes}
-                escolha = st.selectbox("Selecione a aula para avaliar:", list(opcoes.keys()), key="sel_aval")
-                dados_aula = opcoes[escolha]
-                
-                with st.form("form_avaliacao"):
-                    c_stars, c_text = st.columns([1, 2])
-                    with c_stars:
-                        st.write("Sua nota:")
-                        stars = st.feedback("stars")
-                    with c_text:
-                        comentario = st.text_area("Comentário (Opcional):", placeholder="O que achou do treino?")
-                    
-                    submit_aval = st.form_submit_button("Enviar Avaliação", type="primary")
-                    
-                    if submit_aval:
-                        if stars is not None:
-                            salvar_avaliacao_aluno(dados_aula['doc_id'], st.session_state.user['nome'], dados_aula['Data'], dados_aula['Tipo'], stars+1, comentario)
-                            st.success("Obrigado pelo feedback!")
-                            st.rerun()
-                        else:
-                            st.warning("Por favor, selecione as estrelas.")
-            else:
-                st.info("🎉 Você não tem avaliações pendentes no momento.")
-
-    # ---------------------------------------------------------
-    # ABA 3: MEU PAINEL
-    # ---------------------------------------------------------
-    with tab_painel:
-        if st.session_state.user['tipo'] == 'admin':
-            st.info("👉 Use a aba 'Admin' para ver os dados gerais da academia.")
-        else:
-            st.subheader("📊 Seu Painel de Atleta")
-            
-            df_full = carregar_tudo_formatado()
-            nome_user = st.session_state.user['nome']
-            
-            if not df_full.empty:
-                df_aluno = df_full[df_full['Nome'] == nome_user].sort_values('Data_dt', ascending=False)
-                
-                if not df_aluno.empty:
-                    total_vida = len(df_aluno)
-                    primeira_vez = df_aluno['Data_dt'].min().strftime('%d/%m/%Y')
-                    ultima_vez_dt = df_aluno['Data_dt'].max()
-                    ultima_vez = ultima_vez_dt.strftime('%d/%m/%Y')
-                    
-                    dias_sem_vir = (datetime.now() - ultima_vez_dt).days
-                    if dias_sem_vir <= 7:
-                        status_txt = "🟢 Ativo"
-                        status_msg = "Você está mandando bem!"
-                    elif dias_sem_vir <= 30:
-                        status_txt = "🟡 Atenção"
-                        status_msg = f"Faz {dias_sem_vir} dias que não te vemos."
-                    else:
-                        status_txt = "🔴 Inativo"
-                        status_msg = "Vamos voltar a treinar?"
-
-                    with st.container(border=True):
-                        c_head1, c_head2 = st.columns([3, 1])
-                        c_head1.markdown(f"### Status: {status_txt}")
-                        c_head1.caption(status_msg)
-                        
-                        m1, m2, m3, m4 = st.columns(4)
-                        m1.metric("Total Check-ins", total_vida)
-                        m2.metric("Último Treino", ultima_vez)
-                        m3.metric("Primeiro Treino", primeira_vez)
-                        
-                        semanas_ativo = ((df_aluno['Data_dt'].max() - df_aluno['Data_dt'].min()).days / 7) or 1
-                        media_semanal = round(total_vida / semanas_ativo, 1)
-                        m4.metric("Média / Semana", media_semanal)
-                        
-                        st.divider()
-                        
-                        col_chart1, col_chart2 = st.columns(2)
-                        with col_chart1:
-                            st.markdown("**Sua Modalidade Favorita**")
-                            if not df_aluno.empty:
-                                fig_pizza = px.pie(df_aluno, names='Tipo', hole=0.5, height=250)
-                                fig_pizza.update_layout(margin=dict(t=0, b=0, l=0, r=0), showlegend=False)
-                                st.plotly_chart(fig_pizza, use_container_width=True)
-                                
-                        with col_chart2:
-                            st.markdown("**Seus Últimos Treinos**")
-                            st.dataframe(
-                                df_aluno[['Data', 'Horario', 'Tipo']].head(5), 
-                                hide_index=True, 
-                                use_container_width=True
-                            )
-                else:
-                    st.info("Agende seu primeiro treino para ver suas estatísticas aqui!")
-            else:
-                st.info("Nenhum dado encontrado.")
-
-# ---------------------------------------------------------
-    # ABA 4: ADMIN (Layout Vertical Melhorado)
-    # ---------------------------------------------------------
-    if tab_admin:
-        with tab_admin:
-            st.subheader("🔐 Área de Gestão")
-            st.caption("Selecione uma ação administrativa abaixo.")
-            st.write("<br>", unsafe_allow_html=True) # Um pouco de espaço
-
-            # --- BLOCO 1: DASHBOARD GERAL ---
-            with st.container(border=True):
-                # Cria colunas dentro do container para alinhar texto e botão
-                c_txt, c_btn = st.columns([3, 1])
-                with c_txt:
-                    st.markdown("### 📊 Dashboard e KPIs")
-                    st.write("Visualize gráficos de frequência, horários de pico e métricas gerais da academia.")
-                with c_btn:
-                    # Centraliza o botão verticalmente usando espaços em branco
-                    st.write("") 
-                    st.write("") 
-                    if st.button("Acessar Painel ➡️", type="primary", use_container_width=True):
-                        st.session_state.view = "admin"
-                        st.rerun()
-
-            st.write("<br>", unsafe_allow_html=True) # Espaço entre os blocos
-
-            # --- BLOCO 2: CADASTRO RÁPIDO ---
-            with st.container(border=True):
-                st.markdown("### 👤 Cadastro Rápido de Aluno")
-                st.caption("Cria um novo usuário com a senha padrão: **mudar123**")
-                
-                with st.form("form_cadastro_rapido", border=False):
-                    # Coloca os campos lado a lado para economizar altura
-                    c_email, c_nome = st.columns(2)
-                    with c_email:
-                        new_email = st.text_input("E-mail do Aluno")
-                    with c_nome:
-                        new_nome = st.text_input("Nome Completo")
-                    
-                    st.write("") # Espacinho antes do botão
-                    submit_cad = st.form_submit_button("Concluir Cadastro", use_container_width=True)
-                    
-                    if submit_cad:
-                        # Verifica se os campos foram preenchidos
-                        if new_email and new_nome:
-                            if criar_usuario(new_email, new_nome, "mudar123"):
-                                # st.toast é uma notificação mais elegante que some sozinha
-                                st.toast(f"✅ Usuário **{new_nome}** criado com sucesso!", icon="🎉") 
-                            else:
-                                st.error("Erro: Este e-mail já está cadastrado no sistema.")
-                        else:
-                            st.warning("Preencha o e-mail e o nome.")
+    # Se tiver a 4ª aba (Admin), renderiza ela
+    if len(tabs) > 3:
+        with tabs[3]:
+            aba_admin()
 
 # --- ROTEADOR ---
 if st.session_state.view == "login":
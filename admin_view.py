@@ -1,11 +1,24 @@
 import os
+import tempfile
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta
 import plotly.express as px
 import google.generativeai as genai  # <--- IMPORTANTE: Adicionado para configuração
 from langchain_google_genai import ChatGoogleGenerativeAI
-from utils import carregar_tudo_formatado, carregar_avaliacoes_formatado, SENHA_ADMIN
+from utils import (
+    carregar_tudo_formatado, resumo_avaliacoes, carregar_comentarios, LIMITE_COMENTARIOS, SENHA_ADMIN,
+    get_engajamento_aluno, get_frequencia_aluno, frequencia_periodo, registrar_checkin, buscar_alunos, texto_busca, listar_alunos_em_risco,
+    carregar_historico_aluno, contar_modalidades_aluno, get_armazenamento, get_grade,
+    prever_demanda, termos_reclamacoes, sentimento_por_modalidade,
+    avaliacoes_por_periodo, agrupamento_avaliacoes, AGRUPAMENTOS_AVALIACAO,
+    unidade_atual, seletor_unidade
+)
+from armazenamento import rotulo_unidade, UNIDADES
+from utilizacao import CuboUtilizacao, rotulos_dias
+from exportar import exportar
+from particoes import carregar_arquivo_morto
+from agendador import saude_tarefas, historico_tarefas
 
 # --- FUNÇÃO HELPER PARA PEGAR SEGREDOS ---
 def get_secret(key):
@@ -33,6 +46,143 @@ if api_key:
     except Exception as e:
         print(f"Erro ao configurar IA: {e}")
 
+# --- BUSCA DE ALUNOS (NO BANCO, ENQUANTO DIGITA) ---
+def _buscar_aluno(rotulo, chave):
+    """
+    Campo de busca que consulta o banco a cada pausa na digitação (top N) e
+    lista os encontrados. Retorna (user_id, rótulo) do escolhido ou (None, None).
+    """
+    termo = st.text_input(rotulo, key=chave, type="search", live=True, placeholder="Digite parte do nome ou e-mail...")
+    df = buscar_alunos(termo)
+    if df.empty:
+        if len(texto_busca(termo or "")) >= 2:
+            st.caption("Nenhum aluno encontrado.")
+        return None, None
+    rotulos = {int(r.id): f"{r.nome} ({r.email})" for r in df.itertuples()}
+    escolhido = st.selectbox(
+        f"{len(rotulos)} encontrado(s):", list(rotulos), index=None, key=f"{chave}_escolha",
+        format_func=rotulos.get, placeholder="Selecione o aluno..."
+    )
+    return escolhido, rotulos.get(escolhido)
+
+@st.fragment
+def _raio_x():
+    # Fragmento: digitar na busca só refaz este bloco, não o painel inteiro
+    st.markdown("##### 🔎 Raio-X Completo")
+    aluno_sel, rotulo = _buscar_aluno("Buscar aluno para ver a ficha:", "busca_raio_x")
+    if aluno_sel is None:
+        return
+
+    # Ficha lida de engajamento_aluno + consultas por aluno (índice por user_id)
+    eng = get_engajamento_aluno(aluno_sel)
+    if not eng:
+        st.info("Este aluno ainda não tem treinos registrados.")
+        return
+    with st.container(border=True):
+        c_h1, c_h2 = st.columns([3, 1])
+        c_h1.markdown(f"## 👤 {rotulo}")
+        c_h2.markdown(f"### :{eng['cor']}[{eng['status']}]")
+        st.divider()
+        freq = get_frequencia_aluno(aluno_sel)
+        m1, m2, m3, m4, m5 = st.columns(5)
+        m1.metric("Check-ins", freq['checkins'])
+        m2.metric("Último", freq['ultimo_checkin'].strftime('%d/%m/%Y') if freq['ultimo_checkin'] else "-")
+        m3.metric("Início", eng['primeira_visita'].strftime('%d/%m/%Y'))
+        m4.metric("Média/Semana", eng['media_semanal'])
+        m5.metric("Faltas", f"{freq['taxa_faltas']:.0%}" if freq['taxa_faltas'] is not None else "-",
+                  help=f"{freq['faltas']} de {freq['reservas']} reservas sem check-in")
+        st.divider()
+        c_pizza, c_hist = st.columns([1, 1])
+        with c_pizza:
+            st.caption("Preferência")
+            df_modalidades = contar_modalidades_aluno(aluno_sel)
+            if not df_modalidades.empty:
+                fig_pizza = px.pie(df_modalidades, names='Tipo', values='Qtd', hole=0.4, height=250)
+                fig_pizza.update_layout(margin=dict(t=0, b=0, l=0, r=0), showlegend=False)
+                st.plotly_chart(fig_pizza, use_container_width=True)
+        with c_hist:
+            st.caption("Histórico Recente")
+            st.dataframe(carregar_historico_aluno(aluno_sel, limite=5), hide_index=True, use_container_width=True)
+
+@st.fragment
+def _checkin_recepcao():
+    # Só enfileira: a gravação sai em lote (checkin.py), sem commit por aluno
+    aluno_sel, rotulo = _buscar_aluno("Aluno na porta:", "busca_checkin")
+    if aluno_sel is not None and st.button("✅ Confirmar check-in", key="confirmar_checkin"):
+        if registrar_checkin(aluno_sel) is None:
+            st.error("Aluno não encontrado.")
+        else:
+            st.success(f"Check-in de {rotulo} registrado.")
+
+def _tarefas():
+    # Lido do histórico do worker (agendador.py); nada roda aqui
+    if get_armazenamento().nome != "postgres":
+        st.info("O agendador de tarefas (python agendador.py) roda só com o Postgres.")
+        return
+    df_saude = saude_tarefas(unidade_atual())
+    falhas = df_saude['Estado'].str.startswith(("🔴", "🟠")).sum()
+    if falhas:
+        st.error(f"{falhas} tarefa(s) com falha ou atrasada(s). O worker (python agendador.py) está rodando?")
+    else:
+        st.success("Todas as tarefas em dia.")
+    st.dataframe(
+        df_saude, hide_index=True, use_container_width=True,
+        column_config={
+            "Ultima": st.column_config.DatetimeColumn("Última", format="DD/MM HH:mm"),
+            "Proxima": st.column_config.DatetimeColumn("Próxima", format="DD/MM HH:mm"),
+            "DuracaoS": st.column_config.NumberColumn("Duração (s)", format="%.1f"),
+            "Falhas7d": st.column_config.NumberColumn("Falhas (7 dias)"),
+            "Situacao": "Situação",
+        }
+    )
+    st.markdown("##### Últimas execuções")
+    st.dataframe(
+        historico_tarefas(unidade_atual()), hide_index=True, use_container_width=True,
+        column_config={
+            "AgendadaPara": st.column_config.DatetimeColumn("Horário", format="DD/MM HH:mm"),
+            "Inicio": st.column_config.DatetimeColumn("Início", format="DD/MM HH:mm:ss"),
+            "DuracaoS": st.column_config.NumberColumn("Duração (s)", format="%.1f"),
+            "Situacao": "Situação",
+        }
+    )
+
+@st.fragment
+def _comentarios(inicio, fim):
+    st.markdown("##### Notas e Comentários")
+    filtro_aluno, _ = _buscar_aluno("Filtrar por Aluno:", "busca_comentarios")
+
+    # Do banco: os do aluno escolhido (todo o histórico) ou os do período, até o limite
+    if filtro_aluno is not None:
+        df_coments = carregar_comentarios(user_id=filtro_aluno)
+    else:
+        df_coments = carregar_comentarios(inicio, fim)
+        st.caption(f"Avaliados no período, {LIMITE_COMENTARIOS} mais recentes no máximo.")
+
+    # --- CORREÇÃO DA ORDEM DA DATA ---
+    # 1. Cria uma coluna de DATA REAL (datetime object) baseada no texto DD/MM/YYYY
+    df_coments['DataAula_dt'] = pd.to_datetime(df_coments['DataAula'], dayfirst=True, errors='coerce')
+
+    # 2. Ordena pela data real (Do mais recente para o mais antigo)
+    df_coments = df_coments.sort_values('DataAula_dt', ascending=False)
+
+    if not df_coments.empty:
+        st.dataframe(
+            # ATENÇÃO: Passamos 'DataAula_dt' (data real) em vez de 'DataAula' (texto)
+            df_coments[['DataAula_dt', 'NomeAluno', 'Nota', 'Comentario', 'Modalidade']],
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                # Configura a coluna de data para exibir bonito (DD/MM/YYYY), mas ordenar matematicamente
+                "DataAula_dt": st.column_config.DateColumn("Data Treino", format="DD/MM/YYYY"),
+                "Nota": st.column_config.NumberColumn("Nota", format="%d ⭐"),
+                "NomeAluno": st.column_config.TextColumn("Aluno")
+            }
+        )
+    elif filtro_aluno is not None:
+        st.warning("Este aluno não deixou comentários de texto.")
+    else:
+        st.info("Nenhum comentário de texto registrado.")
+
 # --- PÁGINA ADMIN ---
 def render_admin_page():
     # --- BOTÃO DE VOLTAR ---
@@ -40,7 +190,8 @@ def render_admin_page():
         st.session_state.view = "main"
         st.rerun()
 
-    st.title("Painel Administrativo Geral")
+    # Tudo abaixo é da unidade escolhida (seletor na sidebar)
+    st.title("Painel Administrativo Geral" + (f" — {rotulo_unidade(unidade_atual())}" if len(UNIDADES) > 1 else ""))
     
     # --- AUTO-UNLOCK ---
     if st.session_state.user and st.session_state.user.get('tipo') == 'admin':
@@ -60,12 +211,12 @@ def render_admin_page():
         return
 
     # --- CARREGAMENTO DE DADOS ---
-    df_full = carregar_tudo_formatado()
-    df_aval = carregar_avaliacoes_formatado()
+    # Agendamentos são carregados abaixo, só para o período escolhido
     
     # --- SIDEBAR DE FILTROS ---
     with st.sidebar:
         st.header("🔍 Filtros Avançados")
+        seletor_unidade("Unidade:", "unidade_admin")
         
         periodo = st.radio("Período (Gráficos Gerais):", ["Esta Semana", "Este Mês", "Últimos 3 Meses", "Todo o Histórico", "Personalizado"])
         hoje = date.today()
@@ -85,16 +236,46 @@ def render_admin_page():
             inicio = c1.date_input("Início", hoje - timedelta(days=7), format="DD/MM/YYYY")
             fim = c2.date_input("Fim", hoje, format="DD/MM/YYYY")
         else:
-            if not df_full.empty:
-                inicio = df_full['Data_dt'].min().date()
-                fim = df_full['Data_dt'].max().date()
+            inicio, fim = None, None
+        
+        # Só os meses do período saem do banco (partições mensais).
+        # "Todo o Histórico" junta o banco com o arquivo morto em Parquet.
+        if periodo == "Todo o Histórico":
+            df_periodo = carregar_tudo_formatado()
+            df_arquivo = carregar_arquivo_morto(unidade=unidade_atual())
+            if not df_arquivo.empty:
+                df_periodo = pd.concat([df_arquivo, df_periodo], ignore_index=True) if not df_periodo.empty else df_arquivo
+            if not df_periodo.empty:
+                inicio = df_periodo['Data_dt'].min().date()
+                fim = df_periodo['Data_dt'].max().date()
             else:
                 inicio, fim = hoje, hoje
+        else:
+            df_periodo = carregar_tudo_formatado(inicio, fim)
         
         st.divider()
-        todos_tipos = df_full['Tipo'].unique().tolist() if not df_full.empty else []
+        todos_tipos = df_periodo['Tipo'].unique().tolist() if not df_periodo.empty else []
         tipos_sel = st.multiselect("Filtrar Modalidades:", todos_tipos, default=todos_tipos)
 
+        # Exportação usa o mesmo período e modalidades dos filtros acima
+        # (lê em streaming do Postgres; no modo SQLite embutido não aparece)
+        if get_armazenamento().nome == "postgres":
+            st.divider()
+            st.markdown("**📦 Exportar Dados**")
+            tabela_exp = st.selectbox("Tabela:", ["agendamentos", "avaliacoes"], format_func=lambda t: "Agendamentos" if t == "agendamentos" else "Avaliações")
+            formato_exp = st.radio("Formato:", ["parquet", "csv"], horizontal=True, format_func=str.upper)
+            if st.button("Gerar Arquivo"):
+                caminho = os.path.join(tempfile.gettempdir(), f"naalli_{unidade_atual()}_{tabela_exp}_{inicio:%Y%m%d}_{fim:%Y%m%d}.{formato_exp}")
+                with st.spinner("Exportando..."):
+                    linhas = exportar(tabela_exp, caminho, formato_exp, inicio, fim, tipos_sel, unidade=unidade_atual())
+                st.session_state.arquivo_exportado = (caminho, linhas)
+            
+            if st.session_state.get("arquivo_exportado"):
+                caminho, linhas = st.session_state.arquivo_exportado
+                if os.path.exists(caminho):
+                    with open(caminho, "rb") as f:
+                        st.download_button(f"⬇️ Baixar ({linhas} linhas)", f, file_name=os.path.basename(caminho))
+
         st.divider()
         # Status da IA (Simplificado)
         if IA_ATIVADA:
@@ -103,6 +284,12 @@ def render_admin_page():
             st.warning("⚠️ IA Desconectada")
             # Opcional: Permitir inserir chave manualmente se não achou no ambiente
             # api_key_manual = st.text_input("API Key (Opcional)", type="password")
+
+        # Pool de conexões (diagnóstico do Neon suspenso / quedas)
+        metricas_banco = get_armazenamento().metricas()
+        if metricas_banco:
+            with st.expander("🔌 Conexões do Banco"):
+                st.json(metricas_banco)
         
         st.divider()
         if st.button("🔒 Bloquear Painel"):
@@ -119,9 +306,9 @@ def render_admin_page():
     
     ordem_cronologica_dias = []
     
-    if not df_full.empty:
-        mask = (df_full['Data_dt'] >= inicio_ts) & (df_full['Data_dt'] <= fim_ts) & (df_full['Tipo'].isin(tipos_sel))
-        df_filtered = df_full.loc[mask].copy()
+    if not df_periodo.empty:
+        mask = (df_periodo['Data_dt'] >= inicio_ts) & (df_periodo['Data_dt'] <= fim_ts) & (df_periodo['Tipo'].isin(tipos_sel))
+        df_filtered = df_periodo.loc[mask].copy()
         
         df_filtered['Dia_Semana_Int'] = df_filtered['Data_dt'].dt.dayofweek
         df_filtered['Dia_Visual'] = df_filtered['Dia_Semana_Int'].map(DIAS_CURTOS) + ", " + df_filtered['Data_dt'].dt.strftime('%d/%m')
@@ -130,12 +317,12 @@ def render_admin_page():
         ordem_cronologica_dias = df_filtered.sort_values('Data_dt')['Dia_Visual'].unique().tolist()
         df_filtered = df_filtered.sort_values('Data_dt')
     else:
-        df_filtered = pd.DataFrame(columns=df_full.columns)
+        df_filtered = pd.DataFrame(columns=df_periodo.columns)
 
     # =========================================================
     # ORGANIZAÇÃO EM ABAS
     # =========================================================
-    tab_dashboard, tab_qualidade = st.tabs(["📈 Dashboard & IA", "⭐ Qualidade & Feedback"])
+    tab_dashboard, tab_qualidade, tab_tarefas = st.tabs(["📈 Dashboard & IA", "⭐ Qualidade & Feedback", "🩺 Tarefas"])
 
     # ---------------------------------------------------------
     # ABA 1: DASHBOARD GERAL
@@ -143,7 +330,7 @@ def render_admin_page():
     with tab_dashboard:
         st.subheader(f"Visão Geral ({inicio.strftime('%d/%m')} a {fim.strftime('%d/%m')})")
         
-        k1, k2, k3 = st.columns(3)
+        k1, k2, k3, k4 = st.columns(4)
         total_agendamentos = len(df_filtered)
         if not df_filtered.empty:
             alunos_unicos = df_filtered['Nome'].nunique()
@@ -154,6 +341,9 @@ def render_admin_page():
         k1.metric("Total de Agendamentos", total_agendamentos)
         k2.metric("Alunos Ativos", alunos_unicos)
         k3.metric("Horário de Pico", horario_pico)
+        freq = frequencia_periodo(inicio, fim, tipos_sel)
+        k4.metric("Taxa de Faltas", f"{freq['taxa_faltas']:.0%}" if freq['taxa_faltas'] is not None else "-",
+                  help=f"{freq['faltas']} de {freq['reservas']} reservas passadas sem check-in; {freq['checkins']} check-in(s) no período")
 
         st.divider()
 
@@ -190,19 +380,105 @@ def render_admin_page():
             else:
                 st.info("Sem dados.")
 
+        # Utilização = reservas / capacidade da grade (utilizacao.py), só das modalidades filtradas
+        cubo = CuboUtilizacao(df_filtered, inicio, fim, get_grade(), tipos_sel)
+
         with col_g4:
-            st.markdown("##### 🔥 Mapa de Calor")
+            st.markdown("##### 🔥 Mapa de Calor (% da capacidade)")
             if not df_filtered.empty:
-                df_heat = df_filtered.groupby(['Dia_Visual', 'Horario']).size().reset_index(name='Ocupacao')
-                fig_heat = px.density_heatmap(df_heat, x='Horario', y='Dia_Visual', z='Ocupacao', color_continuous_scale='Viridis')
-                fig_heat.update_yaxes(categoryorder='array', categoryarray=ordem_cronologica_dias)
-                fig_heat.update_xaxes(categoryorder='category ascending')
+                df_util = cubo.por_dia_hora().dropna(how="all") * 100
+                df_util.index = rotulos_dias(df_util.index)
+                fig_heat = px.imshow(
+                    df_util, aspect="auto", color_continuous_scale='Viridis', zmin=0, zmax=100,
+                    labels={'x': 'Horário', 'y': 'Dia', 'color': 'Utilização %'}
+                )
                 st.plotly_chart(fig_heat, use_container_width=True)
             else:
                 st.info("Sem dados.")
 
         st.divider()
 
+        # UTILIZAÇÃO DA CAPACIDADE
+        st.subheader("📐 Utilização da Capacidade")
+        if not df_filtered.empty and cubo.geral() is not None:
+            c_u1, c_u2 = st.columns([1, 2])
+            with c_u1:
+                st.metric("Utilização no período", f"{cubo.geral():.0%}")
+                limiar_cheio = st.slider("Lotado a partir de (%)", 50, 100, 100, step=5) / 100
+                limiar_ocioso = st.slider("Ocioso abaixo de (%)", 5, 80, 30, step=5) / 100
+            with c_u2:
+                st.markdown("##### Média por Dia da Semana x Horário")
+                fig_sem = px.imshow(
+                    cubo.por_semana_hora() * 100, aspect="auto", color_continuous_scale='RdYlGn_r', zmin=0, zmax=100,
+                    text_auto=".0f", labels={'x': 'Horário', 'y': 'Dia', 'color': 'Utilização %'}
+                )
+                st.plotly_chart(fig_sem, use_container_width=True)
+
+            c_cheio, c_ocioso = st.columns(2)
+            with c_cheio:
+                df_cheios = cubo.saturados(limiar_cheio)
+                st.markdown(f"##### 🔴 Horários Lotados ({len(df_cheios)})")
+                st.dataframe(
+                    df_cheios.head(200), hide_index=True, use_container_width=True,
+                    column_config={
+                        "Data": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                        "Utilizacao": st.column_config.ProgressColumn("Utilização", format="percent", min_value=0, max_value=1),
+                    }
+                )
+            with c_ocioso:
+                df_ociosos = cubo.ociosos(limiar_ocioso)
+                st.markdown(f"##### 🟢 Horários Ociosos ({len(df_ociosos)})")
+                st.dataframe(
+                    df_ociosos, hide_index=True, use_container_width=True,
+                    column_config={
+                        "Utilizacao": st.column_config.ProgressColumn("Utilização Média", format="percent", min_value=0, max_value=1),
+                    }
+                )
+        else:
+            st.info("Sem dados.")
+
+        st.divider()
+
+        # PREVISÃO (previsao.py): sazonalidade das últimas semanas, refeita só com reservas novas
+        st.subheader("🔮 Previsão para os Próximos 7 Dias")
+        df_prev = prever_demanda()
+        # Só esconde as modalidades desmarcadas: a previsão não depende do período escolhido
+        df_prev = df_prev[~df_prev['Tipo'].isin(set(todos_tipos) - set(tipos_sel))]
+        if not df_prev.empty:
+            c_p1, c_p2 = st.columns([2, 1])
+            with c_p1:
+                st.markdown("##### Utilização Prevista (Dia x Horário)")
+                soma_prev = df_prev.groupby(['Data', 'Horario'])[['Previsto', 'Capacidade']].sum()
+                mapa_prev = (soma_prev['Previsto'] / soma_prev['Capacidade'] * 100).unstack()
+                mapa_prev.index = rotulos_dias(mapa_prev.index)
+                fig_prev = px.imshow(
+                    mapa_prev, aspect="auto", color_continuous_scale='RdYlGn_r', zmin=0, zmax=100,
+                    text_auto=".0f", labels={'x': 'Horário', 'y': 'Dia', 'color': 'Prevista %'}
+                )
+                st.plotly_chart(fig_prev, use_container_width=True)
+            with c_p2:
+                df_lotar = df_prev[df_prev['Lotacao'] != ""].sort_values(['Utilizacao', 'Data'], ascending=[False, True])
+                st.markdown(f"##### ⚠️ Devem Lotar ({len(df_lotar)})")
+                st.caption("Previsto = média recente do mesmo dia da semana; Mín-Máx = intervalo de 80%.")
+                st.dataframe(
+                    df_lotar[['Lotacao', 'Data', 'Horario', 'Tipo', 'Previsto', 'Minimo', 'Maximo', 'Capacidade']],
+                    hide_index=True, use_container_width=True,
+                    column_config={
+                        "Lotacao": st.column_config.TextColumn(""),
+                        "Data": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                        "Minimo": st.column_config.NumberColumn("Mín"),
+                        "Maximo": st.column_config.NumberColumn("Máx"),
+                    }
+                )
+        else:
+            st.info("Sem horários abertos nos próximos dias.")
+
+        st.divider()
+
+        # CHECK-IN NA PORTA
+        with st.expander("📷 Check-in na Recepção"):
+            _checkin_recepcao()
+
         # RANKING E RAIO-X
         st.subheader("🏆 Desempenho e Ficha do Aluno")
         c_rank, c_busca = st.columns([1, 2])
@@ -219,45 +495,22 @@ def render_admin_page():
                 st.info("Sem dados.")
 
         with c_busca:
-            st.markdown("##### 🔎 Raio-X Completo")
-            if not df_full.empty:
-                lista_alunos = sorted(df_full['Nome'].unique().tolist())
-                aluno_sel = st.selectbox("Selecione o Aluno para ver a ficha:", ["Selecione..."] + lista_alunos)
-                
-                if aluno_sel != "Selecione...":
-                    df_aluno = df_full[df_full['Nome'] == aluno_sel].sort_values('Data_dt', ascending=False)
-                    if not df_aluno.empty:
-                        total_vida = len(df_aluno)
-                        primeira_vez = df_aluno['Data_dt'].min().strftime('%d/%m/%Y')
-                        ultima_vez_dt = df_aluno['Data_dt'].max()
-                        ultima_vez = ultima_vez_dt.strftime('%d/%m/%Y')
-                        
-                        dias_sem_vir = (datetime.now() - ultima_vez_dt).days
-                        if dias_sem_vir <= 7: status, cor = "🟢 Ativo", "green"
-                        elif dias_sem_vir <= 30: status, cor = "🟡 Atenção", "orange"
-                        else: status, cor = "🔴 Inativo", "red"
-
-                        with st.container(border=True):
-                            c_h1, c_h2 = st.columns([3, 1])
-                            c_h1.markdown(f"## 👤 {aluno_sel}")
-                            c_h2.markdown(f"### :{cor}[{status}]")
-                            st.divider()
-                            m1, m2, m3, m4 = st.columns(4)
-                            m1.metric("Total", total_vida)
-                            m2.metric("Último", ultima_vez)
-                            m3.metric("Início", primeira_vez)
-                            semanas = ((df_aluno['Data_dt'].max() - df_aluno['Data_dt'].min()).days / 7) or 1
-                            m4.metric("Média/Semana", round(total_vida/semanas, 1))
-                            st.divider()
-                            c_pizza, c_hist = st.columns([1, 1])
-                            with c_pizza:
-                                st.caption("Preferência")
-                                fig_pizza = px.pie(df_aluno, names='Tipo', hole=0.4, height=250)
-                                fig_pizza.update_layout(margin=dict(t=0, b=0, l=0, r=0), showlegend=False)
-                                st.plotly_chart(fig_pizza, use_container_width=True)
-                            with c_hist:
-                                st.caption("Histórico Recente")
-                                st.dataframe(df_aluno[['Data', 'Horario', 'Tipo']].head(5), hide_index=True, use_container_width=True)
+            _raio_x()
+
+        # ALUNOS EM RISCO (faixa 🟡: sem vir há 8 a 30 dias)
+        st.markdown("##### 🚨 Alunos em Risco de Evasão")
+        df_risco = listar_alunos_em_risco()
+        if not df_risco.empty:
+            st.dataframe(
+                df_risco, hide_index=True, use_container_width=True,
+                column_config={
+                    "UltimaVisita": st.column_config.DateColumn("Última Visita", format="DD/MM/YYYY"),
+                    "DiasSemVir": st.column_config.NumberColumn("Dias sem vir"),
+                    "Total": st.column_config.NumberColumn("Treinos"),
+                }
+            )
+        else:
+            st.success("Nenhum aluno em risco no momento. 🎉")
 
         st.divider()
 
@@ -308,17 +561,16 @@ def render_admin_page():
     # ---------------------------------------------------------
     with tab_qualidade:
         st.subheader("⭐ Satisfação e Feedback dos Alunos")
+        # Avaliações seguem o período da barra lateral; "Todo o Histórico" não corta pelas datas das reservas
+        inicio_aval, fim_aval = (None, None) if periodo == "Todo o Histórico" else (inicio, fim)
         
-        if not df_aval.empty:
-            # Métricas
-            media_nota = df_aval['Nota'].mean()
-            total_reviews = len(df_aval)
-            promotores = len(df_aval[df_aval['Nota'] == 5])
-            
+        # Métricas e distribuição somadas de 'avaliacoes_diarias' (não dependem do tamanho do histórico)
+        resumo = resumo_avaliacoes(inicio_aval, fim_aval)
+        if resumo['Quantidade']:
             ka1, ka2, ka3 = st.columns(3)
-            ka1.metric("Nota Média Geral (1-5)", f"{media_nota:.1f}")
-            ka2.metric("Total de Avaliações", total_reviews)
-            ka3.metric("Fãs (Nota 5)", promotores)
+            ka1.metric("Nota Média Geral (1-5)", f"{resumo['Media']:.1f}")
+            ka2.metric("Total de Avaliações", resumo['Quantidade'])
+            ka3.metric("Fãs (Nota 5)", resumo['Notas'][5])
             
             st.divider()
             
@@ -326,72 +578,70 @@ def render_admin_page():
             
             with c_bar:
                 st.markdown("##### Distribuição das Notas")
-                count_notas = df_aval['Nota'].value_counts().reset_index()
-                count_notas.columns = ['Nota', 'Qtd']
-                count_notas = count_notas.sort_values('Nota', ascending=False)
+                count_notas = pd.DataFrame({"Nota": list(resumo['Notas']), "Qtd": list(resumo['Notas'].values())})
+                count_notas = count_notas[count_notas['Qtd'] > 0].sort_values('Nota', ascending=False)
                 fig_notas = px.bar(count_notas, x='Nota', y='Qtd', color='Nota', color_discrete_sequence=px.colors.qualitative.Prism)
                 fig_notas.update_layout(xaxis=dict(tickmode='linear', tick0=1, dtick=1))
                 st.plotly_chart(fig_notas, use_container_width=True)
                 
             with c_com:
-                st.markdown("##### Notas e Comentários")
-                
-                # Filtro de Aluno (Multiselect)
-                lista_alunos_aval = sorted(df_aval['NomeAluno'].unique().tolist())
-                filtro_aluno = st.multiselect(
-                    "Filtrar por Aluno:",
-                    options=lista_alunos_aval,
-                    placeholder="Todos (digite para buscar...)"
-                )
-                
-                # Filtragem base
-                df_coments = df_aval[df_aval['Comentario'] != ""].copy()
-                
-                if filtro_aluno:
-                    df_coments = df_coments[df_coments['NomeAluno'].isin(filtro_aluno)]
-                
-                # --- CORREÇÃO DA ORDEM DA DATA ---
-                # 1. Cria uma coluna de DATA REAL (datetime object) baseada no texto DD/MM/YYYY
-                df_coments['DataAula_dt'] = pd.to_datetime(df_coments['DataAula'], dayfirst=True, errors='coerce')
-                
-                # 2. Ordena pela data real (Do mais recente para o mais antigo)
-                df_coments = df_coments.sort_values('DataAula_dt', ascending=False)
-                
-                if not df_coments.empty:
+                _comentarios(inicio_aval, fim_aval)
+
+            # TERMOS DAS RECLAMAÇÕES (índice em comentarios.py, período da barra lateral)
+            st.markdown("##### 🗣️ O que Mais Aparece nas Reclamações")
+            st.caption("Comentários com sentimento negativo ou nota até 2, pela data do treino no período escolhido.")
+            df_sent = sentimento_por_modalidade(inicio_aval, fim_aval)
+            if df_sent.empty:
+                st.info("Nenhum comentário de texto no período.")
+            else:
+                c_sent, c_termos = st.columns([1, 2])
+                with c_sent:
                     st.dataframe(
-                        # ATENÇÃO: Passamos 'DataAula_dt' (data real) em vez de 'DataAula' (texto)
-                        df_coments[['DataAula_dt', 'NomeAluno', 'Nota', 'Comentario', 'Modalidade']], 
-                        hide_index=True, 
-                        use_container_width=True,
+                        df_sent, hide_index=True, use_container_width=True,
                         column_config={
-                            # Configura a coluna de data para exibir bonito (DD/MM/YYYY), mas ordenar matematicamente
-                            "DataAula_dt": st.column_config.DateColumn("Data Treino", format="DD/MM/YYYY"),
-                            "Nota": st.column_config.NumberColumn("Nota", format="%d ⭐"),
-                            "NomeAluno": st.column_config.TextColumn("Aluno")
+                            "Comentarios": st.column_config.NumberColumn("Comentários"),
+                            "Sentimento": st.column_config.NumberColumn("Sentimento (-1 a 1)", format="%.2f"),
+                            "Reclamacoes": st.column_config.ProgressColumn("Reclamações", format="percent", min_value=0, max_value=1),
                         }
                     )
-                else:
-                    if filtro_aluno:
-                        st.warning("Este aluno avaliou, mas não deixou comentários de texto.")
+                with c_termos:
+                    tipos_termos = st.multiselect("Modalidades:", df_sent['Modalidade'].tolist(), placeholder="Todas", key="tipos_termos")
+                    df_termos = termos_reclamacoes(inicio_aval, fim_aval, tipos_termos or None)
+                    if df_termos.empty:
+                        st.success("Nenhuma reclamação no período. 🎉")
                     else:
-                        st.info("Nenhum comentário de texto registrado.")
+                        st.dataframe(
+                            df_termos, hide_index=True, use_container_width=True,
+                            column_config={
+                                "Reclamacoes": st.column_config.ProgressColumn("Reclamações", format="%d", min_value=0, max_value=int(df_termos['Reclamacoes'].max())),
+                                "Mencoes": st.column_config.NumberColumn("Menções"),
+                                "NotaMedia": st.column_config.NumberColumn("Nota Média", format="%.1f ⭐"),
+                                "Sentimento": st.column_config.NumberColumn("Sentimento", format="%.2f"),
+                            }
+                        )
         else:
-            st.info("Ainda não há avaliações registradas.")
+            st.info("Nenhuma avaliação no período.")
             
         st.divider()
         st.subheader("🔍 Análise Profunda de Qualidade")
 
-        # Conversão de Data para Gráficos
-        df_aval['Data_dt'] = pd.to_datetime(df_aval['DataAvaliacao'], errors='coerce')
-        df_aval['Dia'] = df_aval['Data_dt'].dt.strftime('%d/%m')
+        # Somas por dia de 'avaliacoes_diarias' (datas da avaliação no período da barra lateral);
+        # o eixo é a data real, então períodos de anos diferentes não se misturam
+        agrupar = st.radio(
+            "Agrupar por:", AGRUPAMENTOS_AVALIACAO, horizontal=True,
+            index=AGRUPAMENTOS_AVALIACAO.index(agrupamento_avaliacoes(inicio_aval, fim_aval))
+        )
+        df_rollup = avaliacoes_por_periodo(inicio_aval, fim_aval, agrupar)
 
         col_q1, col_q2 = st.columns(2)
 
         with col_q1:
             st.markdown("##### 📈 Evolução da Nota Média")
-            if not df_aval.empty:
-                df_evolucao = df_aval.groupby('Dia')['Nota'].mean().reset_index()
-                fig_evol = px.line(df_evolucao, x='Dia', y='Nota', markers=True, range_y=[0, 5.5])
+            if not df_rollup.empty:
+                df_evolucao = df_rollup.groupby('Periodo', as_index=False)[['Quantidade', 'Soma']].sum()
+                df_evolucao['Nota'] = df_evolucao['Soma'] / df_evolucao['Quantidade']
+                fig_evol = px.line(df_evolucao, x='Periodo', y='Nota', markers=True, range_y=[0, 5.5],
+                                   hover_data={'Quantidade': True, 'Nota': ':.2f'}, labels={'Periodo': agrupar})
                 fig_evol.add_hline(y=4.5, line_dash="dot", line_color="green", annotation_text="Meta (4.5)")
                 st.plotly_chart(fig_evol, use_container_width=True)
             else:
@@ -399,8 +649,9 @@ def render_admin_page():
 
         with col_q2:
             st.markdown("##### 🏆 Satisfação por Equipamento")
-            if not df_aval.empty:
-                df_mod = df_aval.groupby('Modalidade')['Nota'].agg(['mean', 'count']).reset_index()
+            if not df_rollup.empty:
+                df_mod = df_rollup.groupby('Modalidade', as_index=False)[['Soma', 'Quantidade']].sum()
+                df_mod['Soma'] = df_mod['Soma'] / df_mod['Quantidade']
                 df_mod.columns = ['Modalidade', 'Nota Média', 'Qtd Avaliações']
                 fig_mod = px.bar(df_mod, x='Modalidade', y='Nota Média', color='Nota Média',
                                     range_y=[0, 5.5], text_auto='.1f', color_continuous_scale='RdYlGn',
@@ -408,4 +659,10 @@ def render_admin_page():
                 fig_mod.update_layout(coloraxis_showscale=False)
                 st.plotly_chart(fig_mod, use_container_width=True)
             else:
-                st.info("Sem dados.")
\ No newline at end of file
+                st.info("Sem dados.")
+
+    # ---------------------------------------------------------
+    # ABA 3: SAÚDE DAS TAREFAS EM SEGUNDO PLANO
+    # ---------------------------------------------------------
+    with tab_tarefas:
+        _tarefas()
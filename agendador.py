@@ -0,0 +1,323 @@
+import argparse
+import signal
+import socket
+import threading
+import time
+import traceback
+import zlib
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from armazenamento import UNIDADES, UNIDADE_PADRAO
+from armazenamento_postgres import get_conexao
+from tarefas import TAREFAS
+
+# ==========================================
+# AGENDADOR DE TAREFAS (WORKER)
+# ==========================================
+# Processo separado do app, para o trabalho pesado sair das reexecuções do
+# Streamlit:
+#   python agendador.py                         (worker: roda a AGENDA para sempre)
+#   python agendador.py --agora TAREFA          (uma vez, agora, com trava e histórico)
+#   python agendador.py --listar                (agenda e próximas execuções)
+#
+# Cada tarefa de tarefas.py tem um horário no formato do cron (minuto hora
+# dia mês dia-da-semana, na hora local do servidor) e roda em cada unidade.
+# Dá para subir mais de um worker (redundância):
+#   - o horário é reservado com um INSERT na chave única (unidade, tarefa,
+#     agendada_para) de 'execucoes_tarefas': só um worker ganha cada horário;
+#   - enquanto roda, a tarefa segura uma trava consultiva de sessão no
+#     Postgres (TRAVA_TAREFA, unidade + tarefa). Execução manual ou horário
+#     seguinte com a anterior ainda rodando: fica 'pulada'. Se o processo
+#     morrer, a sessão cai e a trava se solta sozinha.
+# Erro: até 'tentativas' vezes, esperando ESPERA_TENTATIVA_S, depois o dobro...
+# Cada execução fica no histórico com situação, duração, tentativas e o erro;
+# o painel admin mostra a saúde de cada tarefa (saude_tarefas).
+#
+# Worker parado ou lento: os horários perdidos nos últimos RECUPERAR_MIN
+# minutos rodam uma vez só ao voltar; mais antigos que isso, ficam perdidos.
+
+TRAVA_TAREFA = 7303 # Namespace da trava (7301: agenda do dia, 7302: partições)
+ESPERA_TENTATIVA_S = 30
+RECUPERAR_MIN = 120
+TOLERANCIA_ATRASO = timedelta(minutes=15) # Passou disso do horário sem rodar: "atrasada"
+RETENCAO_HISTORICO_DIAS = 90
+
+
+class Cron:
+    """
+    Expressão de cron de 5 campos: '*', '*/n', 'a', 'a-b', 'a-b/n', 'a/n' (de a
+    até o fim do campo, de n em n) e listas 'a,b'. Fora da faixa ou passo
+    menor que 1: ValueError.
+    """
+
+    CAMPOS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)] # Dia da semana: 0 = domingo
+
+    def __init__(self, expressao):
+        partes = expressao.split()
+        if len(partes) != 5:
+            raise ValueError(f"Cron precisa de 5 campos: {expressao!r}")
+        self.expressao = expressao
+        self.minutos, self.horas, self.dias, self.meses, self.dias_semana = (
+            self._valores(parte, minimo, maximo) for parte, (minimo, maximo) in zip(partes, self.CAMPOS)
+        )
+        # Como no cron: restringindo dia do mês e da semana, vale qualquer um dos dois
+        self._dia_ou_semana = partes[2] != "*" and partes[4] != "*"
+
+    @staticmethod
+    def _valores(parte, minimo, maximo):
+        valores = set()
+        for item in parte.split(","):
+            faixa, _, passo = item.partition("/")
+            if faixa == "*":
+                inicio, fim = minimo, maximo
+            elif "-" in faixa:
+                inicio, fim = map(int, faixa.split("-"))
+            else:
+                inicio = int(faixa)
+                fim = maximo if passo else inicio # 'a/n': como no cron, vai até o fim do campo
+            if not minimo <= inicio <= fim <= maximo:
+                raise ValueError(f"Fora da faixa {minimo}-{maximo}: {item!r}")
+            passo = int(passo) if passo else 1
+            if passo < 1:
+                raise ValueError(f"Passo inválido: {item!r}")
+            valores.update(range(inicio, fim + 1, passo))
+        return frozenset(valores)
+
+    def _casa_dia(self, momento):
+        no_mes = momento.day in self.dias
+        na_semana = (momento.weekday() + 1) % 7 in self.dias_semana
+        return momento.month in self.meses and ((no_mes or na_semana) if self._dia_ou_semana else (no_mes and na_semana))
+
+    def proxima(self, depois):
+        """Primeiro minuto depois de 'depois' em que a expressão casa (pula dias e horas inteiros)."""
+        momento = depois.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = momento + timedelta(days=366 * 5)
+        while momento < limite:
+            if not self._casa_dia(momento):
+                momento = momento.replace(hour=0, minute=0) + timedelta(days=1)
+            elif momento.hour not in self.horas:
+                momento = momento.replace(minute=0) + timedelta(hours=1)
+            elif momento.minute not in self.minutos:
+                momento += timedelta(minutes=1)
+            else:
+                return momento
+        raise ValueError(f"Cron nunca casa: {self.expressao!r}")
+
+
+def limpar_historico(dias=RETENCAO_HISTORICO_DIAS, unidade=None):
+    """Apaga execuções com mais de 'dias' dias do histórico da unidade."""
+    unidade = unidade or UNIDADE_PADRAO
+    with get_conexao(unidade).session as s:
+        s.execute(text(
+            "DELETE FROM execucoes_tarefas WHERE unidade = :unidade AND inicio < now() - make_interval(days => :d)"
+        ), params={"unidade": unidade, "d": dias})
+        s.commit()
+
+FUNCOES = dict(TAREFAS, **{"limpar-historico": limpar_historico})
+
+# tarefa -> (cron, tentativas)
+AGENDA = {
+    "enviar-notificacoes": (Cron("*/2 * * * *"), 1), # O próximo horário já é a nova tentativa
+    "reconciliar-engajamento": (Cron("0 3 * * *"), 3),
+    "reconciliar-avaliacoes": (Cron("15 3 * * *"), 3),
+    "preencher-user-id": (Cron("30 3 * * *"), 3),
+    "limpar-remocoes": (Cron("0 4 * * *"), 3),
+    "limpar-seed": (Cron("30 4 * * *"), 3),
+    "garantir-particoes": (Cron("45 4 * * *"), 3),
+    "lembrar-avaliacoes": (Cron("0 10 * * *"), 3),
+    "limpar-historico": (Cron("0 5 * * 0"), 3),
+}
+
+# ==========================================
+# EXECUÇÃO (TRAVA, TENTATIVAS, HISTÓRICO)
+# ==========================================
+def chave_tarefa(unidade, tarefa):
+    """Segunda chave da trava: int4 a partir de unidade + tarefa."""
+    return zlib.crc32(f"{unidade}:{tarefa}".encode()) - 2 ** 31
+
+def _reservar_horario(unidade, tarefa, agendada_para):
+    with get_conexao(unidade).session as s:
+        id_execucao = s.execute(text("""
+            INSERT INTO execucoes_tarefas (unidade, tarefa, agendada_para, situacao, maquina)
+            VALUES (:unidade, :tarefa, :agendada_para, 'rodando', :maquina)
+            ON CONFLICT (unidade, tarefa, agendada_para) DO NOTHING
+            RETURNING id
+        """), params={"unidade": unidade, "tarefa": tarefa, "agendada_para": agendada_para, "maquina": socket.gethostname()}).scalar()
+        s.commit()
+    return id_execucao
+
+def _encerrar(unidade, id_execucao, situacao, tentativas, resultado=None, erro=None):
+    with get_conexao(unidade).session as s:
+        s.execute(text("""
+            UPDATE execucoes_tarefas SET situacao = :situacao, fim = now(), tentativas = :tentativas,
+                duracao_ms = CAST(EXTRACT(EPOCH FROM now() - inicio) * 1000 AS INTEGER),
+                resultado = :resultado, erro = :erro
+            WHERE id = :id
+        """), params={"id": id_execucao, "situacao": situacao, "tentativas": tentativas, "resultado": resultado, "erro": erro})
+        s.commit()
+
+def executar_tarefa(tarefa, unidade, agendada_para=None, parar=None):
+    """
+    Roda a tarefa na unidade com trava e histórico. 'agendada_para' é o horário
+    da agenda (padrão: agora, execução manual). Devolve a situação gravada
+    ('ok', 'erro', 'pulada') ou None se outro worker já pegou esse horário.
+    """
+    agendada_para = agendada_para or datetime.now()
+    parar = parar or threading.Event()
+    tentativas_max = AGENDA[tarefa][1] if tarefa in AGENDA else 1
+    id_execucao = _reservar_horario(unidade, tarefa, agendada_para)
+    if id_execucao is None:
+        return None
+
+    # Conexão própria: a trava de sessão vive enquanto ela estiver aberta
+    with get_conexao(unidade).engine.connect() as trava:
+        chave = {"ns": TRAVA_TAREFA, "k": chave_tarefa(unidade, tarefa)}
+        if not trava.execute(text("SELECT pg_try_advisory_lock(:ns, :k)"), chave).scalar():
+            trava.rollback()
+            _encerrar(unidade, id_execucao, "pulada", 0, erro="Execução anterior ainda em andamento.")
+            return "pulada"
+        trava.commit() # Não deixa a conexão 'idle in transaction' durante a tarefa
+        try:
+            # Com a trava na mão, nenhuma outra execução desta tarefa está viva
+            with get_conexao(unidade).session as s:
+                s.execute(text("""
+                    UPDATE execucoes_tarefas SET situacao = 'interrompida', fim = now()
+                    WHERE unidade = :unidade AND tarefa = :tarefa AND situacao = 'rodando' AND id <> :id
+                """), params={"unidade": unidade, "tarefa": tarefa, "id": id_execucao})
+                s.commit()
+
+            for tentativa in range(1, tentativas_max + 1):
+                try:
+                    resultado = FUNCOES[tarefa](unidade=unidade)
+                except Exception as e:
+                    erro = "".join(traceback.format_exception_only(e)).strip()
+                    print(f"❌ {tarefa} ({unidade}), tentativa {tentativa}/{tentativas_max}: {erro}")
+                    # Última tentativa, ou o worker está parando no meio da espera
+                    if tentativa == tentativas_max or parar.wait(ESPERA_TENTATIVA_S * 2 ** (tentativa - 1)):
+                        _encerrar(unidade, id_execucao, "erro", tentativa, erro=erro)
+                        return "erro"
+                else:
+                    _encerrar(unidade, id_execucao, "ok", tentativa, resultado=None if resultado is None else str(resultado))
+                    return "ok"
+        finally:
+            trava.execute(text("SELECT pg_advisory_unlock(:ns, :k)"), chave)
+            trava.commit()
+
+def horarios_devidos(desde, ate):
+    """{tarefa: último horário da AGENDA em (desde, ate]} — cada tarefa atrasada roda uma vez só."""
+    devidos = {}
+    for tarefa, (cron, _) in AGENDA.items():
+        momento = cron.proxima(desde)
+        while momento <= ate:
+            devidos[tarefa] = momento
+            momento = cron.proxima(momento)
+    return devidos
+
+def rodar_worker(unidades=UNIDADES, parar=None):
+    """Laço do worker: a cada minuto roda, em cada unidade, as tarefas que venceram."""
+    parar = parar or threading.Event()
+    ultimo = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=1)
+    print(f"⏳ Agendador: {len(AGENDA)} tarefa(s) em {', '.join(unidades)}")
+    while not parar.is_set():
+        agora = datetime.now().replace(second=0, microsecond=0)
+        devidos = horarios_devidos(max(ultimo, agora - timedelta(minutes=RECUPERAR_MIN)), agora)
+        ultimo = agora
+        for tarefa, agendada_para in devidos.items():
+            for unidade in unidades:
+                if parar.is_set():
+                    break
+                t0 = time.perf_counter()
+                try:
+                    situacao = executar_tarefa(tarefa, unidade, agendada_para, parar)
+                except Exception as e:
+                    # Banco fora do ar: nem o histórico grava; o horário fica para a recuperação
+                    print(f"❌ {tarefa} ({unidade}): {e}")
+                    continue
+                if situacao:
+                    print(f"{datetime.now():%d/%m %H:%M:%S} {tarefa} ({unidade}): {situacao} em {time.perf_counter() - t0:.1f}s")
+        proximo_minuto = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        parar.wait(max((proximo_minuto - datetime.now()).total_seconds(), 0))
+    print("Agendador parado.")
+
+# ==========================================
+# SAÚDE DAS TAREFAS (PAINEL ADMIN)
+# ==========================================
+def historico_tarefas(unidade=None, limite=50):
+    """Últimas execuções da unidade: Tarefa, AgendadaPara, Situacao, Inicio, DuracaoS, Tentativas, Resultado, Erro."""
+    unidade = unidade or UNIDADE_PADRAO
+    return get_conexao(unidade).query(
+        """
+        SELECT tarefa AS "Tarefa", agendada_para AS "AgendadaPara", situacao AS "Situacao", inicio AS "Inicio",
+               duracao_ms / 1000.0 AS "DuracaoS", tentativas AS "Tentativas", resultado AS "Resultado", erro AS "Erro"
+        FROM execucoes_tarefas WHERE unidade = :unidade ORDER BY inicio DESC LIMIT :limite
+        """,
+        params={"unidade": unidade, "limite": limite}, ttl=0
+    )
+
+def saude_tarefas(unidade=None, agora=None):
+    """
+    Uma linha por tarefa da AGENDA: Estado, Tarefa, Agenda, Ultima (horário
+    agendado), Situacao, DuracaoS, Falhas7d (erros nos últimos 7 dias), Proxima e Erro.
+    """
+    unidade = unidade or UNIDADE_PADRAO
+    agora = agora or datetime.now()
+    ultimas = get_conexao(unidade).query(
+        """
+        SELECT DISTINCT ON (tarefa) tarefa, agendada_para, situacao, duracao_ms / 1000.0 AS duracao_s, erro,
+               count(*) FILTER (WHERE situacao = 'erro' AND inicio > now() - interval '7 days') OVER (PARTITION BY tarefa) AS falhas
+        FROM execucoes_tarefas WHERE unidade = :unidade AND situacao <> 'pulada' -- Pulada: outra execução estava rodando
+        ORDER BY tarefa, inicio DESC
+        """,
+        params={"unidade": unidade}, ttl=0
+    ).set_index("tarefa")
+
+    linhas = []
+    for tarefa, (cron, _) in AGENDA.items():
+        ultima = ultimas.loc[tarefa] if tarefa in ultimas.index else None
+        if ultima is None:
+            estado = "⚪ Nunca rodou"
+        elif ultima['situacao'] == "rodando":
+            estado = "⏳ Rodando"
+        elif cron.proxima(ultima['agendada_para'].to_pydatetime()) + TOLERANCIA_ATRASO < agora:
+            estado = "🟠 Atrasada" # O worker não pegou o último horário: parado?
+        elif ultima['situacao'] in ("erro", "interrompida"):
+            estado = "🔴 Falhou"
+        else:
+            estado = "🟢 Ok"
+        linhas.append({
+            "Estado": estado, "Tarefa": tarefa, "Agenda": cron.expressao,
+            "Ultima": None if ultima is None else ultima['agendada_para'],
+            "Situacao": None if ultima is None else ultima['situacao'],
+            "DuracaoS": None if ultima is None else ultima['duracao_s'],
+            "Falhas7d": 0 if ultima is None else int(ultima['falhas']),
+            "Proxima": cron.proxima(agora),
+            "Erro": None if ultima is None or pd.isna(ultima['erro']) else ultima['erro'],
+        })
+    return pd.DataFrame(linhas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agendador de tarefas da Agenda Naalli (worker).")
+    parser.add_argument("--agora", choices=list(FUNCOES), help="Roda esta tarefa uma vez, agora")
+    parser.add_argument("--listar", action="store_true", help="Mostra a agenda e sai")
+    parser.add_argument("--unidade", choices=UNIDADES, help="Padrão: todas")
+    args = parser.parse_args()
+    unidades = [args.unidade] if args.unidade else UNIDADES
+
+    if args.listar:
+        agora = datetime.now()
+        for tarefa, (cron, tentativas) in AGENDA.items():
+            print(f"{tarefa:<26} {cron.expressao:<14} {tentativas} tentativa(s)  próxima: {cron.proxima(agora):%d/%m %H:%M}")
+    elif args.agora:
+        for unidade in unidades:
+            print(f"⏳ {args.agora} ({unidade})...")
+            print(f"   {executar_tarefa(args.agora, unidade) or 'já rodando em outro worker'}")
+    else:
+        parar = threading.Event()
+        # Render/systemd param com SIGTERM: termina a tarefa atual e sai
+        signal.signal(signal.SIGTERM, lambda *_: parar.set())
+        try:
+            rodar_worker(unidades, parar)
+        except KeyboardInterrupt:
+            parar.set()
@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import threading
+import time
+import anyio.to_thread
+import uvicorn
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from utils import (
+    verificar_login, data_para_dia, horarios_funcionamento, gerar_estrutura_horario,
+    bloqueios_do_horario, motivo_bloqueio, buscar_vagas_livres, salvar_agendamento,
+    remover_agendamento_do_aluno, get_aulas_pendentes_avaliacao, salvar_avaliacao_aluno,
+    aquecer_armazenamento, entrar_lista_espera, sair_lista_espera, usar_unidade, unidade_atual,
+    registrar_checkin, fechar_ingestores, ao_trocar_senha,
+)
+from armazenamento import UNIDADES, UNIDADE_PADRAO
+from tempo_real import get_ocupacao_ao_vivo
+
+# ==========================================
+# API HTTP (JSON) DA AGENDA
+# ==========================================
+# Para o tablet da recepção e clientes móveis: as mesmas operações da aba
+# de agendamento e de avaliação, sem reexecutar o script do Streamlit.
+# Usa as funções de utils.py, então divide com o app o mesmo backend,
+# o pool de conexões e a ocupação ao vivo (tempo_real.py).
+#
+#   python api.py                 (serve em 0.0.0.0:8000; NAALLI_API_PORTA muda a porta)
+#   python api.py --benchmark     (requisições/s da API x reexecuções do Streamlit; usa httpx)
+#
+# Autenticação: HTTP Basic com o e-mail e a senha do app. As funções de
+# utils.py são síncronas e rodam no threadpool; o limite de threads segue o
+# pool do banco (tamanho + extra) para ninguém ficar parado esperando conexão.
+#
+# Unidade: parâmetro '?unidade=' ou cabeçalho 'X-Naalli-Unidade' (padrão: a
+# primeira de NAALLI_UNIDADES). O login vale no banco da unidade.
+#
+# Rotas:
+#   GET    /horarios?data=DD/MM/YYYY
+#   GET    /vagas?data=DD/MM/YYYY&horario=HH:00
+#   GET    /vagas/livres?tipo=Treino&de=06:00&ate=20:00[&dias=14&limite=3]
+#   POST   /agendamentos          {"data", "horario", "numero", "tipo"}
+#   DELETE /agendamentos?data=&horario=&numero=&tipo=
+#   POST   /lista-espera          {"data", "horario", "tipo"}
+#   DELETE /lista-espera?data=&horario=&tipo=
+#   GET    /avaliacoes/pendentes
+#   POST   /avaliacoes            {"id", "nota" (1-5), "comentario"}
+#   POST   /checkins              {"user_id"}   (só admin: leitor da recepção; 202, gravado em lote)
+
+THREADS_API = int(os.environ.get("NAALLI_API_THREADS", 10)) # NAALLI_POOL_TAMANHO + NAALLI_POOL_EXTRA
+CACHE_LOGIN_S = 60 # Troca de senha feita em outro processo vale na API em até 60s
+
+
+class ErroApi(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+# --- AUTENTICAÇÃO ---
+_logins = {} # (unidade, email, hash da senha) -> (usuário, lido_em)
+_lock_logins = threading.Lock()
+
+def _autenticar(request):
+    cabecalho = request.headers.get("authorization", "")
+    try:
+        email, _, senha = base64.b64decode(cabecalho.removeprefix("Basic ")).decode().partition(":")
+    except ValueError:
+        email, senha = "", ""
+    if not cabecalho.startswith("Basic ") or not email:
+        raise ErroApi(401, "Informe e-mail e senha (HTTP Basic).")
+
+    chave = (unidade_atual(), email.strip(), hashlib.sha256(senha.encode()).hexdigest())
+    with _lock_logins:
+        guardado = _logins.get(chave)
+    if guardado and time.monotonic() - guardado[1] < CACHE_LOGIN_S:
+        return guardado[0]
+    user = verificar_login(email, senha)
+    if not user:
+        raise ErroApi(401, "E-mail ou senha incorretos.")
+    if user.get('mudar_senha'):
+        raise ErroApi(403, "Troque a senha provisória no app antes de usar a API.")
+    agora = time.monotonic()
+    with _lock_logins:
+        # Vencidos saem aqui: senão cada senha antiga ou aluno que sumiu ficaria para sempre
+        for vencido in [c for c, (_, lido_em) in _logins.items() if agora - lido_em >= CACHE_LOGIN_S]:
+            del _logins[vencido]
+        _logins[chave] = (user, agora)
+    return user
+
+def _esquecer_logins(unidade, email):
+    with _lock_logins:
+        for c in [c for c in _logins if c[:2] == (unidade, email)]:
+            del _logins[c]
+
+ao_trocar_senha.append(_esquecer_logins)
+
+
+# --- VALIDAÇÃO ---
+def _unidade(request):
+    unidade = request.query_params.get("unidade") or request.headers.get("x-naalli-unidade") or UNIDADE_PADRAO
+    if unidade not in UNIDADES:
+        raise ErroApi(400, f"Unidade inválida (use {', '.join(UNIDADES)}).")
+    return unidade
+
+def _dia(data_str):
+    try:
+        return data_para_dia(data_str or "")
+    except ValueError:
+        raise ErroApi(400, "Data inválida (use DD/MM/YYYY).")
+
+def _vaga(data_str, horario, numero, tipo):
+    """Confere que o aparelho existe no horário (conforme a grade) e devolve o número como int."""
+    try:
+        numero = int(numero)
+    except (TypeError, ValueError):
+        raise ErroApi(400, "Número da vaga inválido.")
+    if (numero, tipo) not in gerar_estrutura_horario(_dia(data_str), horario):
+        raise ErroApi(404, "Vaga inexistente nesse dia e horário.")
+    return numero
+
+def _parametro(request, nome):
+    valor = request.query_params.get(nome)
+    if not valor:
+        raise ErroApi(400, f"Parâmetro obrigatório: {nome}")
+    return valor
+
+async def _corpo(request):
+    try:
+        corpo = await request.json()
+    except ValueError:
+        raise ErroApi(400, "Corpo JSON inválido.")
+    if not isinstance(corpo, dict):
+        raise ErroApi(400, "Corpo JSON inválido.")
+    return corpo
+
+
+# --- ROTAS (as funções síncronas rodam no threadpool) ---
+def _horarios(request, user):
+    data_str = _parametro(request, "data")
+    return {"data": data_str, "horarios": horarios_funcionamento(_dia(data_str))}
+
+def _vagas(request, user):
+    data_str, horario = _parametro(request, "data"), _parametro(request, "horario")
+    todas = gerar_estrutura_horario(_dia(data_str), horario)
+    ocupacao = get_ocupacao_ao_vivo().ocupacao_dia(data_str)
+    bloqueios = bloqueios_do_horario(data_str, horario)
+    vagas = []
+    for vaga in todas:
+        motivo = motivo_bloqueio(bloqueios, vaga.Numero, vaga.Tipo)
+        ocupante = ocupacao.get((horario, vaga.Numero, vaga.Tipo))
+        if motivo is not None:
+            situacao = "fechada"
+        elif ocupante:
+            situacao = "ocupada"
+        else:
+            situacao = "livre"
+        vagas.append({
+            "numero": vaga.Numero, "tipo": vaga.Tipo, "situacao": situacao,
+            "minha": bool(ocupante) and ocupante[1] == user['id'], "motivo": motivo,
+        })
+    return {"data": data_str, "horario": horario, "vagas": vagas}
+
+def _vagas_livres(request, user):
+    try:
+        dias = int(request.query_params.get("dias", 14))
+        limite = int(request.query_params.get("limite", 3))
+    except ValueError:
+        raise ErroApi(400, "dias e limite são números.")
+    resultado = buscar_vagas_livres(
+        _parametro(request, "tipo"), _parametro(request, "de"), _parametro(request, "ate"),
+        dias=min(max(dias, 1), 60), limite=min(max(limite, 1), 50),
+    )
+    return {"vagas": resultado}
+
+def _reservar(corpo, user):
+    data_str, horario, tipo = corpo.get("data"), corpo.get("horario"), corpo.get("tipo")
+    numero = _vaga(data_str, horario, corpo.get("numero"), tipo)
+    if not salvar_agendamento(data_str, horario, numero, tipo, user['nome'], "LOGGED_USER", user['id']):
+        raise ErroApi(409, "Essa vaga acabou de ser ocupada ou foi bloqueada.")
+    get_ocupacao_ao_vivo().invalidar(data_str)
+    return {"data": data_str, "horario": horario, "numero": numero, "tipo": tipo}
+
+def _cancelar(request, user):
+    data_str, horario, tipo = _parametro(request, "data"), _parametro(request, "horario"), _parametro(request, "tipo")
+    numero = _vaga(data_str, horario, request.query_params.get("numero"), tipo)
+    resultado = remover_agendamento_do_aluno(data_str, horario, numero, tipo, user['id'], is_admin=user['tipo'] == 'admin')
+    if resultado == "Agendamento não encontrado.":
+        raise ErroApi(404, resultado)
+    if resultado != "Sucesso":
+        raise ErroApi(403, resultado)
+    get_ocupacao_ao_vivo().invalidar(data_str)
+    return {"cancelado": True}
+
+def _entrar_espera(corpo, user):
+    data_str, horario, tipo = corpo.get("data"), corpo.get("horario"), corpo.get("tipo")
+    if not any(v.Tipo == tipo for v in gerar_estrutura_horario(_dia(data_str), horario)):
+        raise ErroApi(404, "Não há esse tipo de aparelho nesse dia e horário.")
+    resultado = entrar_lista_espera(data_str, horario, tipo, user)
+    if resultado != "Sucesso":
+        raise ErroApi(409, resultado)
+    return {"data": data_str, "horario": horario, "tipo": tipo}
+
+def _sair_espera(request, user):
+    data_str = _parametro(request, "data")
+    _dia(data_str)
+    sair_lista_espera(data_str, _parametro(request, "horario"), _parametro(request, "tipo"), user['id'])
+    return {"saiu": True}
+
+def _pendentes(request, user):
+    return {"aulas": [
+        {"id": int(a['doc_id']), "data": a['Data'], "horario": a['Horario'], "tipo": a['Tipo']}
+        for a in get_aulas_pendentes_avaliacao(user['id'])
+    ]}
+
+def _avaliar(corpo, user):
+    try:
+        id_agendamento, nota = int(corpo.get("id")), int(corpo.get("nota"))
+    except (TypeError, ValueError):
+        raise ErroApi(400, "id e nota são números.")
+    if not 1 <= nota <= 5:
+        raise ErroApi(400, "A nota vai de 1 a 5.")
+    # Só treinos do próprio aluno, já feitos e ainda sem avaliação (mesma regra da aba Avaliação)
+    aula = next((a for a in get_aulas_pendentes_avaliacao(user['id']) if int(a['doc_id']) == id_agendamento), None)
+    if aula is None:
+        raise ErroApi(404, "Treino não encontrado ou já avaliado.")
+    salvar_avaliacao_aluno(id_agendamento, user['nome'], aula['Data'], aula['Tipo'], nota, str(corpo.get("comentario") or ""), user['id'])
+    return {"avaliado": True}
+
+def _checkin(corpo, user):
+    if user['tipo'] != 'admin':
+        raise ErroApi(403, "Check-in só pela conta da recepção (admin).")
+    try:
+        user_id = int(corpo.get("user_id"))
+    except (TypeError, ValueError):
+        raise ErroApi(400, "user_id é um número.")
+    # Só entra na fila: a resposta não espera o banco
+    na_fila = registrar_checkin(user_id, origem="api")
+    if na_fila is None:
+        raise ErroApi(404, "Aluno não encontrado.")
+    return {"na_fila": na_fila}
+
+
+def _na_unidade(unidade, funcao, *args):
+    # Roda na thread do pool: utils.py e a ocupação ao vivo atendem essa unidade
+    with usar_unidade(unidade):
+        return funcao(*args)
+
+def _rota(funcao, com_corpo=False, status=200):
+    async def endpoint(request):
+        try:
+            unidade = _unidade(request)
+            user = await run_in_threadpool(_na_unidade, unidade, _autenticar, request)
+            entrada = await _corpo(request) if com_corpo else request
+            return JSONResponse(await run_in_threadpool(_na_unidade, unidade, funcao, entrada, user), status_code=status)
+        except ErroApi as e:
+            return JSONResponse({"erro": e.mensagem}, status_code=e.status)
+    return endpoint
+
+@asynccontextmanager
+async def _ciclo(app):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADS_API
+    aquecer_armazenamento()
+    yield
+    # Check-ins ainda na fila vão para o banco (ou para o arquivo de pendentes)
+    await run_in_threadpool(fechar_ingestores)
+
+app = Starlette(
+    routes=[
+        Route("/horarios", _rota(_horarios)),
+        Route("/vagas", _rota(_vagas)),
+        Route("/vagas/livres", _rota(_vagas_livres)),
+        Route("/agendamentos", _rota(_reservar, com_corpo=True, status=201), methods=["POST"]),
+        Route("/agendamentos", _rota(_cancelar), methods=["DELETE"]),
+        Route("/lista-espera", _rota(_entrar_espera, com_corpo=True, status=201), methods=["POST"]),
+        Route("/lista-espera", _rota(_sair_espera), methods=["DELETE"]),
+        Route("/avaliacoes/pendentes", _rota(_pendentes)),
+        Route("/avaliacoes", _rota(_avaliar, com_corpo=True, status=201), methods=["POST"]),
+        Route("/checkins", _rota(_checkin, com_corpo=True, status=202), methods=["POST"]),
+    ],
+    lifespan=_ciclo,
+)
+
+
+# ==========================================
+# BENCHMARK: API x STREAMLIT
+# ==========================================
+# Mesmo banco, mesmo processo, um usuário de teste. "Consulta" = ver as
+# vagas de um horário; "reserva" = reservar e liberar uma vaga. No Streamlit
+# cada ação é uma reexecução do Agendamento.py pelo AppTest, que nem passa
+# pelo websocket/protobuf: o custo real do Streamlit é maior que o medido.
+BENCH_EMAIL = "benchmark.api@naalli.com"
+BENCH_SENHA = "benchmark"
+
+def _preparar_benchmark():
+    from datetime import date, timedelta
+    from utils import criar_usuario, get_armazenamento, hash_senha
+    if get_armazenamento().buscar_usuario(BENCH_EMAIL) is None:
+        criar_usuario(BENCH_EMAIL, "Benchmark API", BENCH_SENHA)
+    get_armazenamento().atualizar_senha(BENCH_EMAIL, hash_senha(BENCH_SENHA), False)
+    dia = date.today() + timedelta(days=1)
+    while not horarios_funcionamento(dia):
+        dia += timedelta(days=1)
+    horarios = horarios_funcionamento(dia)
+    # Uma vaga por trabalhador concorrente: reservas que não disputam o mesmo aparelho
+    vagas = [(h, v.Numero, v.Tipo) for h in horarios[1:] for v in gerar_estrutura_horario(dia, h)]
+    return dia, horarios[0], vagas
+
+async def _medir_api(url, data_str, horario, vagas, total, concorrencia):
+    import httpx
+    auth = (BENCH_EMAIL, BENCH_SENHA)
+    resultados = {}
+    async with httpx.AsyncClient(base_url=url, auth=auth, timeout=30) as cliente:
+        await cliente.get("/vagas", params={"data": data_str, "horario": horario}) # Aquece login e ocupação
+
+        async def consultas(n):
+            for _ in range(n):
+                r = await cliente.get("/vagas", params={"data": data_str, "horario": horario})
+                r.raise_for_status()
+
+        async def reservas(n, vaga):
+            h, numero, tipo = vaga
+            for _ in range(n):
+                r = await cliente.post("/agendamentos", json={"data": data_str, "horario": h, "numero": numero, "tipo": tipo})
+                r.raise_for_status()
+                r = await cliente.delete("/agendamentos", params={"data": data_str, "horario": h, "numero": numero, "tipo": tipo})
+                r.raise_for_status()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(consultas(total // concorrencia) for _ in range(concorrencia)))
+        resultados["consulta"] = (total // concorrencia) * concorrencia / (time.perf_counter() - t0)
+
+        pares = max(total // 10 // concorrencia, 1)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(reservas(pares, vagas[i]) for i in range(concorrencia)))
+        resultados["reserva"] = pares * concorrencia / (time.perf_counter() - t0) # Reservas+cancelamentos por s
+    return resultados
+
+def _medir_streamlit(dia, horario, vagas, repeticoes):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Agendamento.py"), default_timeout=60)
+    at.run()
+    at.text_input[0].input(BENCH_EMAIL)
+    at.text_input[1].input(BENCH_SENHA)
+    at.button[0].click().run()
+    at.date_input[0].set_value(dia).run()
+    seletor_hora = lambda: next(s for s in at.selectbox if s.label.startswith("Horário ("))
+    seletor_hora().set_value(horario).run()
+
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        at.run()
+    consulta = repeticoes / (time.perf_counter() - t0)
+
+    _, numero, tipo = vagas[0]
+    seletor_hora().set_value(vagas[0][0]).run()
+    t0 = time.perf_counter()
+    pares = max(repeticoes // 5, 1)
+    for _ in range(pares):
+        at.button(key=f"res_{tipo}_{numero}").click().run()
+        at.button(key=f"lib_{tipo}_{numero}").click().run()
+    reserva = pares / (time.perf_counter() - t0)
+    if at.exception:
+        raise RuntimeError(at.exception)
+    return {"consulta": consulta, "reserva": reserva}
+
+def benchmark(total, concorrencia, repeticoes):
+    dia, horario, vagas = _preparar_benchmark()
+    data_str = dia.strftime("%d/%m/%Y")
+    concorrencia = min(concorrencia, len(vagas))
+
+    porta = int(os.environ.get("NAALLI_API_PORTA_BENCH", 8765))
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=porta, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+
+    url = f"http://127.0.0.1:{porta}"
+    api_1 = asyncio.run(_medir_api(url, data_str, horario, vagas, total // 4, 1))
+    api_n = asyncio.run(_medir_api(url, data_str, horario, vagas, total, concorrencia))
+    servidor.should_exit = True
+    st_1 = _medir_streamlit(dia, horario, vagas, repeticoes)
+
+    print(f"\nDia {data_str}, horário {horario} | {total} consultas na API, {repeticoes} reexecuções no Streamlit")
+    print(f"{'':<26}{'consulta/s':>12}{'reserva+libera/s':>18}")
+    print(f"{'Streamlit (1 sessão)':<26}{st_1['consulta']:>12.1f}{st_1['reserva']:>18.1f}")
+    print(f"{'API (1 cliente)':<26}{api_1['consulta']:>12.1f}{api_1['reserva']:>18.1f}")
+    print(f"{f'API ({concorrencia} clientes)':<26}{api_n['consulta']:>12.1f}{api_n['reserva']:>18.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP da Agenda Naalli.")
+    parser.add_argument("--benchmark", action="store_true", help="Mede a API contra o caminho do Streamlit e sai.")
+    parser.add_argument("--total", type=int, default=2000, help="Consultas na API no benchmark.")
+    parser.add_argument("--concorrencia", type=int, default=16, help="Clientes simultâneos no benchmark.")
+    parser.add_argument("--repeticoes", type=int, default=50, help="Reexecuções do Streamlit no benchmark.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.total, args.concorrencia, args.repeticoes)
+    else:
+        uvicorn.run(app, host=os.environ.get("NAALLI_API_HOST", "0.0.0.0"), port=int(os.environ.get("NAALLI_API_PORTA", 8000)))
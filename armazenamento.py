@@ -0,0 +1,263 @@
+import os
+import re
+import threading
+from sqlalchemy import event
+
+# ==========================================
+# ARMAZENAMENTO (INTERFACE DOS DADOS)
+# ==========================================
+# utils.py fala só com esta interface. Há duas implementações:
+#   - armazenamento_postgres.py: produção (Neon/Render), padrão.
+#   - armazenamento_sqlite.py: embutido, para rodar local, benchmarks e
+#     instalações pequenas de uma instância só.
+# A escolha vem de NAALLI_ARMAZENAMENTO ("postgres" ou "sqlite"); o arquivo
+# do SQLite vem de NAALLI_SQLITE_PATH (padrão: em memória).
+#
+# Datas: 'dia' é sempre datetime.date; 'data_str' é o texto DD/MM/YYYY do Frontend.
+# Os DataFrames já saem com as colunas que as telas usam ("Data", "Horario"...).
+
+# ==========================================
+# UNIDADES
+# ==========================================
+# Cada unidade da Naalli tem sua agenda, capacidade, fechamentos, lista de
+# espera, avaliações e painel. NAALLI_UNIDADES lista as unidades separadas
+# por vírgula (ex.: "centro,zona_sul"); a primeira é a padrão e fica com os
+# dados gravados antes das unidades. Cada instância de Armazenamento atende
+# uma unidade: a coluna 'unidade' entra em todas as chaves e índices das
+# tabelas por unidade, e todas as consultas filtram por ela.
+#
+# Por padrão as unidades dividem o mesmo banco. Uma unidade movimentada vai
+# para outra instância só com configuração, sem mudar código:
+#   DATABASE_URL_<UNIDADE>        (Postgres; ex.: DATABASE_URL_ZONA_SUL)
+#   NAALLI_SQLITE_PATH_<UNIDADE>  (SQLite)
+# Os usuários ficam em cada banco: unidades no mesmo banco dividem as contas.
+
+def _ler_unidades():
+    unidades = [u.strip().lower() for u in os.environ.get("NAALLI_UNIDADES", "principal").split(",") if u.strip()]
+    for unidade in unidades:
+        # Vira nome de partição e de variável de ambiente: só minúsculas, números e _
+        if not re.fullmatch(r"[a-z][a-z0-9_]{0,30}", unidade):
+            raise ValueError(f"Unidade inválida em NAALLI_UNIDADES: {unidade}")
+    return unidades or ["principal"]
+
+UNIDADES = _ler_unidades()
+UNIDADE_PADRAO = UNIDADES[0]
+
+def rotulo_unidade(unidade):
+    return unidade.replace("_", " ").title()
+
+def config_unidade(variavel, unidade):
+    """Valor de '<variavel>_<UNIDADE>' no ambiente (configuração própria da unidade) ou None."""
+    return os.environ.get(f"{variavel}_{unidade.upper()}")
+
+class Armazenamento:
+    """Operações de dados de uma unidade usadas pelo app. Cada backend implementa todas."""
+
+    nome = None
+    unidade = UNIDADE_PADRAO
+
+    def metricas(self):
+        """Números do pool de conexões para diagnóstico (vazio se não houver pool)."""
+        return {}
+
+    # --- USUÁRIOS ---
+    def buscar_usuario(self, email):
+        """Dict do usuário (com 'id' int) ou None."""
+        raise NotImplementedError
+
+    def tem_usuarios(self):
+        raise NotImplementedError
+
+    def usuario_existe(self, user_id):
+        raise NotImplementedError
+
+    def inserir_usuario(self, email, nome, senha_hash, mudar_senha, tipo):
+        """False se o e-mail já existe."""
+        raise NotImplementedError
+
+    def atualizar_senha(self, email, senha_hash, mudar_senha):
+        raise NotImplementedError
+
+    # --- AGENDA ---
+    def carregar_dados_dia(self, dia):
+        """Colunas: Data, Horario, Numero, Tipo, Nome, Pin, CriadoEm, UserId."""
+        raise NotImplementedError
+
+    def agendamentos_desde(self, id_minimo):
+        """Colunas: id, dia, Data, Horario, Numero, Tipo, Nome, Pin, CriadoEm dos agendamentos com id > id_minimo."""
+        raise NotImplementedError
+
+    def ultima_remocao(self):
+        """Maior 'seq' em agendamentos_removidos (0 se vazia)."""
+        raise NotImplementedError
+
+    def remocoes_desde(self, seq_minimo):
+        """Colunas: seq, id das lápides com seq > seq_minimo."""
+        raise NotImplementedError
+
+    def inserir_agendamento(self, data_str, dia, horario, numero, tipo, nome, pin, user_id):
+        """Grava a reserva; False se a vaga já está ocupada ou bloqueada."""
+        raise NotImplementedError
+
+    def buscar_agendamento(self, dia, horario, numero, tipo):
+        """Dict com id, pin e user_id da vaga ocupada, ou None."""
+        raise NotImplementedError
+
+    def remover_agendamento(self, id_agendamento, dia, user_id):
+        """
+        Apaga a reserva e, na mesma transação, entrega o aparelho ao primeiro
+        da lista de espera do (dia, horário, tipo), com aviso na fila.
+        Retorna {'user_id', 'nome'} de quem foi promovido, ou None.
+        """
+        raise NotImplementedError
+
+    def ocupacao_periodo(self, inicio, fim, tipo):
+        """Colunas: dia (date), horario, numero das vagas de 'tipo' ocupadas no período."""
+        raise NotImplementedError
+
+    def historico_aluno(self, user_id, limite):
+        """Colunas: Data, Horario, Tipo; mais recentes primeiro."""
+        raise NotImplementedError
+
+    def modalidades_aluno(self, user_id):
+        """Colunas: Tipo, Qtd."""
+        raise NotImplementedError
+
+    # --- GRADE DE CAPACIDADE (ver capacidade.py) ---
+    def modelos_horario(self):
+        """Colunas: id, dia_semana, dia (date), hora_inicio, hora_fim, layout; na ordem de aplicação."""
+        raise NotImplementedError
+
+    def substituir_modelos_horario(self, linhas):
+        """Troca todos os modelos pelas 'linhas' (dicts com as colunas acima, sem id) numa transação."""
+        raise NotImplementedError
+
+    # --- FECHAMENTOS (BLOQUEIOS) ---
+    def aplicar_bloqueio(self, dia, hora_inicio, hora_fim, tipo, numero, motivo, criado_por):
+        """
+        Numa transação: grava o bloqueio, cancela as reservas atingidas
+        (tipo/numero None = todos) e põe os alunos na fila de notificações.
+        Colunas do retorno: Data, Horario, Numero, Tipo, Nome, UserId das reservas canceladas.
+        """
+        raise NotImplementedError
+
+    def bloqueios_periodo(self, inicio, fim):
+        """Colunas: id, dia (date), hora_inicio, hora_fim, tipo, numero, motivo."""
+        raise NotImplementedError
+
+    def remover_bloqueio(self, id_bloqueio):
+        raise NotImplementedError
+
+    def notificacoes_pendentes(self, limite):
+        """Colunas: id, email, nome, evento, data, horario, tipo, numero, motivo (ainda não enviadas)."""
+        raise NotImplementedError
+
+    def marcar_notificacoes_enviadas(self, ids):
+        raise NotImplementedError
+
+    # --- LISTA DE ESPERA ---
+    def entrar_lista_espera(self, dia, horario, tipo, nome, user_id):
+        """False se o aluno já está na lista desse (dia, horário, tipo)."""
+        raise NotImplementedError
+
+    def sair_lista_espera(self, dia, horario, tipo, user_id):
+        raise NotImplementedError
+
+    def lista_espera_horario(self, dia, horario):
+        """Colunas: Tipo, UserId, Nome; na ordem da fila."""
+        raise NotImplementedError
+
+    # --- AVALIAÇÕES ---
+    def aulas_sem_avaliacao(self, user_id, desde, ate):
+        """Colunas: id, Data, Horario, Tipo dos treinos do período ainda não avaliados."""
+        raise NotImplementedError
+
+    def inserir_avaliacao(self, id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario, data_avaliacao, user_id):
+        raise NotImplementedError
+
+    def carregar_avaliacoes(self):
+        """Colunas: Modalidade, Nota, Comentario, NomeAluno, DataAula, DataAvaliacao, UserId."""
+        raise NotImplementedError
+
+    def avaliacoes_diarias(self, inicio=None, fim=None):
+        """
+        Colunas: Dia (date), Modalidade, Quantidade, Soma (das notas), Nota1..Nota5,
+        por dia da avaliação, no período (datas opcionais).
+        """
+        raise NotImplementedError
+
+    def avaliacoes_desde(self, id_minimo):
+        """Colunas: id, Modalidade, Nota, Comentario, DataAula das avaliações com comentário e id > id_minimo."""
+        raise NotImplementedError
+
+    def comentarios_avaliacoes(self, inicio=None, fim=None, user_id=None, limite=200):
+        """
+        Colunas de carregar_avaliacoes, só das avaliações com comentário, mais
+        recentes primeiro: do aluno e/ou do período (data da avaliação), até 'limite'.
+        """
+        raise NotImplementedError
+
+    # --- CHECK-INS (checkin.py) ---
+    def inserir_checkins(self, linhas):
+        """Grava um lote de check-ins numa transação só. Cada linha: user_id, momento (datetime), origem."""
+        raise NotImplementedError
+
+    def frequencia_aluno(self, user_id, hoje):
+        """
+        Dict com checkins (dias com check-in), ultimo_checkin (date ou None),
+        reservas (antes de 'hoje') e faltas (dessas reservas, as sem check-in no dia).
+        """
+        raise NotImplementedError
+
+    def frequencia_periodo(self, inicio, fim, hoje, tipos=None):
+        """Como frequencia_aluno, somado para a unidade no período (reservas só até ontem)."""
+        raise NotImplementedError
+
+    # --- ENGAJAMENTO ---
+    def engajamento_aluno(self, user_id):
+        """Dict com total, primeira_visita e ultima_visita (date), ou None sem treinos."""
+        raise NotImplementedError
+
+    def buscar_alunos(self, termo, limite):
+        """
+        Colunas: id, nome, email dos até 'limite' usuários cujo nome ou e-mail
+        contém 'termo' (já em minúsculas e sem acento), começos de nome primeiro.
+        """
+        raise NotImplementedError
+
+    def alunos_em_risco(self, hoje, de, ate):
+        """Colunas: Nome, Email, UltimaVisita, DiasSemVir, Total (última visita entre de e ate)."""
+        raise NotImplementedError
+
+
+def criar_armazenamento(tipo=None, unidade=None):
+    """
+    Cria o backend pedido (ou o de NAALLI_ARMAZENAMENTO) para a unidade
+    (padrão: a primeira de NAALLI_UNIDADES). Importa só o que vai usar.
+    """
+    tipo = tipo or os.environ.get("NAALLI_ARMAZENAMENTO", "postgres")
+    unidade = unidade or UNIDADE_PADRAO
+    if unidade not in UNIDADES:
+        raise ValueError(f"Unidade desconhecida: {unidade} (NAALLI_UNIDADES = {', '.join(UNIDADES)})")
+    if tipo == "postgres":
+        from armazenamento_postgres import ArmazenamentoPostgres
+        return ArmazenamentoPostgres(unidade)
+    if tipo == "sqlite":
+        from armazenamento_sqlite import ArmazenamentoSQLite
+        caminho = config_unidade("NAALLI_SQLITE_PATH", unidade) or os.environ.get("NAALLI_SQLITE_PATH", ":memory:")
+        return ArmazenamentoSQLite(caminho, unidade)
+    raise ValueError(f"Armazenamento inválido: {tipo}")
+
+# ==========================================
+# DIAGNÓSTICO: CONSULTAS POR THREAD
+# ==========================================
+# O Streamlit roda cada sessão em sua própria thread, então um contador
+# por thread mede só as consultas da interação atual (ver utils.medir_execucao).
+metricas_thread = threading.local()
+
+def _contar_consulta(*args):
+    metricas_thread.consultas = getattr(metricas_thread, "consultas", 0) + 1
+
+def registrar_contador_consultas(engine):
+    if not event.contains(engine, "before_cursor_execute", _contar_consulta):
+        event.listen(engine, "before_cursor_execute", _contar_consulta)
@@ -0,0 +1,1486 @@
+import os
+import random
+import threading
+import time
+import zlib
+import pandas as pd
+from datetime import datetime, date, timedelta
+import streamlit as st
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError, IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+from armazenamento import Armazenamento, registrar_contador_consultas, config_unidade, UNIDADE_PADRAO
+from capacidade import MODELOS_PADRAO
+
+# ==========================================
+# ARMAZENAMENTO POSTGRES (PRODUÇÃO)
+# ==========================================
+# Implementação de armazenamento.Armazenamento sobre o Postgres (Neon).
+# Aqui também ficam o esquema, as partições mensais e a manutenção do
+# engajamento, usados pelas ferramentas de linha de comando
+# (particoes.py, exportar.py, tarefas.py, gerar_dados.py).
+
+# ==========================================
+# 0. FUNÇÃO DE CONEXÃO ROBUSTA (UNIVERSAL)
+# ==========================================
+def get_db_url(unidade=None):
+    """
+    Função inteligente que busca a credencial no Render (Variável de Ambiente)
+    ou no Local (secrets.toml), corrigindo bugs do SQLAlchemy.
+    Com 'unidade', vale antes o banco próprio dela (DATABASE_URL_<UNIDADE> ou
+    [connections.postgres_<unidade>] no secrets.toml), se configurado.
+    """
+    if unidade:
+        db_url = config_unidade("DATABASE_URL", unidade)
+        if not db_url:
+            try:
+                db_url = st.secrets["connections"][f"postgres_{unidade}"]["url"]
+            except Exception:
+                pass
+        if db_url:
+            return corrigir_url(db_url)
+
+    # 1. Tenta pegar do Render (Variável de Ambiente)
+    db_url = os.environ.get("DATABASE_URL")
+
+    # 2. Se não achou (estamos Local), tenta pegar do secrets.toml
+    if not db_url:
+        try:
+            # Tenta pegar com o nome 'postgres' OU 'postgresql' para garantir
+            if "connections" in st.secrets:
+                if "postgres" in st.secrets["connections"]:
+                    db_url = st.secrets["connections"]["postgres"]["url"]
+                elif "postgresql" in st.secrets["connections"]:
+                    db_url = st.secrets["connections"]["postgresql"]["url"]
+        except:
+            # Se der erro ao ler secrets, ignoramos por enquanto
+            pass
+    
+    return corrigir_url(db_url)
+
+def corrigir_url(db_url):
+    # Correção do bug do SQLAlchemy (postgres:// -> postgresql://)
+    # O Render/Neon costuma mandar postgres://, mas o Python exige postgresql://
+    if db_url and db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    return db_url
+
+def get_db_replica_url(unidade=None):
+    """
+    Réplica de leitura opcional: DATABASE_REPLICA_URL (Render) ou
+    'replica_url' na mesma seção do secrets.toml. None = tudo no primário.
+    Unidade com banco próprio só usa a réplica própria (DATABASE_REPLICA_URL_<UNIDADE>).
+    """
+    if unidade:
+        db_url = config_unidade("DATABASE_REPLICA_URL", unidade)
+        if db_url or get_db_url(unidade) != get_db_url():
+            return corrigir_url(db_url)
+
+    db_url = os.environ.get("DATABASE_REPLICA_URL")
+    if not db_url:
+        try:
+            for secao in ("postgres", "postgresql"):
+                if secao in st.secrets.get("connections", {}):
+                    db_url = st.secrets["connections"][secao].get("replica_url")
+                    break
+        except:
+            pass
+    return corrigir_url(db_url)
+
+def get_db_connection(unidade=None):
+    db_url = get_db_url(unidade)
+
+    # Verifica se a URL foi encontrada antes de conectar
+    if not db_url:
+        # Se chegamos aqui sem URL, o app vai quebrar, então avisamos
+        st.error("Erro Crítico: Não foi possível encontrar a URL do Banco de Dados.")
+        st.stop()
+
+    # Retorna a conexão configurada
+    return ConexaoPostgres(db_url)
+
+# ==========================================
+# POOL DE CONEXÕES (NEON)
+# ==========================================
+# O Neon suspende o banco ocioso: a primeira consulta depois disso demora
+# ou falha. Um único pool por processo, com pre-ping, reciclagem e timeout
+# por comando; um keep-alive em segundo plano; e nova tentativa com espera
+# crescente nas leituras (conn.query). Escritas (conn.session) não são
+# repetidas: depois de uma queda não dá para saber se o COMMIT chegou.
+# Tudo configurável por variável de ambiente, ao lado do DATABASE_URL.
+
+CONFIG_POOL = {
+    "tamanho": int(os.environ.get("NAALLI_POOL_TAMANHO", 5)),
+    "extra": int(os.environ.get("NAALLI_POOL_EXTRA", 5)),                    # Conexões além do tamanho nos picos
+    "reciclar_s": int(os.environ.get("NAALLI_POOL_RECICLAR_S", 240)),        # O Neon derruba conexões ociosas
+    "timeout_comando_ms": int(os.environ.get("NAALLI_STATEMENT_TIMEOUT_MS", 15000)),
+    "timeout_conexao_s": int(os.environ.get("NAALLI_CONNECT_TIMEOUT_S", 10)),
+    "keepalive_s": int(os.environ.get("NAALLI_KEEPALIVE_S", 240)),           # 0 desliga (o Neon volta a suspender)
+    "tentativas": int(os.environ.get("NAALLI_TENTATIVAS_LEITURA", 4)),
+}
+ESPERA_INICIAL_S = 0.5
+ESPERA_MAXIMA_S = 8
+
+def erro_transitorio(e):
+    """Queda, reinício ou conexão morta. Timeout de comando não conta: repetir só pioraria."""
+    if getattr(getattr(e, "orig", None), "pgcode", None) == "57014": # query_canceled
+        return False
+    return isinstance(e, (OperationalError, InterfaceError)) or getattr(e, "connection_invalidated", False)
+
+class ConexaoPostgres:
+    """Pool compartilhado com a mesma cara do st.connection: query(), session e engine."""
+
+    def __init__(self, db_url, config=None):
+        self.config = dict(CONFIG_POOL, **(config or {}))
+        self.engine = create_engine(
+            db_url,
+            pool_size=self.config["tamanho"],
+            max_overflow=self.config["extra"],
+            pool_recycle=self.config["reciclar_s"],
+            pool_pre_ping=True,
+            connect_args={"connect_timeout": self.config["timeout_conexao_s"]},
+        )
+        event.listen(self.engine, "connect", self._ao_conectar)
+        self.contadores = {
+            "conexoes_abertas": 0, "leituras_repetidas": 0, "falhas_leitura": 0,
+            "ultima_falha": None, "keepalive_ok_em": None,
+        }
+        if self.config["keepalive_s"] > 0:
+            threading.Thread(target=self._manter_viva, name="naalli-keepalive", daemon=True).start()
+
+    def _ao_conectar(self, dbapi_conn, _registro):
+        self.contadores["conexoes_abertas"] += 1
+        with dbapi_conn.cursor() as cur:
+            cur.execute(f"SET statement_timeout = {int(self.config['timeout_comando_ms'])}")
+        dbapi_conn.commit() # Sem isso o rollback da devolução ao pool desfaz o SET
+
+    @property
+    def session(self):
+        return Session(self.engine)
+
+    def query(self, sql, params=None, ttl=0):
+        """
+        SELECT -> DataFrame, repetindo em falhas transitórias com espera
+        crescente. 'ttl' fica só pela compatibilidade com st.connection:
+        nada é cacheado aqui.
+        """
+        espera = ESPERA_INICIAL_S
+        for tentativa in range(1, self.config["tentativas"] + 1):
+            try:
+                with self.engine.connect() as c:
+                    return pd.read_sql(text(sql), c, params=params)
+            except DBAPIError as e:
+                if tentativa == self.config["tentativas"] or not erro_transitorio(e):
+                    self.contadores["falhas_leitura"] += 1
+                    self.contadores["ultima_falha"] = f"{datetime.now():%d/%m %H:%M:%S} {type(e.orig).__name__}"
+                    raise
+                self.contadores["leituras_repetidas"] += 1
+                time.sleep(espera + random.uniform(0, espera / 2))
+                espera = min(espera * 2, ESPERA_MAXIMA_S)
+
+    def _manter_viva(self):
+        while True:
+            time.sleep(self.config["keepalive_s"])
+            try:
+                self.query("SELECT 1")
+                self.contadores["keepalive_ok_em"] = f"{datetime.now():%d/%m %H:%M:%S}"
+            except Exception as e:
+                print(f"Keep-alive do banco falhou: {e}")
+
+    def metricas(self):
+        pool = self.engine.pool
+        return {
+            "tamanho": pool.size(), "em_uso": pool.checkedout(), "ociosas": pool.checkedin(),
+            "extra_em_uso": max(pool.overflow(), 0), **self.contadores,
+        }
+
+# ==========================================
+# CONFIGURAÇÃO GLOBAL
+# ==========================================
+# A conexão só é aberta no primeiro uso (importar o módulo não conecta).
+# Um pool por URL: unidades no mesmo banco dividem o pool. No primeiro uso
+# de cada banco as tabelas são criadas/atualizadas; no de cada unidade, as
+# partições e os dados iniciais dela. 'conn' é a conexão da unidade padrão.
+_conexoes = {}        # URL -> ConexaoPostgres
+_abertas = {}         # unidade -> ConexaoPostgres (inicialização em andamento ou pronta)
+_prontas = {}         # unidade -> ConexaoPostgres já inicializada
+_lock_conexao = threading.RLock()
+
+def get_conexao(unidade=None):
+    unidade = unidade or UNIDADE_PADRAO
+    conexao = _prontas.get(unidade)
+    if conexao is not None:
+        return conexao
+    with _lock_conexao:
+        if unidade in _abertas:
+            # A inicialização usa get_conexao: a mesma thread entra de novo aqui
+            # (RLock) e recebe a conexão já aberta; as outras esperam o fim
+            return _abertas[unidade]
+        db_url = get_db_url(unidade)
+        conexao = _conexoes.get(db_url)
+        novo_banco = conexao is None
+        if novo_banco:
+            conexao = get_db_connection(unidade)
+            registrar_contador_consultas(conexao.engine)
+            _conexoes[db_url] = conexao
+        _abertas[unidade] = conexao
+        try:
+            if novo_banco:
+                inicializar_banco(unidade)
+            inicializar_unidade(unidade)
+        except Exception:
+            del _abertas[unidade]
+            raise
+        _prontas[unidade] = conexao
+    return conexao
+
+class _ConexaoPreguicosa:
+    """Repassa tudo para a ConexaoPostgres da unidade, aberta só no primeiro acesso."""
+    def __init__(self, unidade=None):
+        self.unidade = unidade
+
+    def __getattr__(self, nome):
+        return getattr(get_conexao(self.unidade), nome)
+
+conn = _ConexaoPreguicosa()
+
+# ==========================================
+# RÉPLICA DE LEITURA (OPCIONAL)
+# ==========================================
+# Painel do admin e histórico leem da réplica, se houver, para não
+# disputar o primário com as reservas da manhã. Reservas, cancelamentos,
+# login e tudo que decide uma escrita continuam em 'conn'.
+# Staleness limitada: a réplica só é usada enquanto o atraso de replay
+# estiver abaixo de NAALLI_REPLICA_ATRASO_MAX_S; acima disso (ou se ela
+# cair) as leituras voltam ao primário até a próxima verificação.
+
+REPLICA_ATRASO_MAX_S = float(os.environ.get("NAALLI_REPLICA_ATRASO_MAX_S", 30))
+INTERVALO_VERIFICACAO_REPLICA_S = 5
+
+# Réplica sem nada para aplicar está em dia, mesmo com o último replay antigo (primário ocioso)
+SQL_ATRASO_REPLICA = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS atraso
+"""
+
+class ConexaoReplica(ConexaoPostgres):
+    """Pool da réplica com o atraso medido a cada poucos segundos."""
+
+    def __init__(self, db_url, atraso_max_s=REPLICA_ATRASO_MAX_S):
+        # Uma tentativa só: na falha quem responde é o primário, não a espera
+        super().__init__(db_url, {"tentativas": 1})
+        self.atraso_max_s = atraso_max_s
+        self.atraso_s = None
+        self._verificada_em = None
+        self.contadores.update({"leituras_replica": 0, "desvios_primario": 0})
+
+    def disponivel(self):
+        agora = time.monotonic()
+        if self._verificada_em is None or agora - self._verificada_em > INTERVALO_VERIFICACAO_REPLICA_S:
+            try:
+                self.atraso_s = float(self.query(SQL_ATRASO_REPLICA).iloc[0, 0])
+            except Exception:
+                self.atraso_s = None
+            self._verificada_em = agora
+        return self.atraso_s is not None and self.atraso_s <= self.atraso_max_s
+
+    def marcar_indisponivel(self):
+        self.atraso_s = None
+        self._verificada_em = time.monotonic()
+
+    def metricas(self):
+        return {**super().metricas(), "atraso_s": self.atraso_s, "atraso_max_s": self.atraso_max_s}
+
+_replicas = {}          # URL -> ConexaoReplica
+_replica_unidade = {}   # unidade -> ConexaoReplica ou None (sem réplica)
+
+def get_replica(unidade=None):
+    unidade = unidade or UNIDADE_PADRAO
+    if unidade in _replica_unidade:
+        return _replica_unidade[unidade]
+    with _lock_conexao:
+        if unidade not in _replica_unidade:
+            db_url = get_db_replica_url(unidade)
+            if db_url and db_url not in _replicas:
+                _replicas[db_url] = ConexaoReplica(db_url)
+                registrar_contador_consultas(_replicas[db_url].engine)
+            _replica_unidade[unidade] = _replicas.get(db_url)
+    return _replica_unidade[unidade]
+
+class _ConexaoLeitura:
+    """query() na réplica quando ela está em dia; senão no primário."""
+
+    def __init__(self, unidade=None):
+        self.unidade = unidade
+
+    def query(self, sql, params=None, ttl=0):
+        primario = get_conexao(self.unidade) # Esquema criado/atualizado pelo primário antes da primeira leitura
+        replica = get_replica(self.unidade)
+        if replica is not None:
+            if replica.disponivel():
+                try:
+                    df = replica.query(sql, params)
+                    replica.contadores["leituras_replica"] += 1
+                    return df
+                except DBAPIError as e:
+                    # Queda ou conflito com o replay: lê do primário desta vez
+                    if not erro_transitorio(e):
+                        raise
+                    replica.marcar_indisponivel()
+            replica.contadores["desvios_primario"] += 1
+        return primario.query(sql, params)
+
+conn_leitura = _ConexaoLeitura()
+
+# ==========================================
+# 1. ESQUEMA
+# ==========================================
+
+# 'data' continua em texto DD/MM/YYYY para o Frontend; 'dia' é a mesma data
+# como DATE. Particionada por unidade e, dentro dela, por mês
+# (ver PARTIÇÕES abaixo).
+SQL_CRIAR_AGENDAMENTOS = """
+    CREATE TABLE IF NOT EXISTS agendamentos (
+        id SERIAL,
+        unidade TEXT NOT NULL,
+        data TEXT,
+        horario TEXT,
+        numero INTEGER,
+        tipo TEXT,
+        nome TEXT,
+        pin TEXT,
+        criado_em TEXT,
+        dia DATE NOT NULL,
+        user_id INTEGER REFERENCES users (id),
+        PRIMARY KEY (unidade, id, dia)
+    ) PARTITION BY LIST (unidade);
+"""
+
+# Usuários cujo nome não se repete: só eles podem ser casados com o nome
+# livre de registros antigos sem risco de atribuir ao homônimo errado.
+SQL_USUARIOS_NOME_UNICO = "SELECT min(id) AS id, nome FROM users GROUP BY nome HAVING count(*) = 1"
+
+# Mesma normalização de utils.texto_busca (acentos do português)
+SQL_TEXTO_BUSCA = "translate(lower(coalesce(nome, '') || ' ' || email), 'áàâãäéèêëíìîïóòôõöúùûüçñ', 'aaaaaeeeeiiiiooooouuuucn')"
+
+# Trecho em qualquer lugar; com pg_trgm, também palavras parecidas ("silvia" acha "silva").
+# Ordem: começo do nome, começo de outra palavra, semelhança, quem treina mais na unidade.
+SQL_BUSCAR_ALUNOS = """
+    SELECT u.id, u.nome, u.email
+    FROM users u LEFT JOIN engajamento_aluno e ON e.unidade = :unidade AND e.user_id = u.id
+    WHERE u.busca LIKE :contem {parecidos}
+    ORDER BY u.busca LIKE :prefixo DESC, u.busca LIKE :palavra DESC, {semelhanca} COALESCE(e.total, 0) DESC, u.nome
+    LIMIT :limite
+"""
+
+SQL_INSERIR_MODELO_HORARIO = """
+    INSERT INTO modelos_horario (unidade, dia_semana, dia, hora_inicio, hora_fim, layout)
+    VALUES (:unidade, :dia_semana, :dia, :hora_inicio, :hora_fim, :layout)
+"""
+
+def _adicionar_unidade(s, tabela):
+    """
+    Bancos de antes das unidades: a tabela ganha a coluna 'unidade' com os
+    dados existentes na unidade padrão. True se a coluna foi criada agora
+    (os índices e chaves antigos da tabela precisam ser refeitos).
+    """
+    existe = s.execute(text(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = :t AND column_name = 'unidade'"
+    ), params={"t": tabela}).first()
+    if existe:
+        return False
+    s.execute(text(f"ALTER TABLE {tabela} ADD COLUMN unidade TEXT NOT NULL DEFAULT '{UNIDADE_PADRAO}'"))
+    s.execute(text(f"ALTER TABLE {tabela} ALTER COLUMN unidade DROP DEFAULT"))
+    return True
+
+def inicializar_banco(unidade=None):
+    """Cria as tabelas no Neon se não existirem (uma vez por banco; 'unidade' escolhe o banco)."""
+    conexao = get_conexao(unidade)
+    # Busca de alunos por trecho do nome (índice de trigramas). Sem permissão
+    # para a extensão, a busca continua funcionando, só que sem índice.
+    try:
+        with conexao.session as s:
+            s.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            s.commit()
+    except Exception as e:
+        print(f"⚠️ pg_trgm indisponível, busca de alunos sem índice: {e}")
+
+    try:
+        with conexao.session as s:
+            # Tabela Usuários (contas do banco, valem em todas as unidades dele)
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS users (
+                    email TEXT PRIMARY KEY,
+                    id SERIAL UNIQUE,
+                    nome TEXT,
+                    senha TEXT,
+                    mudar_senha BOOLEAN,
+                    tipo TEXT
+                );
+            """))
+            # Bancos antigos: 'users' ganha a chave inteira usada por agendamentos/avaliações
+            tem_id = s.execute(text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'users' AND column_name = 'id'"
+            )).first()
+            if not tem_id:
+                s.execute(text("ALTER TABLE users ADD COLUMN id SERIAL UNIQUE"))
+            # Nome + e-mail em minúsculas e sem acento, para a busca do painel
+            s.execute(text(f"ALTER TABLE users ADD COLUMN IF NOT EXISTS busca TEXT GENERATED ALWAYS AS ({SQL_TEXTO_BUSCA}) STORED"))
+            if s.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+                s.execute(text("CREATE INDEX IF NOT EXISTS idx_users_busca ON users USING gin (busca gin_trgm_ops)"))
+            
+            # Tabela Agendamentos (particionada por unidade e, dentro dela, por mês)
+            s.execute(text(SQL_CRIAR_AGENDAMENTOS))
+
+            # Bancos antigos (tabela sem partição): ganha a coluna 'dia' aqui e
+            # pode ser convertida depois com 'python particoes.py migrar'
+            tem_dia = s.execute(text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'agendamentos' AND column_name = 'dia'"
+            )).first()
+            if not tem_dia:
+                s.execute(text("ALTER TABLE agendamentos ADD COLUMN dia DATE"))
+                s.execute(text("UPDATE agendamentos SET dia = to_date(data, 'DD/MM/YYYY') WHERE dia IS NULL"))
+
+            # user_id novo em bancos antigos: preenchido a partir do nome logo abaixo
+            novo_user_id = not s.execute(text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'agendamentos' AND column_name = 'user_id'"
+            )).first()
+            if novo_user_id:
+                s.execute(text("ALTER TABLE agendamentos ADD COLUMN user_id INTEGER REFERENCES users (id)"))
+            # Bancos de antes das unidades: índices refeitos com a unidade na frente.
+            # A chave primária e a partição por unidade vêm com 'python particoes.py migrar'
+            if _adicionar_unidade(s, "agendamentos"):
+                s.execute(text("DROP INDEX IF EXISTS idx_agendamentos_dia, idx_agendamentos_user, idx_agendamentos_vaga"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_agendamentos_dia ON agendamentos (unidade, dia, horario)"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_agendamentos_user ON agendamentos (unidade, user_id, dia)"))
+            # Uma reserva por aparelho: a última palavra contra reservas simultâneas da mesma vaga.
+            # Bancos antigos com vaga duplicada ficam sem o índice até alguém resolver à mão.
+            if not s.execute(text("SELECT to_regclass('idx_agendamentos_vaga')")).scalar():
+                if s.execute(text(SQL_VAGAS_DUPLICADAS)).first():
+                    print("⚠️ Há reservas duplicadas na mesma vaga: índice único idx_agendamentos_vaga não criado.")
+                else:
+                    s.execute(text("CREATE UNIQUE INDEX idx_agendamentos_vaga ON agendamentos (unidade, dia, horario, numero, tipo)"))
+            # As consultas por aluno usam user_id; o índice por nome não é mais lido
+            s.execute(text("DROP INDEX IF EXISTS idx_agendamentos_nome"))
+            
+            # Tabela Avaliações
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS avaliacoes (
+                    id SERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    id_agendamento INTEGER,
+                    nome_aluno TEXT,
+                    data_aula TEXT,
+                    modalidade TEXT,
+                    nota INTEGER,
+                    comentario TEXT,
+                    data_avaliacao TEXT,
+                    user_id INTEGER REFERENCES users (id)
+                );
+            """))
+            if novo_user_id:
+                s.execute(text("ALTER TABLE avaliacoes ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users (id)"))
+            if _adicionar_unidade(s, "avaliacoes"):
+                s.execute(text("DROP INDEX IF EXISTS idx_avaliacoes_user"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_avaliacoes_user ON avaliacoes (unidade, user_id, id_agendamento)"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_avaliacoes_unidade ON avaliacoes (unidade, id)"))
+
+            # Avaliações somadas por dia e modalidade (gráficos de qualidade):
+            # mantida a cada avaliação e reconciliada à noite (tarefas.py)
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS avaliacoes_diarias (
+                    unidade TEXT NOT NULL,
+                    dia DATE NOT NULL,
+                    modalidade TEXT NOT NULL,
+                    quantidade INTEGER NOT NULL DEFAULT 0,
+                    soma_notas INTEGER NOT NULL DEFAULT 0,
+                    nota_1 INTEGER NOT NULL DEFAULT 0,
+                    nota_2 INTEGER NOT NULL DEFAULT 0,
+                    nota_3 INTEGER NOT NULL DEFAULT 0,
+                    nota_4 INTEGER NOT NULL DEFAULT 0,
+                    nota_5 INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (unidade, dia, modalidade)
+                );
+            """))
+            if _adicionar_unidade(s, "avaliacoes_diarias"):
+                s.execute(text("ALTER TABLE avaliacoes_diarias DROP CONSTRAINT avaliacoes_diarias_pkey, ADD PRIMARY KEY (unidade, dia, modalidade)"))
+
+            # Capacidade e horários de funcionamento de cada unidade (ver capacidade.py)
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS modelos_horario (
+                    id SERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    dia_semana SMALLINT CHECK (dia_semana BETWEEN 0 AND 6),
+                    dia DATE,
+                    hora_inicio TEXT NOT NULL,
+                    hora_fim TEXT NOT NULL,
+                    layout TEXT NOT NULL DEFAULT '',
+                    atualizado_em TIMESTAMP NOT NULL DEFAULT now(),
+                    CHECK (dia_semana IS NOT NULL OR dia IS NOT NULL)
+                );
+            """))
+            _adicionar_unidade(s, "modelos_horario")
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_modelos_horario_unidade ON modelos_horario (unidade, id)"))
+
+            # Fechamentos (feriado, manutenção): faixa de horários de um dia,
+            # de todos os aparelhos ou de um tipo/número. Reservas novas nessa faixa são recusadas.
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS bloqueios (
+                    id SERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    dia DATE NOT NULL,
+                    hora_inicio TEXT NOT NULL,
+                    hora_fim TEXT NOT NULL,
+                    tipo TEXT,
+                    numero INTEGER,
+                    motivo TEXT,
+                    criado_por TEXT,
+                    criado_em TIMESTAMP NOT NULL DEFAULT now()
+                );
+            """))
+            if _adicionar_unidade(s, "bloqueios"):
+                s.execute(text("DROP INDEX IF EXISTS idx_bloqueios_dia"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_bloqueios_dia ON bloqueios (unidade, dia)"))
+
+            # Avisos a enviar aos alunos (utils.enviar_notificacoes_pendentes, via tarefas.py)
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS fila_notificacoes (
+                    id SERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    user_id INTEGER NOT NULL REFERENCES users (id),
+                    evento TEXT NOT NULL,
+                    data TEXT,
+                    horario TEXT,
+                    tipo TEXT,
+                    numero INTEGER,
+                    motivo TEXT,
+                    criado_em TIMESTAMP NOT NULL DEFAULT now(),
+                    enviado_em TIMESTAMP
+                );
+            """))
+            if _adicionar_unidade(s, "fila_notificacoes"):
+                s.execute(text("DROP INDEX IF EXISTS idx_fila_notificacoes_pendentes"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_fila_notificacoes_pendentes ON fila_notificacoes (unidade, id) WHERE enviado_em IS NULL"))
+
+            # Lista de espera por (dia, horário, tipo): a ordem da fila é o id
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS lista_espera (
+                    id SERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    dia DATE NOT NULL,
+                    horario TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    user_id INTEGER NOT NULL REFERENCES users (id),
+                    nome TEXT,
+                    criado_em TIMESTAMP NOT NULL DEFAULT now(),
+                    UNIQUE (unidade, dia, horario, tipo, user_id)
+                );
+            """))
+            if _adicionar_unidade(s, "lista_espera"):
+                s.execute(text("DROP INDEX IF EXISTS idx_lista_espera_fila"))
+                s.execute(text("""
+                    ALTER TABLE lista_espera DROP CONSTRAINT lista_espera_dia_horario_tipo_user_id_key,
+                        ADD UNIQUE (unidade, dia, horario, tipo, user_id)
+                """))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_lista_espera_fila ON lista_espera (unidade, dia, horario, tipo, id)"))
+
+            # Check-ins da recepção, gravados em lotes (e sem FK) por checkin.py
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS checkins (
+                    id BIGSERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    dia DATE NOT NULL,
+                    registrado_em TIMESTAMP NOT NULL,
+                    origem TEXT NOT NULL DEFAULT 'recepcao',
+                    gravado_em TIMESTAMP NOT NULL DEFAULT now()
+                );
+            """))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_checkins_user ON checkins (unidade, user_id, dia)"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_checkins_dia ON checkins (unidade, dia)"))
+
+            # Histórico do agendador de tarefas (agendador.py). A chave única
+            # (unidade, tarefa, agendada_para) é o que impede dois workers de
+            # rodarem o mesmo horário da mesma tarefa
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS execucoes_tarefas (
+                    id BIGSERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    tarefa TEXT NOT NULL,
+                    agendada_para TIMESTAMP NOT NULL,
+                    situacao TEXT NOT NULL,
+                    inicio TIMESTAMP NOT NULL DEFAULT now(),
+                    fim TIMESTAMP,
+                    duracao_ms INTEGER,
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    resultado TEXT,
+                    erro TEXT,
+                    maquina TEXT,
+                    UNIQUE (unidade, tarefa, agendada_para)
+                );
+            """))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_execucoes_tarefas_recentes ON execucoes_tarefas (unidade, tarefa, inicio DESC)"))
+
+            # Feed de mudanças: todo INSERT/UPDATE/DELETE em agendamentos
+            # dispara um NOTIFY no canal 'agendamentos_mudancas' (ver tempo_real.py)
+            s.execute(text("""
+                CREATE OR REPLACE FUNCTION notificar_agendamento() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                        PERFORM pg_notify('agendamentos_mudancas', json_build_object(
+                            'op', 'DELETE', 'id', OLD.id, 'unidade', OLD.unidade, 'data', OLD.data, 'horario', OLD.horario,
+                            'numero', OLD.numero, 'tipo', OLD.tipo, 'nome', OLD.nome, 'user_id', OLD.user_id
+                        )::text);
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        PERFORM pg_notify('agendamentos_mudancas', json_build_object(
+                            'op', 'INSERT', 'id', NEW.id, 'unidade', NEW.unidade, 'data', NEW.data, 'horario', NEW.horario,
+                            'numero', NEW.numero, 'tipo', NEW.tipo, 'nome', NEW.nome, 'user_id', NEW.user_id
+                        )::text);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """))
+            s.execute(text("""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_trigger
+                        WHERE tgname = 'trg_notificar_agendamento' AND tgrelid = 'agendamentos'::regclass
+                    ) THEN
+                        CREATE TRIGGER trg_notificar_agendamento
+                            AFTER INSERT OR UPDATE OR DELETE ON agendamentos
+                            FOR EACH ROW EXECUTE FUNCTION notificar_agendamento();
+                    END IF;
+                END;
+                $$;
+            """))
+
+            # Lápides das remoções: o instantâneo em memória (instantaneo.py)
+            # lê daqui o que saiu desde a última atualização
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS agendamentos_removidos (
+                    seq BIGSERIAL PRIMARY KEY,
+                    unidade TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    removido_em TIMESTAMP NOT NULL DEFAULT now()
+                );
+            """))
+            _adicionar_unidade(s, "agendamentos_removidos")
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_agendamentos_removidos_unidade ON agendamentos_removidos (unidade, seq)"))
+            s.execute(text("""
+                CREATE OR REPLACE FUNCTION registrar_remocao_agendamento() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO agendamentos_removidos (unidade, id) VALUES (OLD.unidade, OLD.id);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """))
+            s.execute(text("""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_trigger
+                        WHERE tgname = 'trg_remocao_agendamento' AND tgrelid = 'agendamentos'::regclass
+                    ) THEN
+                        CREATE TRIGGER trg_remocao_agendamento
+                            AFTER DELETE ON agendamentos
+                            FOR EACH ROW EXECUTE FUNCTION registrar_remocao_agendamento();
+                    END IF;
+                END;
+                $$;
+            """))
+
+            # Engajamento por aluno em cada unidade (derivado de agendamentos): mantido a cada
+            # reserva/cancelamento e reconciliado à noite (tarefas.py).
+            # As colunas arq_* guardam a parte do histórico já arquivada em Parquet.
+            s.execute(text("""
+                CREATE TABLE IF NOT EXISTS engajamento_aluno (
+                    unidade TEXT NOT NULL,
+                    user_id INTEGER REFERENCES users (id),
+                    total INTEGER NOT NULL DEFAULT 0,
+                    primeira_visita DATE,
+                    ultima_visita DATE,
+                    arq_total INTEGER NOT NULL DEFAULT 0,
+                    arq_primeira DATE,
+                    arq_ultima DATE,
+                    atualizado_em TIMESTAMP DEFAULT now(),
+                    PRIMARY KEY (unidade, user_id)
+                );
+            """))
+            # Versão anterior era chaveada por nome: converte mantendo as colunas arq_*
+            tem_nome = s.execute(text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'engajamento_aluno' AND column_name = 'nome'"
+            )).first()
+            if tem_nome:
+                s.execute(text("ALTER TABLE engajamento_aluno ADD COLUMN user_id INTEGER REFERENCES users (id)"))
+                s.execute(text(f"UPDATE engajamento_aluno e SET user_id = u.id FROM ({SQL_USUARIOS_NOME_UNICO}) u WHERE u.nome = e.nome"))
+                s.execute(text("DELETE FROM engajamento_aluno WHERE user_id IS NULL"))
+                s.execute(text("ALTER TABLE engajamento_aluno DROP COLUMN nome"))
+                s.execute(text("ALTER TABLE engajamento_aluno ADD PRIMARY KEY (user_id)"))
+            if _adicionar_unidade(s, "engajamento_aluno"):
+                s.execute(text("DROP INDEX IF EXISTS idx_engajamento_ultima"))
+                s.execute(text("ALTER TABLE engajamento_aluno DROP CONSTRAINT engajamento_aluno_pkey, ADD PRIMARY KEY (unidade, user_id)"))
+            s.execute(text("CREATE INDEX IF NOT EXISTS idx_engajamento_ultima ON engajamento_aluno (unidade, ultima_visita)"))
+            s.commit()
+
+        # Reservas e avaliações gravadas antes do user_id
+        if novo_user_id:
+            preencher_user_id(unidade)
+
+    except Exception as e:
+        st.error(f"Erro ao inicializar banco de dados: {e}")
+
+def inicializar_unidade(unidade=None):
+    """Grade padrão, partições e tabelas derivadas da unidade (no primeiro uso dela no processo)."""
+    unidade = unidade or UNIDADE_PADRAO
+    conexao = get_conexao(unidade)
+    try:
+        # Unidade nova começa com a grade padrão; o admin ajusta depois
+        with conexao.session as s:
+            if not s.execute(text("SELECT 1 FROM modelos_horario WHERE unidade = :unidade LIMIT 1"), params={"unidade": unidade}).first():
+                s.execute(text(SQL_INSERIR_MODELO_HORARIO), [dict(modelo, unidade=unidade) for modelo in MODELOS_PADRAO])
+            s.commit()
+
+        garantir_particoes(unidade=unidade)
+
+        # Primeira vez com as tabelas derivadas: calcula a partir do histórico
+        params = {"unidade": unidade}
+        if conexao.query("SELECT 1 FROM engajamento_aluno WHERE unidade = :unidade LIMIT 1", params).empty:
+            reconciliar_engajamento(unidade)
+        if conexao.query("SELECT 1 FROM avaliacoes_diarias WHERE unidade = :unidade LIMIT 1", params).empty:
+            reconciliar_avaliacoes_diarias(unidade)
+
+    except Exception as e:
+        st.error(f"Erro ao inicializar a unidade {unidade}: {e}")
+
+def preencher_user_id(unidade=None):
+    """
+    Preenche user_id de agendamentos/avaliações antigos a partir do nome.
+    Nomes repetidos em 'users' ficam sem dono (NULL) para não misturar homônimos.
+    Vale para o banco inteiro da unidade (os usuários são do banco).
+    """
+    with get_conexao(unidade).session as s:
+        s.execute(text(f"""
+            UPDATE agendamentos a SET user_id = u.id FROM ({SQL_USUARIOS_NOME_UNICO}) u
+            WHERE a.user_id IS NULL AND a.nome = u.nome
+        """))
+        # Avaliação herda o dono do agendamento avaliado; sem ele, cai no nome
+        s.execute(text("""
+            UPDATE avaliacoes v SET user_id = a.user_id FROM agendamentos a
+            WHERE v.user_id IS NULL AND a.unidade = v.unidade AND a.id = v.id_agendamento AND a.user_id IS NOT NULL
+        """))
+        s.execute(text(f"""
+            UPDATE avaliacoes v SET user_id = u.id FROM ({SQL_USUARIOS_NOME_UNICO}) u
+            WHERE v.user_id IS NULL AND v.nome_aluno = u.nome
+        """))
+        s.commit()
+
+# ==========================================
+# PARTIÇÕES POR UNIDADE E POR MÊS
+# ==========================================
+# 'agendamentos' é particionada por unidade ('agendamentos_<unidade>') e
+# cada unidade por mês ('agendamentos_<unidade>_AAAA_MM'). As partições são
+# criadas sob demanda na primeira reserva do mês e, adiantadas, no primeiro
+# uso da unidade. Bancos de antes das unidades (só por mês, em
+# 'agendamentos_AAAA_MM') continuam funcionando até 'python particoes.py migrar'.
+# Arquivamento e migração de bancos antigos ficam em particoes.py.
+
+MESES_PARTICOES_FUTURAS = 3
+TRAVA_PARTICAO = 7302 # Namespace da trava; a segunda chave é o mês (toordinal do dia 1)
+_particoes_conhecidas = set() # (unidade, primeiro dia do mês)
+
+def particionamento_agendamentos(unidade=None):
+    """'unidade' (por unidade e mês), 'mes' (esquema anterior, só por mês) ou None (tabela sem partição)."""
+    df = get_conexao(unidade).query("SELECT partstrat FROM pg_partitioned_table WHERE partrelid = 'agendamentos'::regclass", ttl=0)
+    if df.empty:
+        return None
+    return "unidade" if df.iloc[0, 0] == "l" else "mes"
+
+def nome_particao(unidade, dia=None):
+    """
+    'agendamentos_<unidade>' ou, com 'dia', a do mês: 'agendamentos_<unidade>_AAAA_MM'.
+    Sem unidade, os nomes do esquema anterior ('agendamentos' e 'agendamentos_AAAA_MM').
+    """
+    nome = f"agendamentos_{unidade}" if unidade else "agendamentos"
+    return f"{nome}_{dia.year:04d}_{dia.month:02d}" if dia else nome
+
+def proximo_mes(dia):
+    return (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def sql_criar_particao_unidade(unidade):
+    return (
+        f"CREATE TABLE IF NOT EXISTS {nome_particao(unidade)} PARTITION OF agendamentos "
+        f"FOR VALUES IN ('{unidade}') PARTITION BY RANGE (dia)"
+    )
+
+def sql_criar_particao(dia, unidade=None):
+    inicio = dia.replace(day=1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {nome_particao(unidade, inicio)} PARTITION OF {nome_particao(unidade)} "
+        f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{proximo_mes(inicio).isoformat()}')"
+    )
+
+def garantir_particao(dia, unidade=None):
+    """Cria (se preciso) a partição da unidade no mês de 'dia'. Lembra por processo para não repetir o DDL."""
+    unidade = unidade or UNIDADE_PADRAO
+    inicio = dia.replace(day=1)
+    if (unidade, inicio) in _particoes_conhecidas:
+        return
+    particionamento = particionamento_agendamentos(unidade)
+    if particionamento:
+        with get_conexao(unidade).session as s:
+            # Duas primeiras reservas do mês ao mesmo tempo: o IF NOT EXISTS sozinho não
+            # impede o "already exists" da segunda; a trava põe uma atrás da outra
+            s.execute(text("SELECT pg_advisory_xact_lock(:ns, :m)"), params={"ns": TRAVA_PARTICAO, "m": inicio.toordinal()})
+            if particionamento == "unidade":
+                s.execute(text(sql_criar_particao_unidade(unidade)))
+                s.execute(text(sql_criar_particao(inicio, unidade)))
+            else:
+                s.execute(text(sql_criar_particao(inicio)))
+            s.commit()
+        _particoes_conhecidas.add((unidade, inicio))
+
+def garantir_particoes(meses_a_frente=MESES_PARTICOES_FUTURAS, unidade=None):
+    """Garante as partições da unidade no mês atual e nos próximos meses."""
+    mes = date.today().replace(day=1)
+    for _ in range(meses_a_frente + 1):
+        garantir_particao(mes, unidade)
+        mes = proximo_mes(mes)
+
+# ==========================================
+# 2. ENGAJAMENTO DOS ALUNOS
+# ==========================================
+# 'engajamento_aluno' guarda total, primeira e última visita de cada aluno
+# em cada unidade. Meu Painel, Raio-X e a lista de alunos em risco leem
+# daqui por chave, em vez de recalcular a partir do histórico inteiro.
+
+SQL_ENGAJAMENTO_RESERVA = """
+    INSERT INTO engajamento_aluno (unidade, user_id, total, primeira_visita, ultima_visita)
+    VALUES (:unidade, :u, 1, :dia, :dia)
+    ON CONFLICT (unidade, user_id) DO UPDATE SET
+        total = engajamento_aluno.total + 1,
+        primeira_visita = LEAST(engajamento_aluno.primeira_visita, EXCLUDED.primeira_visita),
+        ultima_visita = GREATEST(engajamento_aluno.ultima_visita, EXCLUDED.ultima_visita),
+        atualizado_em = now()
+"""
+
+# Roda depois do DELETE: primeira/última visita são relidas pelo índice (unidade, user_id, dia)
+SQL_ENGAJAMENTO_CANCELAMENTO = """
+    UPDATE engajamento_aluno SET
+        total = GREATEST(total - :qtd, 0),
+        primeira_visita = LEAST((SELECT min(dia) FROM agendamentos WHERE unidade = :unidade AND user_id = :u), arq_primeira),
+        ultima_visita = GREATEST((SELECT max(dia) FROM agendamentos WHERE unidade = :unidade AND user_id = :u), arq_ultima),
+        atualizado_em = now()
+    WHERE unidade = :unidade AND user_id = :u
+"""
+
+# ==========================================
+# AVALIAÇÕES POR DIA
+# ==========================================
+# 'avaliacoes_diarias' guarda, por unidade, dia da avaliação e modalidade, a
+# quantidade, a soma e a distribuição das notas. Os gráficos de qualidade
+# leem daqui (semanas e meses são somas desses dias).
+
+SQL_AVALIACAO_DIARIA = """
+    INSERT INTO avaliacoes_diarias (unidade, dia, modalidade, quantidade, soma_notas, nota_1, nota_2, nota_3, nota_4, nota_5)
+    VALUES (:unidade, :dia, :m, 1, :nt, CAST(:nt = 1 AS INTEGER), CAST(:nt = 2 AS INTEGER), CAST(:nt = 3 AS INTEGER),
+            CAST(:nt = 4 AS INTEGER), CAST(:nt = 5 AS INTEGER))
+    ON CONFLICT (unidade, dia, modalidade) DO UPDATE SET
+        quantidade = avaliacoes_diarias.quantidade + 1,
+        soma_notas = avaliacoes_diarias.soma_notas + EXCLUDED.soma_notas,
+        nota_1 = avaliacoes_diarias.nota_1 + EXCLUDED.nota_1,
+        nota_2 = avaliacoes_diarias.nota_2 + EXCLUDED.nota_2,
+        nota_3 = avaliacoes_diarias.nota_3 + EXCLUDED.nota_3,
+        nota_4 = avaliacoes_diarias.nota_4 + EXCLUDED.nota_4,
+        nota_5 = avaliacoes_diarias.nota_5 + EXCLUDED.nota_5
+"""
+
+# ==========================================
+# FECHAMENTOS (BLOQUEIOS)
+# ==========================================
+# Reserva e fechamento do mesmo dia se excluem por uma trava consultiva:
+# reservas pegam a trava compartilhada (não se bloqueiam entre si) e o
+# fechamento a exclusiva. Assim nenhuma reserva em andamento escapa do
+# DELETE, e as seguintes já enxergam o bloqueio gravado.
+TRAVA_AGENDA_DIA = 7301 # Namespace da trava; a segunda chave é (unidade, dia), ver chave_agenda_dia
+
+def chave_agenda_dia(unidade, dia):
+    """Segunda chave da trava: int4 a partir de unidade + dia (colisão só faz duas agendas esperarem uma pela outra)."""
+    return zlib.crc32(f"{unidade}:{dia.isoformat()}".encode()) - 2 ** 31
+
+# tipo/numero NULL no bloqueio = vale para todos
+SQL_VAGA_BLOQUEADA = """
+    SELECT 1 FROM bloqueios
+    WHERE unidade = :unidade AND dia = :dia AND :h BETWEEN hora_inicio AND hora_fim
+      AND (tipo IS NULL OR tipo = :t) AND (numero IS NULL OR numero = :n)
+    LIMIT 1
+"""
+
+# Um DELETE para a faixa inteira; o RETURNING alimenta a fila de avisos na mesma instrução
+SQL_CANCELAR_FAIXA = """
+    WITH cancelados AS (
+        DELETE FROM agendamentos
+        WHERE unidade = :unidade AND dia = :dia AND horario BETWEEN :hi AND :hf
+          AND (:t IS NULL OR tipo = :t) AND (:n IS NULL OR numero = :n)
+        RETURNING data, horario, numero, tipo, nome, user_id
+    ), avisos AS (
+        INSERT INTO fila_notificacoes (unidade, user_id, evento, data, horario, tipo, numero, motivo)
+        SELECT :unidade, user_id, 'cancelamento', data, horario, tipo, numero, :motivo FROM cancelados WHERE user_id IS NOT NULL
+    )
+    SELECT data AS "Data", horario AS "Horario", numero AS "Numero", tipo AS "Tipo", nome AS "Nome", user_id AS "UserId"
+    FROM cancelados ORDER BY horario, tipo, numero
+"""
+
+def limpar_remocoes(dias=7, unidade=None):
+    """Apaga lápides antigas do banco da unidade (o instantâneo recarrega tudo bem antes disso)."""
+    with get_conexao(unidade).session as s:
+        s.execute(text(
+            "DELETE FROM agendamentos_removidos WHERE unidade = :unidade AND removido_em < now() - make_interval(days => :d)"
+        ), params={"unidade": unidade or UNIDADE_PADRAO, "d": dias})
+        s.commit()
+
+def limpar_seed(unidade=None):
+    """Apaga as reservas de demonstração do gerar_dados.py (PIN 'SEED', sem aluno). Devolve quantas."""
+    with get_conexao(unidade).session as s:
+        apagadas = s.execute(text(
+            "DELETE FROM agendamentos WHERE unidade = :unidade AND pin = 'SEED' AND user_id IS NULL"
+        ), params={"unidade": unidade or UNIDADE_PADRAO}).rowcount
+        s.commit()
+    return apagadas
+
+def lembrar_avaliacoes(dia=None, unidade=None):
+    """
+    Põe na fila de avisos um lembrete por aluno com treino em 'dia' (padrão:
+    ontem) ainda sem avaliação. Rodar de novo no mesmo dia não repete avisos.
+    Devolve quantos lembretes entraram.
+    """
+    dia = dia or date.today() - timedelta(days=1)
+    with get_conexao(unidade).session as s:
+        novos = s.execute(text("""
+            INSERT INTO fila_notificacoes (unidade, user_id, evento, data, horario, tipo)
+            SELECT DISTINCT ON (a.user_id) a.unidade, a.user_id, 'avaliacao', a.data, a.horario, a.tipo
+            FROM agendamentos a
+            WHERE a.unidade = :unidade AND a.dia = :dia AND a.user_id IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM avaliacoes v WHERE v.unidade = a.unidade AND v.id_agendamento = a.id)
+              AND NOT EXISTS (
+                  SELECT 1 FROM fila_notificacoes f
+                  WHERE f.unidade = a.unidade AND f.user_id = a.user_id AND f.evento = 'avaliacao' AND f.data = a.data
+              )
+            ORDER BY a.user_id, a.horario
+        """), params={"unidade": unidade or UNIDADE_PADRAO, "dia": dia}).rowcount
+        s.commit()
+    return novos
+
+def reconciliar_engajamento(unidade=None):
+    """
+    Recalcula 'engajamento_aluno' da unidade a partir de agendamentos + parte
+    arquivada. Corrige qualquer desvio da manutenção incremental (rodar à noite).
+    """
+    unidade = unidade or UNIDADE_PADRAO
+    with get_conexao(unidade).session as s:
+        s.execute(text("""
+            INSERT INTO engajamento_aluno (unidade, user_id, total, primeira_visita, ultima_visita)
+            SELECT unidade, user_id, count(*), min(dia), max(dia) FROM agendamentos
+            WHERE unidade = :unidade AND user_id IS NOT NULL GROUP BY unidade, user_id
+            ON CONFLICT (unidade, user_id) DO UPDATE SET
+                total = EXCLUDED.total + engajamento_aluno.arq_total,
+                primeira_visita = LEAST(EXCLUDED.primeira_visita, engajamento_aluno.arq_primeira),
+                ultima_visita = GREATEST(EXCLUDED.ultima_visita, engajamento_aluno.arq_ultima),
+                atualizado_em = now()
+        """), params={"unidade": unidade})
+        # Quem não tem mais nada no banco fica só com a parte arquivada
+        s.execute(text("""
+            UPDATE engajamento_aluno e SET
+                total = e.arq_total, primeira_visita = e.arq_primeira, ultima_visita = e.arq_ultima,
+                atualizado_em = now()
+            WHERE e.unidade = :unidade
+              AND NOT EXISTS (SELECT 1 FROM agendamentos a WHERE a.unidade = e.unidade AND a.user_id = e.user_id)
+              AND (e.total, e.primeira_visita, e.ultima_visita) IS DISTINCT FROM (e.arq_total, e.arq_primeira, e.arq_ultima)
+        """), params={"unidade": unidade})
+        s.execute(text("DELETE FROM engajamento_aluno WHERE unidade = :unidade AND total = 0 AND arq_total = 0"), params={"unidade": unidade})
+        s.commit()
+
+def reconciliar_avaliacoes_diarias(unidade=None):
+    """Recalcula 'avaliacoes_diarias' da unidade a partir de 'avaliacoes' (rodar à noite)."""
+    unidade = unidade or UNIDADE_PADRAO
+    with get_conexao(unidade).session as s:
+        # Avaliações gravadas durante o recálculo esperam a trava e somam depois
+        s.execute(text("LOCK TABLE avaliacoes_diarias IN EXCLUSIVE MODE"))
+        s.execute(text("DELETE FROM avaliacoes_diarias WHERE unidade = :unidade"), params={"unidade": unidade})
+        s.execute(text("""
+            INSERT INTO avaliacoes_diarias (unidade, dia, modalidade, quantidade, soma_notas, nota_1, nota_2, nota_3, nota_4, nota_5)
+            SELECT :unidade, CAST(left(data_avaliacao, 10) AS DATE), COALESCE(modalidade, ''), count(*), COALESCE(sum(nota), 0),
+                   count(*) FILTER (WHERE nota = 1), count(*) FILTER (WHERE nota = 2), count(*) FILTER (WHERE nota = 3),
+                   count(*) FILTER (WHERE nota = 4), count(*) FILTER (WHERE nota = 5)
+            FROM avaliacoes
+            WHERE unidade = :unidade AND data_avaliacao ~ '^\\d{4}-\\d{2}-\\d{2}'
+            GROUP BY 2, 3
+        """), params={"unidade": unidade})
+        s.commit()
+
+# ==========================================
+# LISTA DE ESPERA
+# ==========================================
+# Quem cancela entrega o aparelho ao primeiro da fila na mesma transação
+# do DELETE. FOR UPDATE SKIP LOCKED: dois cancelamentos simultâneos do
+# mesmo horário promovem alunos diferentes, sem um esperar pelo outro. O
+# índice único da vaga garante que nenhuma reserva direta feita ao mesmo
+# tempo fique com o mesmo aparelho.
+
+SQL_VAGAS_DUPLICADAS = "SELECT 1 FROM agendamentos GROUP BY unidade, dia, horario, numero, tipo HAVING count(*) > 1 LIMIT 1"
+
+# Quem já tem esse tipo no horário (reservou direto depois de entrar na fila) é pulado
+SQL_PROMOVER_ESPERA = """
+    WITH proximo AS (
+        SELECT l.id, l.user_id, l.nome FROM lista_espera l
+        WHERE l.unidade = :unidade AND l.dia = :dia AND l.horario = :h AND l.tipo = :t
+          AND NOT EXISTS (
+              SELECT 1 FROM agendamentos a
+              WHERE a.unidade = l.unidade AND a.dia = l.dia AND a.horario = l.horario AND a.tipo = l.tipo AND a.user_id = l.user_id
+          )
+        ORDER BY l.id LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ), saiu AS (
+        DELETE FROM lista_espera WHERE id IN (SELECT id FROM proximo)
+    ), reserva AS (
+        INSERT INTO agendamentos (unidade, data, horario, numero, tipo, nome, pin, criado_em, dia, user_id)
+        SELECT :unidade, :d, :h, :n, :t, nome, 'LOGGED_USER', :c, :dia, user_id FROM proximo
+        RETURNING user_id, nome
+    ), aviso AS (
+        INSERT INTO fila_notificacoes (unidade, user_id, evento, data, horario, tipo, numero)
+        SELECT :unidade, user_id, 'promocao', :d, :h, :t, :n FROM reserva
+    )
+    SELECT user_id, nome FROM reserva
+"""
+
+# Lote de check-ins num único INSERT: as listas viram arrays e o unnest
+# devolve uma linha por evento (uma ida ao banco por lote, não por evento)
+SQL_INSERIR_CHECKINS = """
+    INSERT INTO checkins (unidade, user_id, dia, registrado_em, origem)
+    SELECT :unidade, u, CAST(m AS DATE), m, o
+    FROM unnest(CAST(:us AS INTEGER[]), CAST(:ms AS TIMESTAMP[]), CAST(:os AS TEXT[])) AS t (u, m, o)
+"""
+
+# Falta = reserva de um dia que já passou sem check-in do aluno nesse dia
+SQL_FREQUENCIA = """
+    SELECT
+        (SELECT count(DISTINCT (c.user_id, c.dia)) FROM checkins c
+         WHERE c.unidade = :unidade AND {filtro_checkins}) AS checkins,
+        (SELECT max(c.dia) FROM checkins c WHERE c.unidade = :unidade AND {filtro_checkins}) AS ultimo_checkin,
+        count(*) AS reservas,
+        count(*) FILTER (WHERE NOT EXISTS (
+            SELECT 1 FROM checkins c WHERE c.unidade = a.unidade AND c.user_id = a.user_id AND c.dia = a.dia
+        )) AS faltas
+    FROM agendamentos a
+    WHERE a.unidade = :unidade AND a.user_id IS NOT NULL AND a.dia < :hoje AND {filtro_reservas}
+"""
+
+# ==========================================
+# 3. IMPLEMENTAÇÃO DA INTERFACE
+# ==========================================
+
+class ArmazenamentoPostgres(Armazenamento):
+    nome = "postgres"
+
+    def __init__(self, unidade=UNIDADE_PADRAO):
+        self.unidade = unidade
+        self.conn = _ConexaoPreguicosa(unidade)
+        self.conn_leitura = _ConexaoLeitura(unidade) # Painel e histórico (réplica, se configurada)
+        self._trigramas = None # pg_trgm instalado? (visto na primeira busca de alunos)
+
+    def metricas(self):
+        replica = get_replica(self.unidade)
+        return {**self.conn.metricas(), "replica": replica.metricas() if replica else None}
+
+    # --- USUÁRIOS ---
+    def buscar_usuario(self, email):
+        # Busca segura com parâmetros (evita SQL Injection)
+        df = self.conn.query("SELECT * FROM users WHERE email = :email", params={"email": email}, ttl=0)
+        if df.empty:
+            return None
+        usuario = df.iloc[0].to_dict()
+        usuario['id'] = int(usuario['id']) # numpy -> int, vai direto para os parâmetros SQL
+        return usuario
+
+    def tem_usuarios(self):
+        return not self.conn.query("SELECT 1 FROM users LIMIT 1", ttl=0).empty
+
+    def usuario_existe(self, user_id):
+        return not self.conn.query("SELECT 1 FROM users WHERE id = :u", params={"u": user_id}, ttl=0).empty
+
+    def inserir_usuario(self, email, nome, senha_hash, mudar_senha, tipo):
+        # Verifica duplicidade
+        df = self.conn.query("SELECT email FROM users WHERE email = :e", params={"e": email}, ttl=0)
+        if not df.empty:
+            return False
+
+        with self.conn.session as s:
+            s.execute(
+                text("INSERT INTO users (email, nome, senha, mudar_senha, tipo) VALUES (:e, :n, :s, :m, :t)"),
+                params={"e": email, "n": nome, "s": senha_hash, "m": mudar_senha, "t": tipo}
+            )
+            s.commit()
+        return True
+
+    def atualizar_senha(self, email, senha_hash, mudar_senha):
+        with self.conn.session as s:
+            s.execute(
+                text("UPDATE users SET senha = :s, mudar_senha = :m WHERE email = :e"),
+                params={"s": senha_hash, "m": mudar_senha, "e": email}
+            )
+            s.commit()
+
+    # --- AGENDA ---
+    def carregar_dados_dia(self, dia):
+        # O filtro por unidade e 'dia' faz o Postgres ler só a partição do mês da unidade
+        query = "SELECT data AS \"Data\", horario AS \"Horario\", numero AS \"Numero\", tipo AS \"Tipo\", nome AS \"Nome\", pin AS \"Pin\", criado_em AS \"CriadoEm\", user_id AS \"UserId\" FROM agendamentos WHERE unidade = :unidade AND dia = :dia"
+        return self.conn.query(query, params={"unidade": self.unidade, "dia": dia}, ttl=0)
+
+    def agendamentos_desde(self, id_minimo):
+        return self.conn_leitura.query(
+            "SELECT id, dia, data AS \"Data\", horario AS \"Horario\", numero AS \"Numero\", tipo AS \"Tipo\", nome AS \"Nome\", pin AS \"Pin\", criado_em AS \"CriadoEm\" FROM agendamentos WHERE unidade = :unidade AND id > :id",
+            params={"unidade": self.unidade, "id": id_minimo}, ttl=0
+        )
+
+    def ultima_remocao(self):
+        return int(self.conn_leitura.query(
+            "SELECT COALESCE(max(seq), 0) AS seq FROM agendamentos_removidos WHERE unidade = :unidade",
+            params={"unidade": self.unidade}, ttl=0
+        ).iloc[0, 0])
+
+    def remocoes_desde(self, seq_minimo):
+        return self.conn_leitura.query(
+            "SELECT seq, id FROM agendamentos_removidos WHERE unidade = :unidade AND seq > :s ORDER BY seq",
+            params={"unidade": self.unidade, "s": seq_minimo}, ttl=0
+        )
+
+    def inserir_agendamento(self, data_str, dia, horario, numero, tipo, nome, pin, user_id):
+        # Verifica duplicidade
+        if self.buscar_agendamento(dia, horario, numero, tipo) is not None:
+            return False
+
+        garantir_particao(dia, self.unidade)
+        with self.conn.session as s:
+            s.execute(text("SELECT pg_advisory_xact_lock_shared(:ns, :d)"), params={"ns": TRAVA_AGENDA_DIA, "d": chave_agenda_dia(self.unidade, dia)})
+            if s.execute(text(SQL_VAGA_BLOQUEADA), params={"unidade": self.unidade, "dia": dia, "h": horario, "t": tipo, "n": numero}).first():
+                s.rollback()
+                return False
+            try:
+                s.execute(
+                    text("INSERT INTO agendamentos (unidade, data, horario, numero, tipo, nome, pin, criado_em, dia, user_id) VALUES (:unidade, :d, :h, :n, :t, :nm, :p, :c, :dia, :u)"),
+                    params={
+                        "unidade": self.unidade, "d": data_str, "h": horario, "n": numero, "t": tipo,
+                        "nm": nome, "p": pin, "c": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "dia": dia, "u": user_id
+                    }
+                )
+            except IntegrityError: # Outra reserva da mesma vaga passou entre a verificação e o INSERT
+                s.rollback()
+                return False
+            if user_id is not None:
+                s.execute(text(SQL_ENGAJAMENTO_RESERVA), params={"unidade": self.unidade, "u": user_id, "dia": dia})
+                # Conseguiu direto: sai da fila desse horário
+                s.execute(
+                    text("DELETE FROM lista_espera WHERE unidade = :unidade AND dia = :dia AND horario = :h AND tipo = :t AND user_id = :u"),
+                    params={"unidade": self.unidade, "dia": dia, "h": horario, "t": tipo, "u": user_id}
+                )
+            s.commit()
+        return True
+
+    def buscar_agendamento(self, dia, horario, numero, tipo):
+        df = self.conn.query(
+            "SELECT id, pin, user_id FROM agendamentos WHERE unidade = :unidade AND dia = :dia AND horario = :h AND numero = :n AND tipo = :t",
+            params={"unidade": self.unidade, "dia": dia, "h": horario, "n": numero, "t": tipo},
+            ttl=0
+        )
+        if df.empty:
+            return None
+        agendamento = df.iloc[0]
+        return {
+            "id": int(agendamento['id']), "pin": agendamento['pin'],
+            "user_id": None if pd.isna(agendamento['user_id']) else int(agendamento['user_id']),
+        }
+
+    def remover_agendamento(self, id_agendamento, dia, user_id):
+        promovido = None
+        with self.conn.session as s:
+            # Trava compartilhada como numa reserva: a promoção não atravessa um fechamento em andamento
+            s.execute(text("SELECT pg_advisory_xact_lock_shared(:ns, :d)"), params={"ns": TRAVA_AGENDA_DIA, "d": chave_agenda_dia(self.unidade, dia)})
+            vaga = s.execute(
+                text("DELETE FROM agendamentos WHERE unidade = :unidade AND id = :id AND dia = :dia RETURNING data, horario, numero, tipo"),
+                params={"unidade": self.unidade, "id": id_agendamento, "dia": dia}
+            ).first()
+            # Só desconta o que foi apagado agora: clique duplo ou dois cancelamentos
+            # simultâneos não tiram o mesmo treino duas vezes do engajamento
+            if vaga is not None and user_id is not None:
+                s.execute(text(SQL_ENGAJAMENTO_CANCELAMENTO), params={"unidade": self.unidade, "u": user_id, "qtd": 1})
+            params = {"unidade": self.unidade, "dia": dia, "h": vaga.horario, "t": vaga.tipo, "n": vaga.numero} if vaga else None
+            if vaga and not s.execute(text(SQL_VAGA_BLOQUEADA), params=params).first():
+                promovido = s.execute(
+                    text(SQL_PROMOVER_ESPERA),
+                    params=dict(params, d=vaga.data, c=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                ).first()
+                if promovido:
+                    s.execute(text(SQL_ENGAJAMENTO_RESERVA), params={"unidade": self.unidade, "u": promovido.user_id, "dia": dia})
+            s.commit()
+        return {"user_id": promovido.user_id, "nome": promovido.nome} if promovido else None
+
+    def ocupacao_periodo(self, inicio, fim, tipo):
+        return self.conn.query(
+            "SELECT dia, horario, numero FROM agendamentos WHERE unidade = :unidade AND dia BETWEEN :inicio AND :fim AND tipo = :t",
+            params={"unidade": self.unidade, "inicio": inicio, "fim": fim, "t": tipo}, ttl=0
+        )
+
+    def historico_aluno(self, user_id, limite):
+        # Índice por unidade + user_id + dia
+        return self.conn_leitura.query(
+            "SELECT data AS \"Data\", horario AS \"Horario\", tipo AS \"Tipo\" FROM agendamentos WHERE unidade = :unidade AND user_id = :u ORDER BY dia DESC, horario DESC LIMIT :lim",
+            params={"unidade": self.unidade, "u": user_id, "lim": limite}, ttl=0
+        )
+
+    def modalidades_aluno(self, user_id):
+        return self.conn_leitura.query(
+            "SELECT tipo AS \"Tipo\", count(*) AS \"Qtd\" FROM agendamentos WHERE unidade = :unidade AND user_id = :u GROUP BY tipo",
+            params={"unidade": self.unidade, "u": user_id}, ttl=0
+        )
+
+    # --- GRADE DE CAPACIDADE ---
+    def modelos_horario(self):
+        return self.conn.query(
+            "SELECT id, dia_semana, dia, hora_inicio, hora_fim, layout FROM modelos_horario WHERE unidade = :unidade ORDER BY id",
+            params={"unidade": self.unidade}, ttl=0
+        )
+
+    def substituir_modelos_horario(self, linhas):
+        with self.conn.session as s:
+            s.execute(text("DELETE FROM modelos_horario WHERE unidade = :unidade"), params={"unidade": self.unidade})
+            if linhas:
+                s.execute(text(SQL_INSERIR_MODELO_HORARIO), [dict(linha, unidade=self.unidade) for linha in linhas])
+            s.commit()
+
+    # --- FECHAMENTOS (BLOQUEIOS) ---
+    def aplicar_bloqueio(self, dia, hora_inicio, hora_fim, tipo, numero, motivo, criado_por):
+        with self.conn.session as s:
+            s.execute(text("SELECT pg_advisory_xact_lock(:ns, :d)"), params={"ns": TRAVA_AGENDA_DIA, "d": chave_agenda_dia(self.unidade, dia)})
+            params = {"unidade": self.unidade, "dia": dia, "hi": hora_inicio, "hf": hora_fim, "t": tipo, "n": numero, "motivo": motivo}
+            s.execute(
+                text("INSERT INTO bloqueios (unidade, dia, hora_inicio, hora_fim, tipo, numero, motivo, criado_por) VALUES (:unidade, :dia, :hi, :hf, :t, :n, :motivo, :por)"),
+                params=dict(params, por=criado_por)
+            )
+            resultado = s.execute(text(SQL_CANCELAR_FAIXA), params=params)
+            cancelados = pd.DataFrame(resultado.fetchall(), columns=list(resultado.keys()))
+            # Engajamento: uma atualização por aluno atingido, já sem as linhas apagadas
+            por_aluno = cancelados['UserId'].dropna().astype(int).value_counts()
+            if not por_aluno.empty:
+                s.execute(text(SQL_ENGAJAMENTO_CANCELAMENTO), [{"unidade": self.unidade, "u": int(u), "qtd": int(q)} for u, q in por_aluno.items()])
+            s.commit()
+        return cancelados
+
+    def bloqueios_periodo(self, inicio, fim):
+        return self.conn.query(
+            "SELECT id, dia, hora_inicio, hora_fim, tipo, numero, motivo FROM bloqueios WHERE unidade = :unidade AND dia BETWEEN :inicio AND :fim ORDER BY dia, hora_inicio",
+            params={"unidade": self.unidade, "inicio": inicio, "fim": fim}, ttl=0
+        )
+
+    def remover_bloqueio(self, id_bloqueio):
+        with self.conn.session as s:
+            s.execute(text("DELETE FROM bloqueios WHERE unidade = :unidade AND id = :id"), params={"unidade": self.unidade, "id": id_bloqueio})
+            s.commit()
+
+    def notificacoes_pendentes(self, limite):
+        return self.conn.query(
+            """
+            SELECT f.id, u.email, u.nome, f.evento, f.data, f.horario, f.tipo, f.numero, f.motivo
+            FROM fila_notificacoes f JOIN users u ON u.id = f.user_id
+            WHERE f.unidade = :unidade AND f.enviado_em IS NULL ORDER BY f.id LIMIT :lim
+            """,
+            params={"unidade": self.unidade, "lim": limite}, ttl=0
+        )
+
+    def marcar_notificacoes_enviadas(self, ids):
+        with self.conn.session as s:
+            s.execute(text("UPDATE fila_notificacoes SET enviado_em = now() WHERE id = ANY(:ids)"), params={"ids": [int(i) for i in ids]})
+            s.commit()
+
+    # --- LISTA DE ESPERA ---
+    def entrar_lista_espera(self, dia, horario, tipo, nome, user_id):
+        with self.conn.session as s:
+            entrou = s.execute(
+                text("""
+                    INSERT INTO lista_espera (unidade, dia, horario, tipo, user_id, nome) VALUES (:unidade, :dia, :h, :t, :u, :nm)
+                    ON CONFLICT (unidade, dia, horario, tipo, user_id) DO NOTHING RETURNING id
+                """),
+                params={"unidade": self.unidade, "dia": dia, "h": horario, "t": tipo, "u": user_id, "nm": nome}
+            ).first()
+            s.commit()
+        return entrou is not None
+
+    def sair_lista_espera(self, dia, horario, tipo, user_id):
+        with self.conn.session as s:
+            s.execute(
+                text("DELETE FROM lista_espera WHERE unidade = :unidade AND dia = :dia AND horario = :h AND tipo = :t AND user_id = :u"),
+                params={"unidade": self.unidade, "dia": dia, "h": horario, "t": tipo, "u": user_id}
+            )
+            s.commit()
+
+    def lista_espera_horario(self, dia, horario):
+        return self.conn.query(
+            "SELECT tipo AS \"Tipo\", user_id AS \"UserId\", nome AS \"Nome\" FROM lista_espera WHERE unidade = :unidade AND dia = :dia AND horario = :h ORDER BY id",
+            params={"unidade": self.unidade, "dia": dia, "h": horario}, ttl=0
+        )
+
+    # --- AVALIAÇÕES ---
+    def aulas_sem_avaliacao(self, user_id, desde, ate):
+        # Só as partições da janela; os dois lados usam o índice por user_id
+        return self.conn.query(
+            """
+            SELECT a.id, a.data AS "Data", a.horario AS "Horario", a.tipo AS "Tipo" FROM agendamentos a
+            WHERE a.unidade = :unidade AND a.user_id = :u AND a.dia BETWEEN :desde AND :ate
+              AND NOT EXISTS (SELECT 1 FROM avaliacoes v WHERE v.unidade = :unidade AND v.user_id = :u AND v.id_agendamento = a.id)
+            """,
+            params={"unidade": self.unidade, "u": user_id, "desde": desde, "ate": ate}, ttl=0
+        )
+
+    def inserir_avaliacao(self, id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario, data_avaliacao, user_id):
+        with self.conn.session as s:
+            s.execute(
+                text("""
+                    INSERT INTO avaliacoes (unidade, id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario, data_avaliacao, user_id)
+                    VALUES (:unidade, :id, :n, :d, :m, :nt, :c, :da, :u)
+                """),
+                params={
+                    "unidade": self.unidade, "id": id_agendamento, "n": nome_aluno, "d": data_aula, "m": modalidade,
+                    "nt": nota, "c": comentario, "da": data_avaliacao, "u": user_id
+                }
+            )
+            s.execute(text(SQL_AVALIACAO_DIARIA), params={"unidade": self.unidade, "dia": date.fromisoformat(data_avaliacao[:10]), "m": modalidade or "", "nt": nota})
+            s.commit()
+
+    def carregar_avaliacoes(self):
+        return self.conn_leitura.query("SELECT modalidade AS \"Modalidade\", nota AS \"Nota\", comentario AS \"Comentario\", nome_aluno AS \"NomeAluno\", data_aula AS \"DataAula\", data_avaliacao AS \"DataAvaliacao\", user_id AS \"UserId\" FROM avaliacoes WHERE unidade = :unidade",
+            params={"unidade": self.unidade}, ttl=0
+        )
+
+    def avaliacoes_desde(self, id_minimo):
+        return self.conn_leitura.query(
+            "SELECT id, modalidade AS \"Modalidade\", nota AS \"Nota\", comentario AS \"Comentario\", data_aula AS \"DataAula\" FROM avaliacoes WHERE unidade = :unidade AND id > :id AND comentario <> '' ORDER BY id",
+            params={"unidade": self.unidade, "id": id_minimo}, ttl=0
+        )
+
+    def comentarios_avaliacoes(self, inicio=None, fim=None, user_id=None, limite=200):
+        # Com aluno: índice (unidade, user_id, ...); sem: (unidade, id) de trás para frente até o limite
+        return self.conn_leitura.query(
+            """
+            SELECT modalidade AS "Modalidade", nota AS "Nota", comentario AS "Comentario", nome_aluno AS "NomeAluno",
+                   data_aula AS "DataAula", data_avaliacao AS "DataAvaliacao", user_id AS "UserId"
+            FROM avaliacoes
+            WHERE unidade = :unidade AND comentario <> ''
+              AND (CAST(:u AS INTEGER) IS NULL OR user_id = :u)
+              AND (CAST(:i AS TEXT) IS NULL OR left(data_avaliacao, 10) >= :i)
+              AND (CAST(:f AS TEXT) IS NULL OR left(data_avaliacao, 10) <= :f)
+            ORDER BY id DESC LIMIT :limite
+            """,
+            params={
+                "unidade": self.unidade, "u": user_id, "limite": limite,
+                "i": inicio.isoformat() if inicio else None, "f": fim.isoformat() if fim else None,
+            }, ttl=0
+        )
+
+    def avaliacoes_diarias(self, inicio=None, fim=None):
+        return self.conn_leitura.query(
+            """
+            SELECT dia AS "Dia", modalidade AS "Modalidade", quantidade AS "Quantidade", soma_notas AS "Soma",
+                   nota_1 AS "Nota1", nota_2 AS "Nota2", nota_3 AS "Nota3", nota_4 AS "Nota4", nota_5 AS "Nota5"
+            FROM avaliacoes_diarias
+            WHERE unidade = :unidade AND (CAST(:i AS DATE) IS NULL OR dia >= :i) AND (CAST(:f AS DATE) IS NULL OR dia <= :f)
+            ORDER BY dia
+            """,
+            params={"unidade": self.unidade, "i": inicio, "f": fim}, ttl=0
+        )
+
+    # --- CHECK-INS ---
+    def inserir_checkins(self, linhas):
+        with self.conn.session as s:
+            s.execute(text(SQL_INSERIR_CHECKINS), params={
+                "unidade": self.unidade,
+                "us": [int(l['user_id']) for l in linhas],
+                "ms": [l['momento'] for l in linhas],
+                "os": [l['origem'] for l in linhas],
+            })
+            s.commit()
+
+    def _frequencia(self, filtro_checkins, filtro_reservas, params):
+        df = self.conn_leitura.query(
+            SQL_FREQUENCIA.format(filtro_checkins=filtro_checkins, filtro_reservas=filtro_reservas),
+            params={"unidade": self.unidade, **params}, ttl=0
+        )
+        freq = df.iloc[0].to_dict()
+        for campo in ("checkins", "reservas", "faltas"):
+            freq[campo] = int(freq[campo])
+        freq['ultimo_checkin'] = None if pd.isna(freq['ultimo_checkin']) else freq['ultimo_checkin']
+        return freq
+
+    def frequencia_aluno(self, user_id, hoje):
+        # Índices (unidade, user_id, dia) dos dois lados
+        return self._frequencia("c.user_id = :u", "a.user_id = :u", {"u": user_id, "hoje": hoje})
+
+    def frequencia_periodo(self, inicio, fim, hoje, tipos=None):
+        filtro_reservas = "a.dia BETWEEN :inicio AND :fim"
+        if tipos is not None:
+            filtro_reservas += " AND a.tipo = ANY(:tipos)"
+        return self._frequencia(
+            "c.dia BETWEEN :inicio AND :fim", filtro_reservas,
+            {"inicio": inicio, "fim": fim, "hoje": hoje, "tipos": list(tipos or [])}
+        )
+
+    # --- ENGAJAMENTO (pré-calculado em engajamento_aluno) ---
+    def engajamento_aluno(self, user_id):
+        df = self.conn_leitura.query(
+            "SELECT total, primeira_visita, ultima_visita FROM engajamento_aluno WHERE unidade = :unidade AND user_id = :u AND total > 0",
+            params={"unidade": self.unidade, "u": user_id}, ttl=0
+        )
+        return None if df.empty else df.iloc[0].to_dict()
+
+    def buscar_alunos(self, termo, limite):
+        if self._trigramas is None:
+            self._trigramas = not self.conn.query("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'", ttl=0).empty
+        if self._trigramas:
+            sql = SQL_BUSCAR_ALUNOS.format(parecidos="OR :termo <% u.busca", semelhanca="word_similarity(:termo, u.busca) DESC,")
+        else:
+            sql = SQL_BUSCAR_ALUNOS.format(parecidos="", semelhanca="")
+        return self.conn_leitura.query(
+            sql, ttl=0,
+            params={"unidade": self.unidade, "termo": termo, "contem": f"%{termo}%", "prefixo": f"{termo}%", "palavra": f"% {termo}%", "limite": limite}
+        )
+
+    def alunos_em_risco(self, hoje, de, ate):
+        return self.conn_leitura.query(
+            """
+            SELECT u.nome AS "Nome", u.email AS "Email", e.ultima_visita AS "UltimaVisita",
+                   (CAST(:hoje AS DATE) - e.ultima_visita) AS "DiasSemVir", e.total AS "Total"
+            FROM engajamento_aluno e JOIN users u ON u.id = e.user_id
+            WHERE e.unidade = :unidade AND e.ultima_visita BETWEEN :de AND :ate
+            ORDER BY e.ultima_visita
+            """,
+            params={"unidade": self.unidade, "hoje": hoje, "de": de, "ate": ate},
+            ttl=0
+        )
+
+
+if __name__ == "__main__":
+    # Teste manual contra um Postgres local:
+    #   DATABASE_URL=postgresql://... python armazenamento_postgres.py
+    # e, em outro terminal, reinicie o servidor (pg_ctl restart). As leituras
+    # devem voltar sozinhas; 'leituras_repetidas' mostra quantas precisaram.
+    while True:
+        inicio = time.perf_counter()
+        try:
+            n = int(conn.query("SELECT count(*) FROM agendamentos").iloc[0, 0])
+            print(f"{n} agendamento(s) em {(time.perf_counter() - inicio) * 1000:.0f} ms | {conn.metricas()}")
+        except Exception as e:
+            print(f"❌ {type(e).__name__}: {e}")
+        time.sleep(1)
@@ -0,0 +1,671 @@
+import json
+import threading
+import unicodedata
+import pandas as pd
+from datetime import datetime, date
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import StaticPool
+from armazenamento import Armazenamento, registrar_contador_consultas, UNIDADE_PADRAO
+from capacidade import MODELOS_PADRAO
+
+# ==========================================
+# ARMAZENAMENTO SQLITE (EMBUTIDO)
+# ==========================================
+# Mesmo contrato do Postgres, num arquivo local ou em memória. Serve para
+# rodar o app e os benchmarks sem servidor e para instalações pequenas de
+# uma instância só. Sem partições nem NOTIFY: o engajamento é calculado na
+# hora (o volume de uma unidade pequena não justifica a tabela derivada).
+# Unidades no mesmo arquivo dividem a engine e o lock de escrita.
+#
+#   NAALLI_ARMAZENAMENTO=sqlite NAALLI_SQLITE_PATH=naalli.db streamlit run Agendamento.py
+
+ESQUEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL UNIQUE,
+        nome TEXT,
+        senha TEXT,
+        mudar_senha INTEGER,
+        tipo TEXT
+    )
+    """,
+    # 'dia' em texto ISO (AAAA-MM-DD): ordena e compara como data
+    """
+    CREATE TABLE IF NOT EXISTS agendamentos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        data TEXT,
+        horario TEXT,
+        numero INTEGER,
+        tipo TEXT,
+        nome TEXT,
+        pin TEXT,
+        criado_em TEXT,
+        dia TEXT NOT NULL,
+        user_id INTEGER REFERENCES users (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_agendamentos_dia ON agendamentos (unidade, dia, horario)",
+    "CREATE INDEX IF NOT EXISTS idx_agendamentos_user ON agendamentos (unidade, user_id, dia)",
+    # Uma reserva por aparelho (vale também com vários processos no mesmo arquivo)
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_agendamentos_vaga ON agendamentos (unidade, dia, horario, numero, tipo)",
+    """
+    CREATE TABLE IF NOT EXISTS avaliacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        id_agendamento INTEGER,
+        nome_aluno TEXT,
+        data_aula TEXT,
+        modalidade TEXT,
+        nota INTEGER,
+        comentario TEXT,
+        data_avaliacao TEXT,
+        user_id INTEGER REFERENCES users (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_avaliacoes_user ON avaliacoes (unidade, user_id, id_agendamento)",
+    "CREATE INDEX IF NOT EXISTS idx_avaliacoes_unidade ON avaliacoes (unidade, id)",
+    # Avaliações somadas por dia e modalidade, mantida a cada avaliação (gráficos de qualidade)
+    """
+    CREATE TABLE IF NOT EXISTS avaliacoes_diarias (
+        unidade TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        modalidade TEXT NOT NULL,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        soma_notas INTEGER NOT NULL DEFAULT 0,
+        nota_1 INTEGER NOT NULL DEFAULT 0,
+        nota_2 INTEGER NOT NULL DEFAULT 0,
+        nota_3 INTEGER NOT NULL DEFAULT 0,
+        nota_4 INTEGER NOT NULL DEFAULT 0,
+        nota_5 INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (unidade, dia, modalidade)
+    )
+    """,
+    # Capacidade e horários de funcionamento (ver capacidade.py)
+    """
+    CREATE TABLE IF NOT EXISTS modelos_horario (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        dia_semana INTEGER CHECK (dia_semana BETWEEN 0 AND 6),
+        dia TEXT,
+        hora_inicio TEXT NOT NULL,
+        hora_fim TEXT NOT NULL,
+        layout TEXT NOT NULL DEFAULT '',
+        atualizado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CHECK (dia_semana IS NOT NULL OR dia IS NOT NULL)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_modelos_horario_unidade ON modelos_horario (unidade, id)",
+    # Fechamentos: tipo/numero NULL = todos os aparelhos
+    """
+    CREATE TABLE IF NOT EXISTS bloqueios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        hora_inicio TEXT NOT NULL,
+        hora_fim TEXT NOT NULL,
+        tipo TEXT,
+        numero INTEGER,
+        motivo TEXT,
+        criado_por TEXT,
+        criado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_bloqueios_dia ON bloqueios (unidade, dia)",
+    """
+    CREATE TABLE IF NOT EXISTS fila_notificacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        evento TEXT NOT NULL,
+        data TEXT,
+        horario TEXT,
+        tipo TEXT,
+        numero INTEGER,
+        motivo TEXT,
+        criado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        enviado_em TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_fila_notificacoes_pendentes ON fila_notificacoes (unidade, id) WHERE enviado_em IS NULL",
+    # Lista de espera por (dia, horário, tipo): a ordem da fila é o id
+    """
+    CREATE TABLE IF NOT EXISTS lista_espera (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        horario TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        nome TEXT,
+        criado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (unidade, dia, horario, tipo, user_id)
+    )
+    """,
+    # Check-ins da recepção, gravados em lotes por checkin.py
+    """
+    CREATE TABLE IF NOT EXISTS checkins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        dia TEXT NOT NULL,
+        registrado_em TEXT NOT NULL,
+        origem TEXT NOT NULL DEFAULT 'recepcao',
+        gravado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_checkins_user ON checkins (unidade, user_id, dia)",
+    "CREATE INDEX IF NOT EXISTS idx_checkins_dia ON checkins (unidade, dia)",
+    # Lápides lidas pelo instantâneo em memória (instantaneo.py)
+    """
+    CREATE TABLE IF NOT EXISTS agendamentos_removidos (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        unidade TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        removido_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_agendamentos_removidos_unidade ON agendamentos_removidos (unidade, seq)",
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_remocao_agendamento AFTER DELETE ON agendamentos
+    BEGIN
+        INSERT INTO agendamentos_removidos (unidade, id) VALUES (OLD.unidade, OLD.id);
+    END
+    """,
+]
+
+# Tabelas com dados por unidade e os índices de antes da coluna 'unidade'
+TABELAS_POR_UNIDADE = [
+    "agendamentos", "avaliacoes", "modelos_horario", "bloqueios",
+    "fila_notificacoes", "lista_espera", "agendamentos_removidos",
+]
+INDICES_SEM_UNIDADE = ["idx_agendamentos_dia", "idx_agendamentos_user", "idx_agendamentos_vaga", "idx_avaliacoes_user", "idx_bloqueios_dia"]
+
+
+SQL_INSERIR_MODELO_HORARIO = """
+    INSERT INTO modelos_horario (unidade, dia_semana, dia, hora_inicio, hora_fim, layout)
+    VALUES (:unidade, :dia_semana, :dia, :hora_inicio, :hora_fim, :layout)
+"""
+
+SQL_AVALIACAO_DIARIA = """
+    INSERT INTO avaliacoes_diarias (unidade, dia, modalidade, quantidade, soma_notas, nota_1, nota_2, nota_3, nota_4, nota_5)
+    VALUES (:unidade, :dia, :m, 1, :nt, :nt = 1, :nt = 2, :nt = 3, :nt = 4, :nt = 5)
+    ON CONFLICT (unidade, dia, modalidade) DO UPDATE SET
+        quantidade = quantidade + 1,
+        soma_notas = soma_notas + excluded.soma_notas,
+        nota_1 = nota_1 + excluded.nota_1,
+        nota_2 = nota_2 + excluded.nota_2,
+        nota_3 = nota_3 + excluded.nota_3,
+        nota_4 = nota_4 + excluded.nota_4,
+        nota_5 = nota_5 + excluded.nota_5
+"""
+
+# Arquivos de antes da tabela derivada (ou da unidade): soma uma vez a partir de 'avaliacoes'
+SQL_RECALCULAR_AVALIACOES_DIARIAS = """
+    INSERT INTO avaliacoes_diarias (unidade, dia, modalidade, quantidade, soma_notas, nota_1, nota_2, nota_3, nota_4, nota_5)
+    SELECT :unidade, substr(data_avaliacao, 1, 10), COALESCE(modalidade, ''), count(*), COALESCE(sum(nota), 0),
+           sum(nota = 1), sum(nota = 2), sum(nota = 3), sum(nota = 4), sum(nota = 5)
+    FROM avaliacoes
+    WHERE unidade = :unidade AND data_avaliacao GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+    GROUP BY 2, 3
+"""
+
+# Falta = reserva de um dia que já passou sem check-in do aluno nesse dia
+SQL_FREQUENCIA = """
+    SELECT
+        (SELECT count(*) FROM (SELECT DISTINCT c.user_id, c.dia FROM checkins c
+                               WHERE c.unidade = :unidade AND {filtro_checkins})) AS checkins,
+        (SELECT max(c.dia) FROM checkins c WHERE c.unidade = :unidade AND {filtro_checkins}) AS ultimo_checkin,
+        count(*) AS reservas,
+        coalesce(sum(NOT EXISTS (
+            SELECT 1 FROM checkins c WHERE c.unidade = a.unidade AND c.user_id = a.user_id AND c.dia = a.dia
+        )), 0) AS faltas
+    FROM agendamentos a
+    WHERE a.unidade = :unidade AND a.user_id IS NOT NULL AND a.dia < :hoje AND {filtro_reservas}
+"""
+
+# Busca de alunos: sem índice (usuários de uma unidade pequena cabem numa
+# leitura da tabela). O lower() do SQLite só conhece ASCII: a normalização
+# é a mesma de utils.texto_busca, registrada como função em cada conexão.
+SQL_BUSCAR_ALUNOS = """
+    SELECT id, nome, email FROM (
+        SELECT id, nome, email, texto_busca(coalesce(nome, '') || ' ' || email) AS busca FROM users
+    )
+    WHERE busca LIKE :contem
+    ORDER BY busca LIKE :prefixo DESC, busca LIKE :palavra DESC, nome
+    LIMIT :limite
+"""
+
+def _texto_busca(texto):
+    return unicodedata.normalize("NFKD", (texto or "").lower()).encode("ascii", "ignore").decode()
+
+def _registrar_funcoes(conexao, _):
+    conexao.create_function("texto_busca", 1, _texto_busca, deterministic=True)
+
+def _colunas(c, tabela):
+    return {linha[1] for linha in c.execute(text(f"PRAGMA table_info({tabela})"))}
+
+def _migrar_unidades(c):
+    """
+    Arquivos de antes das unidades: os dados existentes vão para a unidade
+    padrão. Índices e o gatilho antigos saem (o ESQUEMA os recria com a
+    unidade); as tabelas com a unidade na chave são refeitas.
+    """
+    if not _colunas(c, "agendamentos") or "unidade" in _colunas(c, "agendamentos"):
+        return False
+    for tabela in TABELAS_POR_UNIDADE:
+        if _colunas(c, tabela):
+            c.execute(text(f"ALTER TABLE {tabela} ADD COLUMN unidade TEXT NOT NULL DEFAULT '{UNIDADE_PADRAO}'"))
+    for indice in INDICES_SEM_UNIDADE:
+        c.execute(text(f"DROP INDEX IF EXISTS {indice}"))
+    c.execute(text("DROP TRIGGER IF EXISTS trg_remocao_agendamento"))
+    c.execute(text("DROP TABLE IF EXISTS avaliacoes_diarias")) # Recalculada por unidade
+    if _colunas(c, "lista_espera"):
+        c.execute(text("ALTER TABLE lista_espera RENAME TO lista_espera_antiga"))
+    return True
+
+# Uma engine (e um lock de escrita) por arquivo, dividida pelas unidades
+_bancos = {}
+_lock_bancos = threading.Lock()
+
+def _abrir_banco(caminho):
+    with _lock_bancos:
+        if caminho in _bancos:
+            return _bancos[caminho]
+        if caminho == ":memory:":
+            # Uma única conexão compartilhada: cada conexão nova seria um banco vazio
+            engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        else:
+            engine = create_engine(f"sqlite:///{caminho}", connect_args={"check_same_thread": False})
+        registrar_contador_consultas(engine)
+        event.listen(engine, "connect", _registrar_funcoes)
+        # O SQLite aceita um escritor por vez; o lock também protege a conexão única em memória
+        lock = threading.RLock()
+        with lock, engine.begin() as c:
+            _migrar_unidades(c)
+            for sql in ESQUEMA:
+                c.execute(text(sql))
+            if _colunas(c, "lista_espera_antiga"):
+                c.execute(text("""
+                    INSERT INTO lista_espera (id, unidade, dia, horario, tipo, user_id, nome, criado_em)
+                    SELECT id, unidade, dia, horario, tipo, user_id, nome, criado_em FROM lista_espera_antiga
+                """))
+                c.execute(text("DROP TABLE lista_espera_antiga"))
+        _bancos[caminho] = (engine, lock)
+        return _bancos[caminho]
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    nome = "sqlite"
+
+    def __init__(self, caminho=":memory:", unidade=UNIDADE_PADRAO):
+        self.unidade = unidade
+        self.engine, self._lock = _abrir_banco(caminho)
+        with self._lock, self.engine.begin() as c:
+            u = {"unidade": unidade}
+            if not c.execute(text("SELECT 1 FROM modelos_horario WHERE unidade = :unidade LIMIT 1"), u).first():
+                c.execute(text(SQL_INSERIR_MODELO_HORARIO), [dict(m, unidade=unidade) for m in MODELOS_PADRAO])
+            if not c.execute(text("SELECT 1 FROM avaliacoes_diarias WHERE unidade = :unidade LIMIT 1"), u).first():
+                c.execute(text(SQL_RECALCULAR_AVALIACOES_DIARIAS), u)
+
+    # Todas as consultas recebem :unidade
+    def _consultar(self, sql, **params):
+        with self._lock, self.engine.connect() as c:
+            return pd.read_sql(text(sql), c, params=dict(params, unidade=self.unidade))
+
+    def _executar(self, sql, **params):
+        with self._lock, self.engine.begin() as c:
+            c.execute(text(sql), dict(params, unidade=self.unidade))
+
+    # --- USUÁRIOS ---
+    def buscar_usuario(self, email):
+        df = self._consultar("SELECT * FROM users WHERE email = :e", e=email)
+        if df.empty:
+            return None
+        usuario = df.iloc[0].to_dict()
+        usuario['id'] = int(usuario['id'])
+        usuario['mudar_senha'] = bool(usuario['mudar_senha'])
+        return usuario
+
+    def tem_usuarios(self):
+        return not self._consultar("SELECT 1 FROM users LIMIT 1").empty
+
+    def usuario_existe(self, user_id):
+        return not self._consultar("SELECT 1 FROM users WHERE id = :u", u=user_id).empty
+
+    def inserir_usuario(self, email, nome, senha_hash, mudar_senha, tipo):
+        with self._lock:
+            if not self._consultar("SELECT 1 FROM users WHERE email = :e", e=email).empty:
+                return False
+            self._executar(
+                "INSERT INTO users (email, nome, senha, mudar_senha, tipo) VALUES (:e, :n, :s, :m, :t)",
+                e=email, n=nome, s=senha_hash, m=int(mudar_senha), t=tipo
+            )
+        return True
+
+    def atualizar_senha(self, email, senha_hash, mudar_senha):
+        self._executar("UPDATE users SET senha = :s, mudar_senha = :m WHERE email = :e", s=senha_hash, m=int(mudar_senha), e=email)
+
+    # --- AGENDA ---
+    def carregar_dados_dia(self, dia):
+        return self._consultar(
+            "SELECT data AS Data, horario AS Horario, numero AS Numero, tipo AS Tipo, nome AS Nome, pin AS Pin, criado_em AS CriadoEm, user_id AS UserId FROM agendamentos WHERE unidade = :unidade AND dia = :dia",
+            dia=dia.isoformat()
+        )
+
+    def agendamentos_desde(self, id_minimo):
+        df = self._consultar(
+            "SELECT id, dia, data AS Data, horario AS Horario, numero AS Numero, tipo AS Tipo, nome AS Nome, pin AS Pin, criado_em AS CriadoEm FROM agendamentos WHERE unidade = :unidade AND id > :id",
+            id=id_minimo
+        )
+        df['dia'] = [date.fromisoformat(d) for d in df['dia']]
+        return df
+
+    def ultima_remocao(self):
+        return int(self._consultar("SELECT COALESCE(max(seq), 0) AS seq FROM agendamentos_removidos WHERE unidade = :unidade").iloc[0, 0])
+
+    def remocoes_desde(self, seq_minimo):
+        return self._consultar("SELECT seq, id FROM agendamentos_removidos WHERE unidade = :unidade AND seq > :s ORDER BY seq", s=seq_minimo)
+
+    def inserir_agendamento(self, data_str, dia, horario, numero, tipo, nome, pin, user_id):
+        # Verificação e gravação sob o mesmo lock: duas reservas da mesma vaga não passam juntas
+        # (nem uma reserva e o fechamento da faixa)
+        with self._lock:
+            if self.buscar_agendamento(dia, horario, numero, tipo) is not None:
+                return False
+            bloqueada = self._consultar(
+                """
+                SELECT 1 FROM bloqueios WHERE unidade = :unidade AND dia = :dia AND :h BETWEEN hora_inicio AND hora_fim
+                  AND (tipo IS NULL OR tipo = :t) AND (numero IS NULL OR numero = :n) LIMIT 1
+                """,
+                dia=dia.isoformat(), h=horario, t=tipo, n=numero
+            )
+            if not bloqueada.empty:
+                return False
+            try:
+                with self.engine.begin() as c:
+                    c.execute(
+                        text("INSERT INTO agendamentos (unidade, data, horario, numero, tipo, nome, pin, criado_em, dia, user_id) VALUES (:unidade, :d, :h, :n, :t, :nm, :p, :c, :dia, :u)"),
+                        {"unidade": self.unidade, "d": data_str, "h": horario, "n": numero, "t": tipo, "nm": nome, "p": pin,
+                         "c": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "dia": dia.isoformat(), "u": user_id}
+                    )
+                    # Conseguiu direto: sai da fila desse horário
+                    c.execute(
+                        text("DELETE FROM lista_espera WHERE unidade = :unidade AND dia = :dia AND horario = :h AND tipo = :t AND user_id = :u"),
+                        {"unidade": self.unidade, "dia": dia.isoformat(), "h": horario, "t": tipo, "u": user_id}
+                    )
+            except IntegrityError: # Outro processo no mesmo arquivo reservou a vaga
+                return False
+        return True
+
+    def buscar_agendamento(self, dia, horario, numero, tipo):
+        df = self._consultar(
+            "SELECT id, pin, user_id FROM agendamentos WHERE unidade = :unidade AND dia = :dia AND horario = :h AND numero = :n AND tipo = :t",
+            dia=dia.isoformat(), h=horario, n=numero, t=tipo
+        )
+        if df.empty:
+            return None
+        agendamento = df.iloc[0]
+        return {
+            "id": int(agendamento['id']), "pin": agendamento['pin'],
+            "user_id": None if pd.isna(agendamento['user_id']) else int(agendamento['user_id']),
+        }
+
+    def remover_agendamento(self, id_agendamento, dia, user_id):
+        # Um escritor por vez: o primeiro da fila é lido e promovido sem disputa
+        agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self.engine.begin() as c:
+            vaga = c.execute(
+                text("DELETE FROM agendamentos WHERE unidade = :unidade AND id = :id RETURNING data, dia, horario, numero, tipo"),
+                {"unidade": self.unidade, "id": id_agendamento}
+            ).first()
+            if vaga is None:
+                return None
+            params = {"unidade": self.unidade, "dia": vaga.dia, "h": vaga.horario, "t": vaga.tipo, "n": vaga.numero}
+            bloqueada = c.execute(text("""
+                SELECT 1 FROM bloqueios WHERE unidade = :unidade AND dia = :dia AND :h BETWEEN hora_inicio AND hora_fim
+                  AND (tipo IS NULL OR tipo = :t) AND (numero IS NULL OR numero = :n) LIMIT 1
+            """), params).first()
+            if bloqueada:
+                return None
+            proximo = c.execute(text("""
+                SELECT l.id, l.user_id, l.nome FROM lista_espera l
+                WHERE l.unidade = :unidade AND l.dia = :dia AND l.horario = :h AND l.tipo = :t
+                  AND NOT EXISTS (
+                      SELECT 1 FROM agendamentos a
+                      WHERE a.unidade = l.unidade AND a.dia = l.dia AND a.horario = l.horario AND a.tipo = l.tipo AND a.user_id = l.user_id
+                  )
+                ORDER BY l.id LIMIT 1
+            """), params).first()
+            if proximo is None:
+                return None
+            c.execute(text("DELETE FROM lista_espera WHERE id = :id"), {"id": proximo.id})
+            c.execute(
+                text("INSERT INTO agendamentos (unidade, data, horario, numero, tipo, nome, pin, criado_em, dia, user_id) VALUES (:unidade, :d, :h, :n, :t, :nm, 'LOGGED_USER', :c, :dia, :u)"),
+                dict(params, d=vaga.data, nm=proximo.nome, c=agora, u=proximo.user_id)
+            )
+            c.execute(
+                text("INSERT INTO fila_notificacoes (unidade, user_id, evento, data, horario, tipo, numero) VALUES (:unidade, :u, 'promocao', :d, :h, :t, :n)"),
+                dict(params, d=vaga.data, u=proximo.user_id)
+            )
+        return {"user_id": int(proximo.user_id), "nome": proximo.nome}
+
+    def ocupacao_periodo(self, inicio, fim, tipo):
+        df = self._consultar(
+            "SELECT dia, horario, numero FROM agendamentos WHERE unidade = :unidade AND dia BETWEEN :inicio AND :fim AND tipo = :t",
+            inicio=inicio.isoformat(), fim=fim.isoformat(), t=tipo
+        )
+        df['dia'] = [date.fromisoformat(d) for d in df['dia']]
+        return df
+
+    def historico_aluno(self, user_id, limite):
+        return self._consultar(
+            "SELECT data AS Data, horario AS Horario, tipo AS Tipo FROM agendamentos WHERE unidade = :unidade AND user_id = :u ORDER BY dia DESC, horario DESC LIMIT :lim",
+            u=user_id, lim=limite
+        )
+
+    def modalidades_aluno(self, user_id):
+        return self._consultar(
+            "SELECT tipo AS Tipo, count(*) AS Qtd FROM agendamentos WHERE unidade = :unidade AND user_id = :u GROUP BY tipo",
+            u=user_id
+        )
+
+    # --- GRADE DE CAPACIDADE ---
+    def modelos_horario(self):
+        df = self._consultar("SELECT id, dia_semana, dia, hora_inicio, hora_fim, layout FROM modelos_horario WHERE unidade = :unidade ORDER BY id")
+        df['dia'] = [None if pd.isna(d) else date.fromisoformat(d) for d in df['dia']]
+        return df
+
+    def substituir_modelos_horario(self, linhas):
+        linhas = [dict(l, unidade=self.unidade, dia=None if l['dia'] is None else l['dia'].isoformat()) for l in linhas]
+        with self._lock, self.engine.begin() as c:
+            c.execute(text("DELETE FROM modelos_horario WHERE unidade = :unidade"), {"unidade": self.unidade})
+            if linhas:
+                c.execute(text(SQL_INSERIR_MODELO_HORARIO), linhas)
+
+    # --- FECHAMENTOS (BLOQUEIOS) ---
+    def aplicar_bloqueio(self, dia, hora_inicio, hora_fim, tipo, numero, motivo, criado_por):
+        params = {"unidade": self.unidade, "dia": dia.isoformat(), "hi": hora_inicio, "hf": hora_fim, "t": tipo, "n": numero}
+        with self._lock, self.engine.begin() as c:
+            c.execute(
+                text("INSERT INTO bloqueios (unidade, dia, hora_inicio, hora_fim, tipo, numero, motivo, criado_por) VALUES (:unidade, :dia, :hi, :hf, :t, :n, :motivo, :por)"),
+                dict(params, motivo=motivo, por=criado_por)
+            )
+            resultado = c.execute(text("""
+                DELETE FROM agendamentos
+                WHERE unidade = :unidade AND dia = :dia AND horario BETWEEN :hi AND :hf
+                  AND (:t IS NULL OR tipo = :t) AND (:n IS NULL OR numero = :n)
+                RETURNING data AS Data, horario AS Horario, numero AS Numero, tipo AS Tipo, nome AS Nome, user_id AS UserId
+            """), params)
+            cancelados = pd.DataFrame(resultado.fetchall(), columns=["Data", "Horario", "Numero", "Tipo", "Nome", "UserId"])
+            avisos = [
+                {"unidade": self.unidade, "u": int(r.UserId), "d": r.Data, "h": r.Horario, "t": r.Tipo, "n": int(r.Numero), "motivo": motivo}
+                for r in cancelados.itertuples() if pd.notna(r.UserId)
+            ]
+            if avisos:
+                c.execute(text(
+                    "INSERT INTO fila_notificacoes (unidade, user_id, evento, data, horario, tipo, numero, motivo) VALUES (:unidade, :u, 'cancelamento', :d, :h, :t, :n, :motivo)"
+                ), avisos)
+        return cancelados.sort_values(["Horario", "Tipo", "Numero"], ignore_index=True)
+
+    def bloqueios_periodo(self, inicio, fim):
+        df = self._consultar(
+            "SELECT id, dia, hora_inicio, hora_fim, tipo, numero, motivo FROM bloqueios WHERE unidade = :unidade AND dia BETWEEN :inicio AND :fim ORDER BY dia, hora_inicio",
+            inicio=inicio.isoformat(), fim=fim.isoformat()
+        )
+        df['dia'] = [date.fromisoformat(d) for d in df['dia']]
+        return df
+
+    def remover_bloqueio(self, id_bloqueio):
+        self._executar("DELETE FROM bloqueios WHERE unidade = :unidade AND id = :id", id=id_bloqueio)
+
+    def notificacoes_pendentes(self, limite):
+        return self._consultar(
+            """
+            SELECT f.id, u.email, u.nome, f.evento, f.data, f.horario, f.tipo, f.numero, f.motivo
+            FROM fila_notificacoes f JOIN users u ON u.id = f.user_id
+            WHERE f.unidade = :unidade AND f.enviado_em IS NULL ORDER BY f.id LIMIT :lim
+            """,
+            lim=limite
+        )
+
+    def marcar_notificacoes_enviadas(self, ids):
+        with self._lock, self.engine.begin() as c:
+            c.execute(text("UPDATE fila_notificacoes SET enviado_em = CURRENT_TIMESTAMP WHERE id = :id"), [{"id": int(i)} for i in ids])
+
+    # --- LISTA DE ESPERA ---
+    def entrar_lista_espera(self, dia, horario, tipo, nome, user_id):
+        with self._lock, self.engine.begin() as c:
+            entrou = c.execute(
+                text("INSERT OR IGNORE INTO lista_espera (unidade, dia, horario, tipo, user_id, nome) VALUES (:unidade, :dia, :h, :t, :u, :nm)"),
+                {"unidade": self.unidade, "dia": dia.isoformat(), "h": horario, "t": tipo, "u": user_id, "nm": nome}
+            )
+        return entrou.rowcount == 1
+
+    def sair_lista_espera(self, dia, horario, tipo, user_id):
+        self._executar(
+            "DELETE FROM lista_espera WHERE unidade = :unidade AND dia = :dia AND horario = :h AND tipo = :t AND user_id = :u",
+            dia=dia.isoformat(), h=horario, t=tipo, u=user_id
+        )
+
+    def lista_espera_horario(self, dia, horario):
+        return self._consultar(
+            "SELECT tipo AS Tipo, user_id AS UserId, nome AS Nome FROM lista_espera WHERE unidade = :unidade AND dia = :dia AND horario = :h ORDER BY id",
+            dia=dia.isoformat(), h=horario
+        )
+
+    # --- AVALIAÇÕES ---
+    def aulas_sem_avaliacao(self, user_id, desde, ate):
+        return self._consultar(
+            """
+            SELECT a.id, a.data AS Data, a.horario AS Horario, a.tipo AS Tipo FROM agendamentos a
+            WHERE a.unidade = :unidade AND a.user_id = :u AND a.dia BETWEEN :desde AND :ate
+              AND NOT EXISTS (SELECT 1 FROM avaliacoes v WHERE v.unidade = :unidade AND v.user_id = :u AND v.id_agendamento = a.id)
+            """,
+            u=user_id, desde=desde.isoformat(), ate=ate.isoformat()
+        )
+
+    def inserir_avaliacao(self, id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario, data_avaliacao, user_id):
+        with self._lock, self.engine.begin() as c:
+            c.execute(text("""
+                INSERT INTO avaliacoes (unidade, id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario, data_avaliacao, user_id)
+                VALUES (:unidade, :id, :n, :d, :m, :nt, :c, :da, :u)
+            """), {"unidade": self.unidade, "id": id_agendamento, "n": nome_aluno, "d": data_aula, "m": modalidade, "nt": nota, "c": comentario, "da": data_avaliacao, "u": user_id})
+            c.execute(text(SQL_AVALIACAO_DIARIA), {"unidade": self.unidade, "dia": data_avaliacao[:10], "m": modalidade or "", "nt": nota})
+
+    def carregar_avaliacoes(self):
+        return self._consultar("SELECT modalidade AS Modalidade, nota AS Nota, comentario AS Comentario, nome_aluno AS NomeAluno, data_aula AS DataAula, data_avaliacao AS DataAvaliacao, user_id AS UserId FROM avaliacoes WHERE unidade = :unidade")
+
+    def avaliacoes_diarias(self, inicio=None, fim=None):
+        df = self._consultar(
+            """
+            SELECT dia AS Dia, modalidade AS Modalidade, quantidade AS Quantidade, soma_notas AS Soma,
+                   nota_1 AS Nota1, nota_2 AS Nota2, nota_3 AS Nota3, nota_4 AS Nota4, nota_5 AS Nota5
+            FROM avaliacoes_diarias
+            WHERE unidade = :unidade AND (:i IS NULL OR dia >= :i) AND (:f IS NULL OR dia <= :f)
+            ORDER BY dia
+            """,
+            i=inicio.isoformat() if inicio else None, f=fim.isoformat() if fim else None
+        )
+        df['Dia'] = [date.fromisoformat(d) for d in df['Dia']]
+        return df
+
+    def comentarios_avaliacoes(self, inicio=None, fim=None, user_id=None, limite=200):
+        return self._consultar(
+            """
+            SELECT modalidade AS Modalidade, nota AS Nota, comentario AS Comentario, nome_aluno AS NomeAluno,
+                   data_aula AS DataAula, data_avaliacao AS DataAvaliacao, user_id AS UserId
+            FROM avaliacoes
+            WHERE unidade = :unidade AND comentario <> ''
+              AND (:u IS NULL OR user_id = :u)
+              AND (:i IS NULL OR substr(data_avaliacao, 1, 10) >= :i) AND (:f IS NULL OR substr(data_avaliacao, 1, 10) <= :f)
+            ORDER BY id DESC LIMIT :limite
+            """,
+            u=user_id, limite=limite, i=inicio.isoformat() if inicio else None, f=fim.isoformat() if fim else None
+        )
+
+    def avaliacoes_desde(self, id_minimo):
+        return self._consultar(
+            "SELECT id, modalidade AS Modalidade, nota AS Nota, comentario AS Comentario, data_aula AS DataAula FROM avaliacoes WHERE unidade = :unidade AND id > :id AND comentario <> '' ORDER BY id",
+            id=id_minimo
+        )
+
+    # --- CHECK-INS ---
+    def inserir_checkins(self, linhas):
+        with self._lock, self.engine.begin() as c:
+            c.execute(
+                text("INSERT INTO checkins (unidade, user_id, dia, registrado_em, origem) VALUES (:unidade, :u, :dia, :m, :o)"),
+                [{"unidade": self.unidade, "u": int(l['user_id']), "dia": l['momento'].date().isoformat(),
+                  "m": l['momento'].isoformat(sep=" "), "o": l['origem']} for l in linhas]
+            )
+
+    def _frequencia(self, filtro_checkins, filtro_reservas, **params):
+        freq = self._consultar(
+            SQL_FREQUENCIA.format(filtro_checkins=filtro_checkins, filtro_reservas=filtro_reservas), **params
+        ).iloc[0].to_dict()
+        for campo in ("checkins", "reservas", "faltas"):
+            freq[campo] = int(freq[campo])
+        freq['ultimo_checkin'] = date.fromisoformat(freq['ultimo_checkin']) if freq['ultimo_checkin'] else None
+        return freq
+
+    def frequencia_aluno(self, user_id, hoje):
+        return self._frequencia("c.user_id = :u", "a.user_id = :u", u=user_id, hoje=hoje.isoformat())
+
+    def frequencia_periodo(self, inicio, fim, hoje, tipos=None):
+        filtro_reservas = "a.dia BETWEEN :inicio AND :fim"
+        if tipos is not None:
+            filtro_reservas += " AND a.tipo IN (SELECT value FROM json_each(:tipos))"
+        return self._frequencia(
+            "c.dia BETWEEN :inicio AND :fim", filtro_reservas,
+            inicio=inicio.isoformat(), fim=fim.isoformat(), hoje=hoje.isoformat(), tipos=json.dumps(list(tipos or []))
+        )
+
+    # --- ENGAJAMENTO (calculado na hora pelo índice (unidade, user_id, dia)) ---
+    def engajamento_aluno(self, user_id):
+        total, primeira, ultima = self._consultar(
+            "SELECT count(*) AS total, min(dia) AS primeira, max(dia) AS ultima FROM agendamentos WHERE unidade = :unidade AND user_id = :u",
+            u=user_id
+        ).iloc[0]
+        if not total:
+            return None
+        return {"total": int(total), "primeira_visita": date.fromisoformat(primeira), "ultima_visita": date.fromisoformat(ultima)}
+
+    def buscar_alunos(self, termo, limite):
+        return self._consultar(SQL_BUSCAR_ALUNOS, contem=f"%{termo}%", prefixo=f"{termo}%", palavra=f"% {termo}%", limite=limite)
+
+    def alunos_em_risco(self, hoje, de, ate):
+        df = self._consultar(
+            """
+            SELECT u.nome AS Nome, u.email AS Email, max(a.dia) AS UltimaVisita, count(*) AS Total
+            FROM agendamentos a JOIN users u ON u.id = a.user_id
+            WHERE a.unidade = :unidade
+            GROUP BY u.id HAVING max(a.dia) BETWEEN :de AND :ate
+            ORDER BY UltimaVisita
+            """,
+            de=de.isoformat(), ate=ate.isoformat()
+        )
+        df['UltimaVisita'] = [date.fromisoformat(d) for d in df['UltimaVisita']]
+        df.insert(3, "DiasSemVir", [(hoje - d).days for d in df['UltimaVisita']])
+        return df
@@ -0,0 +1,148 @@
+from collections import namedtuple
+from datetime import date
+from types import MappingProxyType
+import numpy as np
+
+# ==========================================
+# GRADE DE CAPACIDADE E HORÁRIOS
+# ==========================================
+# A tabela 'modelos_horario' diz, por dia da semana (0 = Segunda ... 6 =
+# Domingo) ou por data específica, que aparelhos existem em cada faixa de
+# horário. Uma data com linhas próprias ignora as do dia da semana (feriado
+# fechado = uma linha com layout vazio). Horário sem linha = fechado.
+#
+# Layout: "Treino:10,Esteira:2,Elíptico:1" -> Treino 1..10, Esteira 11..12, Elíptico 13.
+#
+# GradeCapacidade é montada uma vez a partir das linhas e não muda:
+# a grade de vagas, a busca e os horários de funcionamento leem daqui sem
+# consultar o banco nem refazer listas. Editar um modelo troca a grade
+# inteira (utils.get_grade / utils.salvar_modelos_horario).
+
+Vaga = namedtuple("Vaga", ["Numero", "Tipo"])
+
+HORAS_DO_DIA = [f"{h:02d}:00" for h in range(24)]
+DIAS_SEMANA = {0: "Segunda", 1: "Terça", 2: "Quarta", 3: "Quinta", 4: "Sexta", 5: "Sábado", 6: "Domingo"}
+
+# Grade original (antes da tabela): almoço 12h-14h com menos aparelhos,
+# Sábado 08h às 12h, Domingo fechado. Usada para popular a tabela vazia.
+LAYOUT_NORMAL = "Treino:10,Esteira:2,Elíptico:1"
+LAYOUT_ALMOCO = "Treino:6,Esteira:2,Elíptico:1"
+MODELOS_PADRAO = [
+    *[
+        linha for dia_semana in range(5) for linha in (
+            {"dia_semana": dia_semana, "dia": None, "hora_inicio": "06:00", "hora_fim": "11:00", "layout": LAYOUT_NORMAL},
+            {"dia_semana": dia_semana, "dia": None, "hora_inicio": "12:00", "hora_fim": "14:00", "layout": LAYOUT_ALMOCO},
+            {"dia_semana": dia_semana, "dia": None, "hora_inicio": "15:00", "hora_fim": "20:00", "layout": LAYOUT_NORMAL},
+        )
+    ],
+    {"dia_semana": 5, "dia": None, "hora_inicio": "08:00", "hora_fim": "11:00", "layout": LAYOUT_NORMAL},
+    {"dia_semana": 5, "dia": None, "hora_inicio": "12:00", "hora_fim": "12:00", "layout": LAYOUT_ALMOCO},
+]
+
+
+def ler_layout(layout):
+    """Texto do layout -> tupla de Vaga numerada em sequência. Vazio = fechado."""
+    vagas = []
+    for parte in (layout or "").split(","):
+        if not parte.strip():
+            continue
+        tipo, _, quantidade = parte.rpartition(":")
+        if not tipo.strip() or not quantidade.strip().isdigit():
+            raise ValueError(f"Layout inválido: '{parte.strip()}' (use Tipo:Quantidade)")
+        for _ in range(int(quantidade)):
+            vagas.append(Vaga(len(vagas) + 1, tipo.strip()))
+    return tuple(vagas)
+
+
+def validar_modelo(linha):
+    """Levanta ValueError com a mensagem para o admin se a linha não serve."""
+    if linha.get("dia_semana") is None and linha.get("dia") is None:
+        raise ValueError("Cada linha precisa de um dia da semana ou de uma data.")
+    for campo in ("hora_inicio", "hora_fim"):
+        if linha.get(campo) not in HORAS_DO_DIA:
+            raise ValueError(f"Horário inválido: '{linha.get(campo)}' (use HH:00)")
+    if linha["hora_inicio"] > linha["hora_fim"]:
+        raise ValueError(f"Faixa invertida: {linha['hora_inicio']} a {linha['hora_fim']}")
+    ler_layout(linha.get("layout"))
+
+
+class GradeCapacidade:
+    """Vagas por (dia, horário), pré-calculadas e somente leitura."""
+
+    def __init__(self, linhas):
+        por_semana = {d: {} for d in DIAS_SEMANA}
+        por_data = {}
+        layouts = {}
+        for linha in linhas:
+            if linha.get("dia") is not None:
+                horas = por_data.setdefault(linha["dia"], {})
+            else:
+                horas = por_semana[int(linha["dia_semana"])]
+            # Mesmo layout em várias linhas: uma tupla só
+            vagas = layouts.setdefault(linha["layout"] or "", ler_layout(linha["layout"]))
+            for hora in HORAS_DO_DIA:
+                if linha["hora_inicio"] <= hora <= linha["hora_fim"]:
+                    horas[hora] = vagas # Linhas posteriores vencem nas sobreposições
+        self._por_semana = MappingProxyType({d: MappingProxyType(h) for d, h in por_semana.items()})
+        self._por_data = MappingProxyType({d: MappingProxyType(h) for d, h in por_data.items()})
+        self.horas_possiveis = tuple(sorted({
+            hora for dias in (*self._por_semana.values(), *self._por_data.values())
+            for hora, vagas in dias.items() if vagas
+        }))
+        self._matrizes = {}
+
+    def _horas(self, dia):
+        return self._por_data.get(dia, self._por_semana[dia.weekday()])
+
+    def estrutura(self, dia, hora):
+        """Tupla de Vaga do horário (vazia se fechado)."""
+        return self._horas(dia).get(hora, ())
+
+    def horarios(self, dia):
+        """Horários de início com pelo menos uma vaga no dia."""
+        return [hora for hora, vagas in sorted(self._horas(dia).items()) if vagas]
+
+    def capacidade(self, dia, hora, tipo=None):
+        return sum(1 for v in self.estrutura(dia, hora) if tipo is None or v.Tipo == tipo)
+
+    def matrizes_capacidade(self, horas, tipos):
+        """
+        Capacidade em NumPy para o cubo de utilização (utilizacao.py):
+        (por_semana [7 x horas x tipos], {dia: [horas x tipos]} das datas com exceção).
+        Calculado uma vez por combinação de eixos; a grade não muda depois de montada.
+        """
+        chave = (tuple(horas), tuple(tipos))
+        if chave not in self._matrizes:
+            def matriz(dia_horas):
+                m = np.zeros((len(horas), len(tipos)), dtype=np.int32)
+                for i, hora in enumerate(horas):
+                    for vaga in dia_horas.get(hora, ()):
+                        if vaga.Tipo in tipos:
+                            m[i, tipos.index(vaga.Tipo)] += 1
+                return m
+            por_semana = np.stack([matriz(self._por_semana[d]) for d in range(7)])
+            por_data = {dia: matriz(h) for dia, h in self._por_data.items()}
+            self._matrizes[chave] = (por_semana, por_data)
+        return self._matrizes[chave]
+
+    def tipos(self):
+        """Modalidades que aparecem em algum layout, na ordem da grade."""
+        vistos = {}
+        for dias in (*self._por_semana.values(), *self._por_data.values()):
+            for vagas in dias.values():
+                for v in vagas:
+                    vistos.setdefault(v.Tipo, None)
+        return list(vistos)
+
+    def numero_maximo(self):
+        """Maior número de aparelho em algum layout (0 sem vagas)."""
+        return max((v.Numero for dias in (*self._por_semana.values(), *self._por_data.values())
+                    for vagas in dias.values() for v in vagas), default=0)
+
+
+if __name__ == "__main__":
+    grade = GradeCapacidade(MODELOS_PADRAO)
+    hoje = date.today()
+    print(hoje, grade.horarios(hoje))
+    for hora in grade.horarios(hoje):
+        print(f"  {hora}: {grade.capacidade(hoje, hora)} vagas | {grade.estrutura(hoje, hora)[-1]}")
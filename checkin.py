@@ -0,0 +1,239 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+# ==========================================
+# CHECK-INS DA RECEPÇÃO (GRAVAÇÃO EM LOTES)
+# ==========================================
+# Na porta, no pico, os check-ins chegam em rajadas: um commit por evento
+# seria uma ida ao banco (e uma conexão do pool) por aluno. Aqui cada
+# evento só entra numa fila em memória; uma thread grava a fila num único
+# INSERT por lote (armazenamento.inserir_checkins) quando junta TAMANHO_LOTE
+# eventos ou a cada INTERVALO_S segundos, o que vier primeiro.
+#
+# Durabilidade:
+#   - falha de conexão na gravação: o lote volta para o começo da fila e é
+#     tentado de novo no próximo ciclo (a ordem dos eventos se mantém);
+#   - erro nos dados (ex.: id que o banco recusa): o lote é dividido ao meio até
+#     isolar os eventos ruins, que vão para o arquivo de descartados
+#     (descartados_<unidade>.jsonl, nunca relido); o resto é gravado e a fila anda;
+#   - parada normal do processo (atexit, e o shutdown da API): a fila é
+#     descarregada; se o banco não responder, os eventos vão para um arquivo
+#     JSONL por unidade em PASTA_PENDENTES, relido na próxima subida;
+#   - processo morto à força (kill -9, queda da máquina): perde no máximo o
+#     que chegou no último intervalo ou lote ainda não gravado.
+#
+# Sem chave estrangeira para 'users': quem confere o aluno é a recepção, e um
+# id errado não pode derrubar o lote inteiro.
+
+TAMANHO_LOTE = int(os.environ.get("NAALLI_CHECKIN_LOTE", 200))
+INTERVALO_S = float(os.environ.get("NAALLI_CHECKIN_INTERVALO_S", 2))
+PASTA_PENDENTES = os.environ.get("NAALLI_CHECKIN_DIR", "checkins_pendentes")
+ORIGEM_PADRAO = "recepcao"
+ID_MAXIMO = 2 ** 31 - 1 # users.id é INTEGER no Postgres
+ESPERA_FECHAR_S = 10
+
+
+class IngestorCheckins:
+    """Fila de check-ins de uma unidade, gravada em lotes por uma thread própria."""
+
+    def __init__(self, armazenamento, tamanho_lote=TAMANHO_LOTE, intervalo_s=INTERVALO_S, pasta=PASTA_PENDENTES):
+        self.armazenamento = armazenamento
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_s = intervalo_s
+        self.arquivo = os.path.join(pasta, f"pendentes_{armazenamento.unidade}.jsonl")
+        self.arquivo_descartados = os.path.join(pasta, f"descartados_{armazenamento.unidade}.jsonl")
+        self._fila = deque()
+        self._lock = threading.Lock()        # Protege a fila e os contadores
+        self._escrita = threading.Lock()     # Um lote gravando por vez
+        self._cheio = threading.Event()
+        self._fechado = False
+        self.gravados = 0
+        self.lotes = 0
+        self.falhas = 0
+        self.descartados = 0
+
+        self._recuperar()
+        self._thread = threading.Thread(target=self._laco, name=f"naalli-checkins-{armazenamento.unidade}", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    @property
+    def pendentes(self):
+        return len(self._fila)
+
+    # --- ENTRADA ---
+    def registrar(self, user_id, momento=None, origem=ORIGEM_PADRAO):
+        """Enfileira um check-in (momento padrão: agora). Devolve quantos estão na fila."""
+        user_id = int(user_id)
+        if not 0 < user_id <= ID_MAXIMO:
+            raise ValueError(f"user_id fora do intervalo: {user_id}")
+        evento = {"user_id": user_id, "momento": momento or datetime.now(), "origem": origem}
+        with self._lock:
+            self._fila.append(evento)
+            pendentes = len(self._fila)
+        if self._fechado:
+            # Depois do fechamento não há thread: grava na hora
+            self.descarregar()
+        elif pendentes >= self.tamanho_lote:
+            self._cheio.set()
+        return pendentes
+
+    # --- GRAVAÇÃO ---
+    def descarregar(self):
+        """Grava toda a fila em lotes; devolve quantos gravou. Sem conexão, devolve à fila o que faltou e relança."""
+        gravados = 0
+        with self._escrita:
+            while True:
+                with self._lock:
+                    lote = [self._fila.popleft() for _ in range(min(self.tamanho_lote, len(self._fila)))]
+                if not lote:
+                    return gravados
+                gravados += self._gravar(lote)
+
+    def _gravar(self, lote):
+        # Pilha de partes ainda não gravadas, a primeira no topo
+        partes = [lote]
+        gravados = 0
+        while partes:
+            parte = partes.pop()
+            try:
+                self.armazenamento.inserir_checkins(parte)
+            except Exception as e:
+                if _erro_transitorio(e):
+                    restantes = [evento for p in [parte, *reversed(partes)] for evento in p]
+                    with self._lock:
+                        self._fila.extendleft(reversed(restantes))
+                        self.falhas += 1
+                    raise
+                if len(parte) == 1:
+                    self._descartar(parte[0], e)
+                else:
+                    meio = len(parte) // 2
+                    partes += [parte[meio:], parte[:meio]]
+                continue
+            gravados += len(parte)
+            with self._lock:
+                self.gravados += len(parte)
+                self.lotes += 1
+        return gravados
+
+    def _descartar(self, evento, erro):
+        with self._lock:
+            self.descartados += 1
+        _anexar(self.arquivo_descartados, [dict(evento, erro=f"{type(erro).__name__}: {erro}".splitlines()[0])])
+        print(f"Check-ins ({self.armazenamento.unidade}): evento recusado pelo banco, salvo em {self.arquivo_descartados}: {evento}")
+
+    def _laco(self):
+        while not self._fechado:
+            self._cheio.wait(self.intervalo_s)
+            self._cheio.clear()
+            if self._fechado:
+                return
+            try:
+                self.descarregar()
+            except Exception as e:
+                print(f"Check-ins ({self.armazenamento.unidade}): {self.pendentes} na fila, gravação falhou: {e}")
+
+    # --- PARADA E RECUPERAÇÃO ---
+    def fechar(self):
+        """Para a thread e grava o que sobrou; se o banco falhar, salva a fila no arquivo de pendentes."""
+        if self._fechado:
+            return
+        self._fechado = True
+        self._cheio.set()
+        self._thread.join(ESPERA_FECHAR_S)
+        try:
+            self.descarregar()
+        except Exception as e:
+            with self._lock:
+                eventos = list(self._fila)
+                self._fila.clear()
+            _anexar(self.arquivo, eventos)
+            print(f"Check-ins ({self.armazenamento.unidade}): banco indisponível ({e}), {len(eventos)} salvo(s) em {self.arquivo}")
+
+    def _recuperar(self):
+        # O rename reserva o arquivo: dois processos subindo juntos não relêem os mesmos eventos
+        reservado = f"{self.arquivo}.{os.getpid()}"
+        try:
+            os.rename(self.arquivo, reservado)
+        except FileNotFoundError:
+            return
+        with open(reservado, encoding="utf-8") as f:
+            eventos = [json.loads(linha) for linha in f if linha.strip()]
+        for evento in eventos:
+            evento['momento'] = datetime.fromisoformat(evento['momento'])
+        with self._lock:
+            self._fila.extend(eventos)
+        os.remove(reservado)
+        print(f"Check-ins ({self.armazenamento.unidade}): {len(eventos)} pendente(s) recuperado(s) de {self.arquivo}")
+
+
+def _erro_transitorio(e):
+    """Queda ou banco ocupado: o mesmo lote pode passar depois. O resto é erro nos dados."""
+    return isinstance(e, (OperationalError, InterfaceError)) or getattr(e, "connection_invalidated", False)
+
+def _anexar(arquivo, eventos):
+    os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+    with open(arquivo, "a", encoding="utf-8") as f:
+        for evento in eventos:
+            f.write(json.dumps(dict(evento, momento=evento['momento'].isoformat())) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+if __name__ == "__main__":
+    # Benchmark: um commit por check-in x fila em lotes, com alunos de teste.
+    #   DATABASE_URL=postgresql://... python checkin.py [eventos] [threads]
+    #   NAALLI_ARMAZENAMENTO=sqlite python checkin.py [eventos] [threads]
+    # Apaga os check-ins de teste (origem 'benchmark') no fim.
+    import sys
+    from sqlalchemy import text
+    from utils import get_armazenamento
+
+    eventos = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    armazenamento = get_armazenamento()
+    por_thread = eventos // n_threads
+
+    def em_threads(funcao):
+        threads = [threading.Thread(target=funcao, args=(i,)) for i in range(n_threads)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - t0
+
+    def um_por_vez(i):
+        for j in range(por_thread):
+            armazenamento.inserir_checkins([{"user_id": i * por_thread + j + 1, "momento": datetime.now(), "origem": "benchmark"}])
+
+    ingestor = IngestorCheckins(armazenamento, pasta=os.path.join(PASTA_PENDENTES, "benchmark"))
+
+    def em_lote(i):
+        for j in range(por_thread):
+            ingestor.registrar(i * por_thread + j + 1, origem="benchmark")
+
+    direto = em_threads(um_por_vez)
+    enfileirar = em_threads(em_lote)
+    t0 = time.perf_counter()
+    ingestor.fechar()
+    fechar = time.perf_counter() - t0
+    total = n_threads * por_thread
+    print(f"{armazenamento.nome}, {total} check-ins em {n_threads} threads:")
+    print(f"  um commit por evento: {direto * 1000:.0f} ms ({total / direto:.0f}/s)")
+    print(f"  fila em lotes:        {enfileirar * 1000:.0f} ms para enfileirar + {fechar * 1000:.0f} ms no fechamento "
+          f"({total / (enfileirar + fechar):.0f}/s, {ingestor.lotes} lote(s), {ingestor.falhas} falha(s))")
+
+    if armazenamento.nome == "postgres":
+        with armazenamento.conn.session as s:
+            s.execute(text("DELETE FROM checkins WHERE origem = 'benchmark'"))
+            s.commit()
+    else:
+        armazenamento._executar("DELETE FROM checkins WHERE origem = 'benchmark'")
@@ -0,0 +1,318 @@
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# ÍNDICE DE TERMOS DOS COMENTÁRIOS DAS AVALIAÇÕES
+# ==========================================
+# Cada comentário é quebrado em termos (palavras e pares de palavras
+# vizinhas, sem acento e sem stopwords) e recebe um sentimento de -1 a 1
+# contado num léxico simples (com "não", "sem"... invertendo as palavras
+# seguintes). O índice guarda só arrays:
+#   - por comentário: id, dia da aula, modalidade, nota, sentimento;
+#   - por ocorrência: (comentário, termo), cada termo uma vez por comentário.
+# "Termos das reclamações da Esteira no mês" é uma máscara e um np.bincount
+# sobre as ocorrências: milissegundos, sem reler nem retokenizar nada.
+#
+# Reclamação = sentimento negativo ou nota até NOTA_RECLAMACAO.
+#
+# Avaliações não são editadas nem apagadas pelo app: cada atualização lê só
+# as de id acima da última marca vista (com uma pequena sobreposição, como
+# no instantaneo.py) e tokeniza só essas.
+
+INTERVALO_ATUALIZACAO_S = 30
+SOBREPOSICAO_IDS = 100 # Relê os últimos ids: uma avaliação pode pegar id menor e gravar depois
+NOTA_RECLAMACAO = 2
+ALCANCE_NEGACAO = 3    # Palavras depois de um "não" que têm o sentimento invertido
+
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de dela dele deles do dos e ela elas ele eles em
+entre era eram essa esse esta estao estar estava estavam este eu foi foram ha
+isso isto ja la lhe mais mas me mesmo meu minha muito muita muitos muitas na nas
+nao no nos num numa o os ou para pela pelas pelo pelos por pra pro qual quando
+que quem se seja sem ser seu sua so sao tambem te tem tinha to tou ta tava um uma
+umas uns vai vou voce voces ainda aqui ali agora bem bastante cada coisa dia
+estou esta fica ficou fiz faz fazer hoje ontem onde porque pois quase sempre
+tudo todo toda todos todas vez vezes depois antes nem nunca jamais nenhum nenhuma
+achei acho gente ter teve tive sendo sido pode podia poderia deveria seria
+""".split())
+
+NEGACOES = frozenset(["nao", "nem", "nunca", "jamais", "sem", "nenhum", "nenhuma"])
+
+# Léxico sem acento, já no singular. Palavras curtas só valem inteiras;
+# os prefixos pegam as flexões (quebrou, quebrado, quebrada...).
+POSITIVAS = frozenset(["bom", "boa", "otimo", "otima", "top", "show", "amo", "amei", "adoro", "adorei", "legal", "melhor"])
+PREFIXOS_POSITIVOS = (
+    "excelent", "maravilh", "perfeit", "gost", "limp", "organiz", "atencios", "educad",
+    "tranquil", "confortavel", "rapid", "funcion", "ajud", "recomend", "incrivel",
+    "agradavel", "pontual", "parabens", "obrigad", "satisfeit", "feliz", "caprich",
+)
+NEGATIVAS = frozenset(["ruim", "pior", "mal", "dor", "caro", "calor", "quente", "cheio", "cheia", "fila", "sujo", "suja"])
+PREFIXOS_NEGATIVOS = (
+    "quebr", "pessim", "horrivel", "lotad", "sujeira", "barulh", "abafad", "demor", "atras",
+    "falt", "defeit", "estrag", "problem", "reclam", "desconfort", "apertad", "lent",
+    "machuc", "perig", "insuficient", "dificil", "fedor", "descuid", "desorganiz",
+    "bagunc", "grosseir", "incomod", "decepcion", "chat", "travad", "enguic",
+)
+
+
+# ==========================================
+# TOKENIZAÇÃO E SENTIMENTO
+# ==========================================
+
+def _sem_acento(texto):
+    return unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode()
+
+@lru_cache(maxsize=65536)
+def _singular(palavra):
+    """Plural regular -> singular (aparelhos, condicoes, professores, horriveis, bons)."""
+    if len(palavra) <= 3:
+        return palavra
+    for fim, troca in (("oes", "ao"), ("aes", "ao"), ("eis", "el"), ("ais", "al"), ("res", "r"), ("zes", "z"), ("ns", "m")):
+        if palavra.endswith(fim):
+            return palavra[:-len(fim)] + troca
+    if palavra.endswith("s") and palavra[-2] in "aeiou" and not palavra.endswith(("is", "us")):
+        return palavra[:-1]
+    return palavra
+
+@lru_cache(maxsize=65536)
+def _polaridade(palavra):
+    if palavra in POSITIVAS or palavra.startswith(PREFIXOS_POSITIVOS):
+        return 1
+    if palavra in NEGATIVAS or palavra.startswith(PREFIXOS_NEGATIVOS):
+        return -1
+    return 0
+
+def analisar(texto):
+    """
+    (termos, sentimento): termos únicos do comentário (palavras e pares de
+    palavras vizinhas na mesma frase) e sentimento em [-1, 1].
+    """
+    termos = set()
+    positivo = negativo = 0
+    for frase in re.split(r"[.,;:!?\n]+", _sem_acento(texto)):
+        negar, negacao = 0, None
+        anterior = None
+        for palavra in re.findall(r"[a-z]+", frase):
+            if palavra in NEGACOES:
+                negar, negacao = ALCANCE_NEGACAO, palavra
+                continue
+            palavra = _singular(palavra)
+            polaridade = _polaridade(palavra)
+            if negar and polaridade:
+                # "não funciona", "sem fila" viram um termo só, sem par com a palavra anterior
+                polaridade = -polaridade
+                termos.add(f"{negacao} {palavra}")
+                anterior = None
+            elif palavra not in STOPWORDS and len(palavra) >= 2:
+                termos.add(palavra)
+                if anterior:
+                    termos.add(f"{anterior} {palavra}")
+                anterior = palavra
+            negar = max(negar - 1, 0)
+            if palavra.startswith("falt"): # "falta limpeza": conta a falta e inverte a limpeza
+                negar, negacao = ALCANCE_NEGACAO, palavra
+            positivo += polaridade > 0
+            negativo += polaridade < 0
+    sentimento = (positivo - negativo) / (positivo + negativo) if positivo + negativo else 0.0
+    return termos, sentimento
+
+
+# ==========================================
+# ÍNDICE
+# ==========================================
+
+_VAZIO = {
+    "id": np.zeros(0, np.int64), "dia": np.zeros(0, "datetime64[D]"), "tipo": np.zeros(0, np.int32),
+    "nota": np.zeros(0, np.float64), "sentimento": np.zeros(0, np.float64),
+    "oc_comentario": np.zeros(0, np.int64), "oc_termo": np.zeros(0, np.int32), "n_termos": 0,
+}
+
+
+class IndiceComentarios:
+    """Termos e sentimento dos comentários, atualizado só com as avaliações novas."""
+
+    def __init__(self, armazenamento):
+        self._armazenamento = armazenamento
+        self._lock = threading.Lock()
+        self.termos = []   # código -> termo (só cresce: códigos antigos continuam válidos)
+        self._codigos = {} # termo -> código
+        self.tipos = []
+        self._codigos_tipo = {}
+        self._dados = _VAZIO # Trocado inteiro a cada atualização: leitura sem trava
+        self.id_maximo = 0
+        self.atualizado_em = None
+
+    # --- ATUALIZAÇÃO ---
+    def atualizar(self, forcar=False):
+        if not forcar and self._recente():
+            return
+        with self._lock:
+            if not forcar and self._recente():
+                return
+            marca = max(self.id_maximo - SOBREPOSICAO_IDS, 0)
+            novos = self._armazenamento.avaliacoes_desde(marca)
+            dados = self._dados
+            if not novos.empty:
+                novos = novos[~np.isin(novos["id"].to_numpy(np.int64), dados["id"][dados["id"] > marca])]
+            if not novos.empty:
+                self._dados = self._indexar(novos, dados)
+                self.id_maximo = max(self.id_maximo, int(novos["id"].max()))
+            self.atualizado_em = time.monotonic()
+
+    def _recente(self):
+        return self.atualizado_em is not None and time.monotonic() - self.atualizado_em < INTERVALO_ATUALIZACAO_S
+
+    def _codigo(self, valor, codigos, lista):
+        codigo = codigos.get(valor)
+        if codigo is None:
+            codigo = codigos[valor] = len(lista)
+            lista.append(valor)
+        return codigo
+
+    def _indexar(self, novos, dados):
+        base = len(dados["id"])
+        oc_comentario, oc_termo, sentimentos = [], [], []
+        for i, texto in enumerate(novos["Comentario"].tolist()):
+            termos, sentimento = analisar(texto or "")
+            sentimentos.append(sentimento)
+            oc_termo.extend(self._codigo(t, self._codigos, self.termos) for t in termos)
+            oc_comentario.extend([base + i] * len(termos))
+        tipos = [self._codigo(t, self._codigos_tipo, self.tipos) for t in novos["Modalidade"].fillna("").tolist()]
+        dias = pd.to_datetime(novos["DataAula"], format="%d/%m/%Y", errors="coerce").to_numpy(dtype="datetime64[D]")
+
+        return {
+            "id": np.concatenate([dados["id"], novos["id"].to_numpy(np.int64)]),
+            "dia": np.concatenate([dados["dia"], dias]),
+            "tipo": np.concatenate([dados["tipo"], np.array(tipos, np.int32)]),
+            "nota": np.concatenate([dados["nota"], pd.to_numeric(novos["Nota"], errors="coerce").to_numpy(np.float64)]),
+            "sentimento": np.concatenate([dados["sentimento"], np.array(sentimentos, np.float64)]),
+            "oc_comentario": np.concatenate([dados["oc_comentario"], np.array(oc_comentario, np.int64)]),
+            "oc_termo": np.concatenate([dados["oc_termo"], np.array(oc_termo, np.int32)]),
+            "n_termos": len(self.termos),
+        }
+
+    # --- CONSULTAS ---
+    def _filtro(self, dados, inicio, fim, tipos):
+        filtro = np.ones(len(dados["id"]), dtype=bool)
+        if inicio:
+            filtro &= dados["dia"] >= np.datetime64(inicio, "D")
+        if fim:
+            filtro &= dados["dia"] <= np.datetime64(fim, "D")
+        if tipos is not None:
+            codigos = [self._codigos_tipo[t] for t in tipos if t in self._codigos_tipo]
+            filtro &= np.isin(dados["tipo"], codigos)
+        return filtro
+
+    def reclamacoes(self, dados):
+        return (dados["sentimento"] < 0) | (dados["nota"] <= NOTA_RECLAMACAO)
+
+    def termos_reclamacoes(self, inicio=None, fim=None, tipos=None, limite=15):
+        """
+        Termos mais citados nas reclamações do período/modalidades.
+        Colunas: Termo, Reclamacoes (comentários negativos que citam),
+        Mencoes (todos os comentários que citam), NotaMedia, Sentimento.
+        """
+        self.atualizar()
+        dados = self._dados
+        filtro = self._filtro(dados, inicio, fim, tipos)
+        recl = filtro & self.reclamacoes(dados)
+
+        oc_filtro = filtro[dados["oc_comentario"]]
+        oc_recl = recl[dados["oc_comentario"]]
+        termos = dados["oc_termo"]
+        n = dados["n_termos"]
+        contagem = np.bincount(termos[oc_recl], minlength=n)
+        if not contagem.any():
+            return pd.DataFrame(columns=["Termo", "Reclamacoes", "Mencoes", "NotaMedia", "Sentimento"])
+
+        mencoes = np.bincount(termos[oc_filtro], minlength=n)
+        soma_nota = np.bincount(termos[oc_filtro], weights=dados["nota"][dados["oc_comentario"]][oc_filtro], minlength=n)
+        soma_sent = np.bincount(termos[oc_filtro], weights=dados["sentimento"][dados["oc_comentario"]][oc_filtro], minlength=n)
+
+        # Candidatos com folga: palavras soltas que só aparecem dentro de um par
+        # ("ar", "condicionado" e "ar condicionado") ficam só como o par
+        candidatos = np.nonzero(contagem)[0]
+        candidatos = candidatos[np.lexsort((-mencoes[candidatos], -contagem[candidatos]))][:limite * 3]
+        pares = [(self.termos[c], contagem[c]) for c in candidatos if " " in self.termos[c]]
+        escolhidos = [
+            c for c in candidatos
+            if " " in self.termos[c] or not any(q == contagem[c] and self.termos[c] in p.split() for p, q in pares)
+        ][:limite]
+
+        escolhidos = np.array(escolhidos, np.int64)
+        return pd.DataFrame({
+            "Termo": [self.termos[c] for c in escolhidos],
+            "Reclamacoes": contagem[escolhidos],
+            "Mencoes": mencoes[escolhidos],
+            "NotaMedia": (soma_nota[escolhidos] / mencoes[escolhidos]).round(1),
+            "Sentimento": (soma_sent[escolhidos] / mencoes[escolhidos]).round(2),
+        })
+
+    def sentimento_por_modalidade(self, inicio=None, fim=None):
+        """Colunas: Modalidade, Comentarios, Sentimento (médio), Reclamacoes (fração)."""
+        self.atualizar()
+        dados = self._dados
+        filtro = self._filtro(dados, inicio, fim, None)
+        tipo = dados["tipo"][filtro]
+        n = len(self.tipos)
+        total = np.bincount(tipo, minlength=n)
+        soma = np.bincount(tipo, weights=dados["sentimento"][filtro], minlength=n)
+        recl = np.bincount(tipo, weights=self.reclamacoes(dados)[filtro], minlength=n)
+        com = np.nonzero(total)[0]
+        return pd.DataFrame({
+            "Modalidade": [self.tipos[c] for c in com],
+            "Comentarios": total[com],
+            "Sentimento": (soma[com] / total[com]).round(2),
+            "Reclamacoes": (recl[com] / total[com]).round(3),
+        })
+
+
+if __name__ == "__main__":
+    # Benchmark com comentários sintéticos: python comentarios.py [avaliacoes]
+    import sys
+    from datetime import date, timedelta
+
+    class _Falso:
+        """Só o método que o índice usa, com as avaliações numa lista."""
+        def __init__(self):
+            self.df = pd.DataFrame(columns=["id", "Modalidade", "Nota", "Comentario", "DataAula"])
+
+        def avaliacoes_desde(self, id_minimo):
+            return self.df[self.df["id"] > id_minimo]
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    frases_ruins = ["A esteira 3 está quebrada de novo", "ar condicionado não funciona, muito calor",
+                    "Academia muito cheia, fila para os aparelhos", "Falta limpeza nos vestiários",
+                    "Elíptico fazendo barulho", "Professores demoram para atender", "Não gostei, estava lotado"]
+    frases_boas = ["Ótimo treino, professores atenciosos", "Tudo limpo e organizado, adorei",
+                   "Equipamentos novos, excelente", "Treino tranquilo, sem fila", "Muito bom!"]
+    ruim = rng.random(total) < 0.3
+    hoje = date.today()
+    falso = _Falso()
+    falso.df = pd.DataFrame({
+        "id": np.arange(1, total + 1),
+        "Modalidade": rng.choice(["Treino", "Esteira", "Elíptico"], total, p=[0.75, 0.17, 0.08]),
+        "Nota": np.where(ruim, rng.integers(1, 4, total), rng.integers(4, 6, total)),
+        "Comentario": np.where(ruim, rng.choice(frases_ruins, total), rng.choice(frases_boas, total)),
+        "DataAula": [(hoje - timedelta(days=int(d))).strftime("%d/%m/%Y") for d in rng.integers(0, 365, total)],
+    })
+
+    indice = IndiceComentarios(falso)
+    t0 = time.perf_counter()
+    indice.atualizar()
+    t1 = time.perf_counter()
+    falso.df = pd.concat([falso.df, falso.df.tail(50).assign(id=np.arange(total + 1, total + 51))], ignore_index=True)
+    indice.atualizar(forcar=True)
+    t2 = time.perf_counter()
+    resultado = indice.termos_reclamacoes(hoje - timedelta(days=30), hoje, ["Esteira"])
+    t3 = time.perf_counter()
+    print(f"{total} comentários: índice inicial {(t1 - t0) * 1000:.0f} ms, +50 novos {(t2 - t1) * 1000:.1f} ms, "
+          f"consulta {(t3 - t2) * 1000:.1f} ms ({len(indice.termos)} termos)")
+    print(resultado.to_string(index=False))
+    print(indice.sentimento_por_modalidade().to_string(index=False))
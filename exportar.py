@@ -0,0 +1,123 @@
+import argparse
+import csv
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from armazenamento import UNIDADES, UNIDADE_PADRAO
+from armazenamento_postgres import get_conexao
+
+# ==========================================
+# EXPORTAÇÃO EM STREAMING (PARQUET / CSV)
+# ==========================================
+# Lê com cursor do lado do servidor (stream_results) e grava lote a lote,
+# então a memória usada não depende do tamanho do histórico. Cada exportação
+# é de uma unidade (no banco dela).
+
+TAMANHO_LOTE = 5000
+
+# Colunas exportadas, a expressão de data e a coluna de modalidade usadas
+# nos mesmos filtros da sidebar do admin.
+TABELAS = {
+    "agendamentos": {
+        "schema": pa.schema([
+            ("id", pa.int64()), ("unidade", pa.string()), ("data", pa.string()), ("horario", pa.string()),
+            ("numero", pa.int64()), ("tipo", pa.string()), ("nome", pa.string()),
+            ("criado_em", pa.string()), ("user_id", pa.int64()),
+        ]),
+        "col_data": "dia",  # Chave de partição: o filtro só lê os meses pedidos
+        "col_tipo": "tipo",
+    },
+    "avaliacoes": {
+        "schema": pa.schema([
+            ("id", pa.int64()), ("unidade", pa.string()), ("id_agendamento", pa.int64()), ("nome_aluno", pa.string()),
+            ("data_aula", pa.string()), ("modalidade", pa.string()), ("nota", pa.int64()),
+            ("comentario", pa.string()), ("data_avaliacao", pa.string()), ("user_id", pa.int64()),
+        ]),
+        "col_data": "to_date(data_aula, 'DD/MM/YYYY')",
+        "col_tipo": "modalidade",
+    },
+}
+
+def _montar_consulta(tabela, unidade, inicio=None, fim=None, tipos=None):
+    cfg = TABELAS[tabela]
+    colunas = ", ".join(cfg["schema"].names)
+    filtros, params = ["unidade = :unidade"], {"unidade": unidade}
+
+    if inicio:
+        filtros.append(f"{cfg['col_data']} >= :inicio")
+        params["inicio"] = inicio
+    if fim:
+        filtros.append(f"{cfg['col_data']} <= :fim")
+        params["fim"] = fim
+    if tipos is not None:
+        filtros.append(f"{cfg['col_tipo']} = ANY(:tipos)")
+        params["tipos"] = list(tipos)
+
+    return f"SELECT {colunas} FROM {tabela} WHERE {' AND '.join(filtros)} ORDER BY id", params
+
+def exportar_consulta(sql, params, schema, caminho, formato="parquet", tamanho_lote=TAMANHO_LOTE, unidade=None):
+    """
+    Grava o resultado de 'sql' em Parquet ou CSV, lote a lote.
+    As colunas do SELECT devem seguir a ordem de 'schema'; a consulta roda no
+    banco da unidade. Retorna o número de linhas.
+    """
+    if formato not in ("parquet", "csv"):
+        raise ValueError(f"Formato inválido: {formato}")
+
+    total = 0
+    with get_conexao(unidade).engine.connect() as c:
+        resultado = c.execution_options(stream_results=True, max_row_buffer=tamanho_lote).execute(text(sql), params)
+
+        if formato == "parquet":
+            with pq.ParquetWriter(caminho, schema) as writer:
+                for lote in resultado.partitions(tamanho_lote):
+                    colunas = list(zip(*lote))
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(col, type=campo.type) for col, campo in zip(colunas, schema)],
+                        schema=schema,
+                    ))
+                    total += len(lote)
+        else:
+            with open(caminho, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(schema.names)
+                for lote in resultado.partitions(tamanho_lote):
+                    writer.writerows(lote)
+                    total += len(lote)
+
+    return total
+
+def exportar(tabela, caminho, formato="parquet", inicio=None, fim=None, tipos=None, tamanho_lote=TAMANHO_LOTE, unidade=None):
+    """
+    Exporta 'agendamentos' ou 'avaliacoes' de uma unidade para um arquivo
+    Parquet ou CSV. Retorna o número de linhas gravadas.
+    """
+    if tabela not in TABELAS:
+        raise ValueError(f"Tabela inválida: {tabela}")
+
+    unidade = unidade or UNIDADE_PADRAO
+    sql, params = _montar_consulta(tabela, unidade, inicio, fim, tipos)
+    return exportar_consulta(sql, params, TABELAS[tabela]["schema"], caminho, formato, tamanho_lote, unidade)
+
+def _data_br(valor):
+    return datetime.strptime(valor, "%d/%m/%Y").date()
+
+if __name__ == "__main__":
+    # Exemplo:
+    #   python exportar.py agendamentos agendamentos.parquet --inicio 01/01/2025 --fim 31/12/2025 --tipos Treino Esteira --unidade centro
+    parser = argparse.ArgumentParser(description="Exporta agendamentos/avaliações da Agenda Naalli.")
+    parser.add_argument("tabela", choices=list(TABELAS))
+    parser.add_argument("caminho", help="Arquivo de saída (.parquet ou .csv)")
+    parser.add_argument("--formato", choices=["parquet", "csv"], help="Padrão: deduzido da extensão do arquivo")
+    parser.add_argument("--inicio", type=_data_br, help="Data inicial (DD/MM/YYYY)")
+    parser.add_argument("--fim", type=_data_br, help="Data final (DD/MM/YYYY)")
+    parser.add_argument("--tipos", nargs="*", help="Modalidades (ex.: Treino Esteira Elíptico)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Linhas por lote")
+    parser.add_argument("--unidade", choices=UNIDADES, default=UNIDADE_PADRAO)
+    args = parser.parse_args()
+
+    formato = args.formato or ("csv" if args.caminho.lower().endswith(".csv") else "parquet")
+    print(f"⏳ Exportando {args.tabela} ({args.unidade}) para {args.caminho} ({formato})...")
+    n = exportar(args.tabela, args.caminho, formato, args.inicio, args.fim, args.tipos, args.lote, args.unidade)
+    print(f"✅ {n} linha(s) exportada(s).")
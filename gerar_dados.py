@@ -1,8 +1,9 @@
-# Importa a conexão (conn) inteligente que já criamos no utils.py
-from utils import conn
-from sqlalchemy import text
+# Grava pelo armazenamento configurado (Postgres ou SQLite, ver armazenamento.py)
+#   python gerar_dados.py [unidade]
+import sys
+from utils import get_armazenamento, data_para_dia
 
-def rodar_seed():
+def rodar_seed(unidade=None):
     dados = [
         # Data, Hora, Numero, Tipo, Nome
         ('15/12/2025', '07:00', 1, 'Treino', 'Ana Clara'),
@@ -24,16 +25,12 @@ def rodar_seed():
     print("⏳ Inserindo dados no banco...")
     
     try:
-        with conn.session as s:
-            for d in dados:
-                s.execute(text("""
-                    INSERT INTO agendamentos (data, horario, numero, tipo, nome, pin, criado_em)
-                    VALUES (:data, :hora, :num, :tipo, :nome, 'SEED', '2025-12-16 00:00:00')
-                """), params={"data": d[0], "hora": d[1], "num": d[2], "tipo": d[3], "nome": d[4]})
-            s.commit()
+        armazenamento = get_armazenamento(unidade)
+        for d in dados:
+            armazenamento.inserir_agendamento(d[0], data_para_dia(d[0]), d[1], d[2], d[3], d[4], 'SEED', None)
         print("✅ Dados inseridos com sucesso! Pode abrir o painel.")
     except Exception as e:
         print(f"❌ Erro ao inserir: {e}")
 
 if __name__ == "__main__":
-    rodar_seed()
\ No newline at end of file
+    rodar_seed(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
@@ -0,0 +1,124 @@
+import threading
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ==========================================
+# INSTANTÂNEO COMPARTILHADO DOS AGENDAMENTOS
+# ==========================================
+# Uma única cópia do histórico por processo, em uma tabela Arrow imutável,
+# lida por todas as sessões (utils.carregar_tudo_formatado). Depois da
+# primeira carga, cada atualização busca só:
+#   - agendamentos com id acima da última marca vista;
+#   - remoções novas em 'agendamentos_removidos' (lápides gravadas por trigger).
+# As duas leituras relêem uma janela dos últimos ids/seqs: no Postgres uma
+# transação pode pegar o número menor e gravar depois de uma de número maior.
+# A leitura não trava: cada atualização troca a referência por uma tabela nova.
+
+INTERVALO_ATUALIZACAO_S = 5      # Sessões no mesmo intervalo compartilham a mesma consulta de delta
+RECARGA_COMPLETA_S = 6 * 60 * 60 # Recarga total de tempos em tempos (lápides antigas são apagadas)
+SOBREPOSICAO_IDS = 100           # Relê os últimos ids: uma reserva pode pegar id menor e gravar depois
+SOBREPOSICAO_REMOCOES = 100      # Idem para o seq das lápides (um cancelamento lento não se perde)
+MAX_PEDACOS = 64                 # Acima disso, junta os pedaços da tabela em um só
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()), ("dia", pa.date32()), ("Data", pa.string()), ("Horario", pa.string()),
+    ("Numero", pa.int64()), ("Tipo", pa.string()), ("Nome", pa.string()), ("Pin", pa.string()),
+    ("CriadoEm", pa.string()),
+])
+
+
+class InstantaneoAgendamentos:
+    """Histórico de agendamentos em memória, atualizado por delta."""
+
+    def __init__(self, armazenamento):
+        self._armazenamento = armazenamento
+        self._lock = threading.Lock()
+        self.tabela = SCHEMA.empty_table()
+        self.id_maximo = 0
+        self.ultima_remocao = 0
+        self._remocoes_vistas = set() # seqs já aplicados dentro da janela de sobreposição
+        self.atualizado_em = None
+        self.carregado_em = None
+        self.versao = 0 # Muda sempre que a tabela muda (chave de cache de quem deriva dela)
+
+    # --- LEITURA ---
+    def agendamentos(self, inicio=None, fim=None):
+        """
+        DataFrame do período (datas opcionais), com colunas Arrow: o pandas
+        aponta para os mesmos buffers, sem copiar a tabela.
+        """
+        self.atualizar()
+        tabela = self.tabela
+        filtro = None
+        if inicio:
+            filtro = pc.field("dia") >= pa.scalar(inicio, pa.date32())
+        if fim:
+            ate = pc.field("dia") <= pa.scalar(fim, pa.date32())
+            filtro = ate if filtro is None else filtro & ate
+        if filtro is not None:
+            tabela = tabela.filter(filtro)
+        return tabela.to_pandas(types_mapper=pd.ArrowDtype)
+
+    # --- ATUALIZAÇÃO ---
+    def atualizar(self, forcar=False):
+        if not forcar and self._recente():
+            return
+        with self._lock:
+            if not forcar and self._recente():
+                return
+            if self.carregado_em is None or time.monotonic() - self.carregado_em > RECARGA_COMPLETA_S:
+                self._carregar_tudo()
+            else:
+                self._aplicar_delta()
+            self.atualizado_em = time.monotonic()
+
+    def _recente(self):
+        return self.atualizado_em is not None and time.monotonic() - self.atualizado_em < INTERVALO_ATUALIZACAO_S
+
+    def _para_arrow(self, df):
+        if df.empty:
+            return SCHEMA.empty_table()
+        return pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+    def _carregar_tudo(self):
+        # A marca das lápides é lida antes dos dados: uma remoção durante a
+        # carga volta no próximo delta (reaplicar é inofensivo)
+        ultima_remocao = self._armazenamento.ultima_remocao()
+        tabela = self._para_arrow(self._armazenamento.agendamentos_desde(0)).combine_chunks()
+        self.tabela = tabela
+        self.id_maximo = pc.max(tabela["id"]).as_py() or 0
+        self.ultima_remocao = ultima_remocao
+        self._remocoes_vistas = set()
+        self.carregado_em = time.monotonic()
+        self.versao += 1
+
+    def _aplicar_delta(self):
+        # Lápides antes das linhas: o que for removido depois desta leitura
+        # some das linhas novas ou chega no próximo delta
+        remocoes = self._armazenamento.remocoes_desde(max(self.ultima_remocao - SOBREPOSICAO_REMOCOES, 0))
+        remocoes = remocoes[~remocoes["seq"].isin(self._remocoes_vistas)] # Reaplicar é inofensivo, mas mudaria a versão
+        marca = max(self.id_maximo - SOBREPOSICAO_IDS, 0)
+        novos = self._armazenamento.agendamentos_desde(marca)
+
+        ja_vistos = pc.sum(pc.greater(self.tabela["id"], marca)).as_py() or 0
+        if remocoes.empty and len(novos) == ja_vistos:
+            return
+
+        # Linhas da janela de sobreposição são trocadas pela versão recém-lida
+        descartar = pa.array(remocoes["id"].tolist() + novos["id"].tolist(), pa.int64())
+        tabela = self.tabela.filter(pc.invert(pc.is_in(self.tabela["id"], value_set=descartar)))
+        if not novos.empty:
+            tabela = pa.concat_tables([tabela, self._para_arrow(novos)])
+        if tabela["id"].num_chunks > MAX_PEDACOS:
+            tabela = tabela.combine_chunks()
+
+        self.tabela = tabela
+        self.versao += 1
+        if not novos.empty:
+            self.id_maximo = max(self.id_maximo, int(novos["id"].max()))
+        if not remocoes.empty:
+            self.ultima_remocao = max(self.ultima_remocao, int(remocoes["seq"].max()))
+            piso = self.ultima_remocao - SOBREPOSICAO_REMOCOES
+            self._remocoes_vistas = {seq for seq in self._remocoes_vistas.union(remocoes["seq"].astype(int)) if seq > piso}
@@ -0,0 +1,202 @@
+import argparse
+import glob
+import os
+import re
+from datetime import date
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+from armazenamento import UNIDADES, UNIDADE_PADRAO
+from armazenamento_postgres import (
+    get_conexao, get_db_url, inicializar_banco, particionamento_agendamentos, garantir_particoes,
+    nome_particao, sql_criar_particao_unidade, sql_criar_particao, proximo_mes,
+    SQL_CRIAR_AGENDAMENTOS, MESES_PARTICOES_FUTURAS, _particoes_conhecidas
+)
+from exportar import exportar_consulta, TABELAS
+
+# ==========================================
+# MANUTENÇÃO DAS PARTIÇÕES E ARQUIVO MORTO
+# ==========================================
+# 'agendamentos' é particionada por unidade (LIST) e, dentro de cada unidade,
+# por mês (RANGE): agendamentos_<unidade>_AAAA_MM. Partições antigas saem do
+# banco e viram arquivos Parquet locais (um por unidade e mês). O Admin lê
+# esses arquivos só em "Todo o Histórico".
+
+PASTA_ARQUIVO = os.environ.get("NAALLI_ARQUIVO_DIR", "arquivo")
+MESES_NO_BANCO = 12
+
+def _padrao_particao(unidade):
+    # Sem unidade: partições (e arquivos) de antes das unidades
+    return re.compile(rf"^{nome_particao(unidade)}_(\d{{4}})_(\d{{2}})$")
+
+def somar_meses(dia, meses):
+    total = dia.year * 12 + (dia.month - 1) + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+def listar_particoes(unidade=None):
+    """Retorna [(nome, primeiro_dia_do_mes)] das partições mensais da unidade, em ordem."""
+    # No esquema só por mês as partições são de todas as unidades do banco
+    pai = (unidade or UNIDADE_PADRAO) if particionamento_agendamentos(unidade) == "unidade" else None
+    df = get_conexao(unidade).query(
+        "SELECT c.relname AS nome FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:pai)",
+        params={"pai": nome_particao(pai)}, ttl=0
+    )
+    padrao = _padrao_particao(pai)
+    particoes = []
+    for nome in df['nome'] if not df.empty else []:
+        m = padrao.match(nome)
+        if m:
+            particoes.append((nome, date(int(m.group(1)), int(m.group(2)), 1)))
+    return sorted(particoes, key=lambda p: p[1])
+
+def migrar_para_particionado(unidade=None):
+    """
+    Converte um banco antigo ('agendamentos' sem partição ou só por mês) para
+    partições por unidade e mês. Vale para o banco inteiro da unidade.
+    """
+    if particionamento_agendamentos(unidade) == "unidade":
+        print("✅ 'agendamentos' já é particionada por unidade.")
+        return
+
+    conexao = get_conexao(unidade)
+    do_banco = [u for u in UNIDADES if get_db_url(u) == get_db_url(unidade)]
+    with conexao.session as s:
+        s.execute(text("LOCK TABLE agendamentos IN ACCESS EXCLUSIVE MODE"))
+        s.execute(text("UPDATE agendamentos SET dia = to_date(data, 'DD/MM/YYYY') WHERE dia IS NULL"))
+        periodos = {u: (primeiro, ultimo) for u, primeiro, ultimo in s.execute(
+            text("SELECT unidade, min(dia), max(dia) FROM agendamentos GROUP BY unidade")
+        )}
+
+        # As partições mensais antigas vão junto e somem com o DROP no fim
+        s.execute(text("ALTER TABLE agendamentos RENAME TO agendamentos_legado"))
+        s.execute(text(SQL_CRIAR_AGENDAMENTOS))
+
+        hoje = date.today()
+        for u in sorted(set(do_banco) | set(periodos)):
+            primeiro, ultimo = periodos.get(u, (None, None))
+            s.execute(text(sql_criar_particao_unidade(u)))
+            mes = (primeiro or hoje).replace(day=1)
+            limite = somar_meses(max(ultimo or hoje, hoje), MESES_PARTICOES_FUTURAS)
+            while mes <= limite:
+                s.execute(text(sql_criar_particao(mes, u)))
+                mes = proximo_mes(mes)
+
+        # Mantém os ids: avaliacoes.id_agendamento aponta para eles
+        s.execute(text("""
+            INSERT INTO agendamentos (id, unidade, data, horario, numero, tipo, nome, pin, criado_em, dia, user_id)
+            SELECT id, unidade, data, horario, numero, tipo, nome, pin, criado_em, dia, user_id FROM agendamentos_legado
+        """))
+        # A sequência nova continua de onde a antiga parou: ids de reservas já
+        # canceladas não voltam (o instantâneo e as lápides usam o id)
+        antiga = s.execute(text("SELECT pg_get_serial_sequence('agendamentos_legado', 'id')")).scalar()
+        ultimo_id = s.execute(text(f"SELECT last_value FROM {antiga}")).scalar() if antiga else 0
+        s.execute(text(
+            "SELECT setval(pg_get_serial_sequence('agendamentos', 'id'), GREATEST(COALESCE((SELECT max(id) FROM agendamentos), 0), :ultimo) + 1, false)"
+        ), params={"ultimo": ultimo_id})
+        s.execute(text("DROP TABLE agendamentos_legado"))
+        s.commit()
+
+    # Recria trigger de NOTIFY e índices na tabela nova
+    inicializar_banco(unidade)
+    _particoes_conhecidas.clear()
+    print("✅ Migração concluída.")
+
+def arquivar_particoes(meses=MESES_NO_BANCO, pasta=PASTA_ARQUIVO, unidade=None):
+    """
+    Exporta para Parquet e remove do banco as partições da unidade com mais
+    de 'meses' meses. Retorna a lista de arquivos gerados.
+    """
+    unidade = unidade or UNIDADE_PADRAO
+    if particionamento_agendamentos(unidade) != "unidade":
+        raise RuntimeError("'agendamentos' não é particionada por unidade. Rode 'python particoes.py migrar' antes.")
+
+    os.makedirs(pasta, exist_ok=True)
+    limite = somar_meses(date.today(), -meses)
+    schema = TABELAS["agendamentos"]["schema"]
+    gerados = []
+
+    for nome, mes in listar_particoes(unidade):
+        if proximo_mes(mes) > limite:
+            continue
+
+        # Grava em arquivo temporário e só remove a partição depois do Parquet pronto
+        caminho = os.path.join(pasta, f"{nome}.parquet")
+        exportar_consulta(f"SELECT {', '.join(schema.names)} FROM {nome} ORDER BY id", {}, schema, caminho + ".tmp", unidade=unidade)
+        os.replace(caminho + ".tmp", caminho)
+
+        with get_conexao(unidade).session as s:
+            # O engajamento passa a contar esses treinos como arquivados
+            s.execute(text(f"""
+                INSERT INTO engajamento_aluno (unidade, user_id, total, primeira_visita, ultima_visita, arq_total, arq_primeira, arq_ultima)
+                SELECT unidade, user_id, count(*), min(dia), max(dia), count(*), min(dia), max(dia)
+                FROM {nome} WHERE user_id IS NOT NULL GROUP BY unidade, user_id
+                ON CONFLICT (unidade, user_id) DO UPDATE SET
+                    arq_total = engajamento_aluno.arq_total + EXCLUDED.arq_total,
+                    arq_primeira = LEAST(engajamento_aluno.arq_primeira, EXCLUDED.arq_primeira),
+                    arq_ultima = GREATEST(engajamento_aluno.arq_ultima, EXCLUDED.arq_ultima)
+            """))
+            # DETACH não dispara o trigger de DELETE: grava as lápides à mão
+            # para o instantâneo em memória soltar esses agendamentos
+            s.execute(text(f"INSERT INTO agendamentos_removidos (unidade, id) SELECT unidade, id FROM {nome}"))
+            s.execute(text(f"ALTER TABLE {nome_particao(unidade)} DETACH PARTITION {nome}"))
+            s.execute(text(f"DROP TABLE {nome}"))
+            s.commit()
+        _particoes_conhecidas.discard((unidade, mes))
+        gerados.append(caminho)
+
+    return gerados
+
+@st.cache_data(show_spinner=False)
+def _ler_arquivos(arquivos):
+    # 'arquivos' inclui a data de modificação, então o cache vira quando um mês novo é arquivado
+    return pd.concat([pd.read_parquet(caminho) for caminho, _ in arquivos], ignore_index=True)
+
+def carregar_arquivo_morto(pasta=PASTA_ARQUIVO, unidade=None):
+    """Agendamentos arquivados da unidade, no mesmo formato de utils.carregar_tudo_formatado()."""
+    unidade = unidade or UNIDADE_PADRAO
+    colunas = ["Data", "Horario", "Numero", "Tipo", "Nome", "Pin", "CriadoEm", "Data_dt"]
+    # Arquivos de antes das unidades (agendamentos_AAAA_MM) são da unidade padrão
+    padroes = [_padrao_particao(unidade)] + ([_padrao_particao(None)] if unidade == UNIDADE_PADRAO else [])
+    arquivos = tuple(
+        (caminho, os.path.getmtime(caminho))
+        for caminho in sorted(glob.glob(os.path.join(pasta, "agendamentos_*.parquet")))
+        if any(p.match(os.path.basename(caminho)[:-len(".parquet")]) for p in padroes)
+    )
+    if not arquivos:
+        return pd.DataFrame(columns=colunas)
+
+    df = _ler_arquivos(arquivos).rename(columns={
+        "data": "Data", "horario": "Horario", "numero": "Numero",
+        "tipo": "Tipo", "nome": "Nome", "criado_em": "CriadoEm"
+    })
+    df["Pin"] = ""
+    df["Data_dt"] = pd.to_datetime(df["Data"], format="%d/%m/%Y", errors="coerce")
+    return df[colunas]
+
+if __name__ == "__main__":
+    # Exemplos:
+    #   python particoes.py migrar            (uma vez, em bancos antigos)
+    #   python particoes.py criar --meses 6   (partições futuras)
+    #   python particoes.py arquivar --meses 12 --unidade zona_sul
+    parser = argparse.ArgumentParser(description="Partições mensais e arquivo morto de agendamentos.")
+    parser.add_argument("--unidade", choices=UNIDADES, default=UNIDADE_PADRAO, help="Unidade (e o banco dela)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("migrar", help="Converte a tabela antiga para particionada")
+    p_criar = sub.add_parser("criar", help="Cria as partições dos próximos meses")
+    p_criar.add_argument("--meses", type=int, default=MESES_PARTICOES_FUTURAS)
+    p_arq = sub.add_parser("arquivar", help="Move partições antigas para Parquet")
+    p_arq.add_argument("--meses", type=int, default=MESES_NO_BANCO, help="Meses que continuam no banco")
+    p_arq.add_argument("--pasta", default=PASTA_ARQUIVO)
+    args = parser.parse_args()
+
+    if args.comando == "migrar":
+        migrar_para_particionado(args.unidade)
+    elif args.comando == "criar":
+        garantir_particoes(args.meses, args.unidade)
+        print(f"✅ Partições garantidas: {[nome for nome, _ in listar_particoes(args.unidade)]}")
+    else:
+        arquivos = arquivar_particoes(args.meses, args.pasta, args.unidade)
+        print(f"✅ {len(arquivos)} partição(ões) arquivada(s).")
+        for caminho in arquivos:
+            print(f"    {caminho}")
@@ -0,0 +1,117 @@
+import time
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from utilizacao import CuboUtilizacao
+
+# ==========================================
+# PREVISÃO DE DEMANDA (PRÓXIMA SEMANA)
+# ==========================================
+# Sazonalidade dia da semana x horário x modalidade, ajustada sobre as
+# últimas SEMANAS_HISTORICO semanas completas do cubo de utilização:
+#   - média com peso exponencial por semana (meia-vida MEIA_VIDA_SEMANAS),
+#     para seguir mudanças recentes de hábito;
+#   - desvio da mesma média ponderada, com piso de Poisson (variância >= média);
+#   - intervalo de 80% = média ± Z_INTERVALO desvios, limitado a [0, capacidade].
+# Dias fechados (capacidade 0) e os anteriores à primeira reserva não entram
+# no ajuste (semanas sem sistema não são semanas vazias). Horário lotado mede a
+# capacidade, não a demanda: a previsão desses horários é um piso.
+#
+# Tudo em arrays [semanas x 7 x horas x tipos]; o custo não depende de
+# quantas reservas existem, só do tamanho da janela.
+
+SEMANAS_HISTORICO = 26
+MEIA_VIDA_SEMANAS = 6
+Z_INTERVALO = 1.2816 # 80%
+LIMIAR_LOTADO = 0.9 # Média prevista acima disso da capacidade = "deve lotar"
+
+
+class PrevisaoDemanda:
+    """Média e desvio por (dia da semana, horário, modalidade)."""
+
+    def __init__(self, df, hoje, grade, semanas=SEMANAS_HISTORICO):
+        self.grade = grade
+        fim = hoje - timedelta(days=1)
+        inicio = fim - timedelta(days=7 * semanas - 1)
+        cubo = CuboUtilizacao(df, inicio, fim, grade)
+        self.horas, self.tipos = cubo.horas, cubo.tipos
+        forma = (semanas, 7, len(self.horas), len(self.tipos))
+
+        # Cada fatia de 7 dias começa no dia da semana de 'inicio': gira para Segunda = 0
+        reservas = np.roll(cubo.reservas.reshape(forma), inicio.weekday(), axis=1).astype(np.float64)
+        aberto = cubo.capacidade > 0
+        if not df.empty:
+            aberto &= (cubo.dias >= pd.to_datetime(df["Data_dt"]).min().to_datetime64())[:, None, None]
+        aberto = np.roll(aberto.reshape(forma), inicio.weekday(), axis=1)
+
+        pesos = 0.5 ** (np.arange(semanas)[::-1] / MEIA_VIDA_SEMANAS)
+        pesos = pesos[:, None, None, None] * aberto
+        soma = pesos.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.media = np.where(soma > 0, (pesos * reservas).sum(axis=0) / soma, 0.0)
+            variancia = np.where(soma > 0, (pesos * (reservas - self.media) ** 2).sum(axis=0) / soma, 0.0)
+        self.desvio = np.sqrt(np.maximum(variancia, self.media))
+        self.semanas = semanas
+
+    def proximos_dias(self, hoje, dias=7):
+        """
+        DataFrame com Data, Horario, Tipo, Previsto, Minimo, Maximo, Capacidade,
+        Utilizacao (prevista) e Lotacao para os horários abertos de hoje em diante.
+        """
+        datas = pd.date_range(hoje, periods=dias, freq="D")
+        dia_semana = datas.dayofweek.to_numpy()
+        por_semana, por_data = self.grade.matrizes_capacidade(self.horas, self.tipos)
+        capacidade = por_semana[dia_semana]
+        for i, d in enumerate(datas.date): # Só 'dias' iterações: troca pelas exceções da grade
+            if d in por_data:
+                capacidade[i] = por_data[d]
+
+        previsto = self.media[dia_semana]
+        minimo = np.clip(previsto - Z_INTERVALO * self.desvio[dia_semana], 0, capacidade)
+        maximo = np.clip(previsto + Z_INTERVALO * self.desvio[dia_semana], 0, capacidade)
+        i_dia, i_hora, i_tipo = np.nonzero(capacidade > 0)
+
+        df = pd.DataFrame({
+            "Data": datas[i_dia],
+            "Horario": np.array(self.horas, dtype=object)[i_hora],
+            "Tipo": np.array(self.tipos, dtype=object)[i_tipo],
+            "Previsto": np.minimum(previsto, capacidade)[i_dia, i_hora, i_tipo].round(1),
+            "Minimo": np.floor(minimo[i_dia, i_hora, i_tipo]).astype(int),
+            "Maximo": np.ceil(maximo[i_dia, i_hora, i_tipo]).astype(int),
+            "Capacidade": capacidade[i_dia, i_hora, i_tipo],
+        })
+        df["Utilizacao"] = df["Previsto"] / df["Capacidade"]
+        # Deve lotar: a média já (quase) enche. Pode lotar: o teto do intervalo enche.
+        df["Lotacao"] = np.select(
+            [df["Utilizacao"] >= LIMIAR_LOTADO, df["Maximo"] >= df["Capacidade"]],
+            ["🔴 Deve lotar", "🟠 Pode lotar"], default=""
+        )
+        return df
+
+
+if __name__ == "__main__":
+    # Benchmark com histórico sintético: python previsao.py [anos] [semanas]
+    import sys
+    from capacidade import GradeCapacidade, MODELOS_PADRAO
+
+    anos = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    semanas = int(sys.argv[2]) if len(sys.argv) > 2 else SEMANAS_HISTORICO
+    grade = GradeCapacidade(MODELOS_PADRAO)
+    hoje = date.today()
+    rng = np.random.default_rng(0)
+    n = 120 * 365 * anos # ~120 reservas por dia
+    dias = pd.to_datetime(np.datetime64(hoje - timedelta(days=365 * anos), "D") + rng.integers(0, 365 * anos, n))
+    horas = rng.choice(np.arange(6, 21), n, p=np.r_[[0.1, 0.1, 0.06], [0.04] * 9, [0.1, 0.1, 0.18]]) # Picos de manhã e à noite
+    df = pd.DataFrame({
+        "Data_dt": dias,
+        "Horario": np.char.add(np.char.zfill(horas.astype(str), 2), ":00"),
+        "Tipo": rng.choice(["Treino", "Esteira", "Elíptico"], n, p=[0.75, 0.17, 0.08]),
+    })
+
+    t0 = time.perf_counter()
+    modelo = PrevisaoDemanda(df, hoje, grade, semanas)
+    t1 = time.perf_counter()
+    resultado = modelo.proximos_dias(hoje)
+    t2 = time.perf_counter()
+    print(f"{n} reservas ({anos} anos), janela {semanas} semanas: ajuste {(t1 - t0) * 1000:.0f} ms, previsão {(t2 - t1) * 1000:.0f} ms")
+    print(resultado[resultado["Lotacao"] != ""].head(10).to_string(index=False))
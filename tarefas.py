@@ -0,0 +1,45 @@
+import argparse
+from armazenamento import UNIDADES
+from armazenamento_postgres import (
+    reconciliar_engajamento, reconciliar_avaliacoes_diarias, preencher_user_id, limpar_remocoes,
+    limpar_seed, lembrar_avaliacoes, garantir_particoes,
+)
+from utils import enviar_notificacoes_pendentes
+
+# ==========================================
+# TAREFAS DE MANUTENÇÃO (CRON)
+# ==========================================
+# O worker (python agendador.py) roda todas sozinho, nos horários de
+# agendador.AGENDA. Aqui elas rodam uma vez, na mão ou por um Cron Job:
+#   python tarefas.py reconciliar-engajamento     (todo dia de madrugada)
+#   python tarefas.py reconciliar-avaliacoes      (todo dia de madrugada; gráficos de qualidade)
+#   python tarefas.py limpar-remocoes             (todo dia; lápides de mais de 7 dias)
+#   python tarefas.py preencher-user-id           (após cadastrar alunos com reservas antigas)
+#   python tarefas.py enviar-notificacoes         (a cada poucos minutos; avisos de fechamento)
+#   python tarefas.py lembrar-avaliacoes          (de manhã; treinos de ontem sem avaliação)
+#   python tarefas.py limpar-seed                 (reservas de demonstração do gerar_dados.py)
+#   python tarefas.py garantir-particoes          (partições dos próximos meses)
+#
+# Cada tarefa roda em todas as unidades, uma por vez (--unidade escolhe uma).
+
+TAREFAS = {
+    "reconciliar-engajamento": reconciliar_engajamento,
+    "reconciliar-avaliacoes": reconciliar_avaliacoes_diarias,
+    "preencher-user-id": preencher_user_id,
+    "limpar-remocoes": limpar_remocoes,
+    "enviar-notificacoes": enviar_notificacoes_pendentes,
+    "lembrar-avaliacoes": lembrar_avaliacoes,
+    "limpar-seed": limpar_seed,
+    "garantir-particoes": garantir_particoes,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tarefas de manutenção da Agenda Naalli.")
+    parser.add_argument("tarefa", choices=list(TAREFAS))
+    parser.add_argument("--unidade", choices=UNIDADES, help="Padrão: todas")
+    args = parser.parse_args()
+
+    for unidade in [args.unidade] if args.unidade else UNIDADES:
+        print(f"⏳ Rodando {args.tarefa} ({unidade})...")
+        TAREFAS[args.tarefa](unidade=unidade)
+    print("✅ Concluído.")
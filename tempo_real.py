@@ -0,0 +1,159 @@
+import json
+import select
+import threading
+import time
+import pandas as pd
+import streamlit as st
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from utils import carregar_dados_dia, get_armazenamento, unidade_atual
+from armazenamento import UNIDADE_PADRAO
+from armazenamento_postgres import get_db_url
+
+# ==========================================
+# OCUPAÇÃO AO VIVO (LISTEN/NOTIFY)
+# ==========================================
+# O trigger 'trg_notificar_agendamento' (criado em armazenamento_postgres.inicializar_banco)
+# publica cada reserva/cancelamento neste canal. Um único ouvinte por
+# unidade e processo mantém em memória a ocupação dos dias já consultados, e
+# a grade de vagas lê daqui em vez de consultar o banco a cada reexecução.
+# O canal é do banco inteiro: cada ouvinte ignora os eventos de outras unidades.
+
+CANAL = "agendamentos_mudancas"
+TIMEOUT_ESPERA_S = 30  # A cada 30s sem eventos, pinga o banco para detectar queda
+ESPERA_RECONEXAO_S = 5
+
+
+class OcupacaoAoVivo:
+    """
+    Ocupação por dia no formato {(horario, numero, tipo): (nome, user_id)}.
+    Dias são carregados do banco na primeira consulta e depois atualizados
+    apenas pelas notificações.
+    """
+
+    def __init__(self, db_url, unidade=UNIDADE_PADRAO):
+        self.unidade = unidade
+        self._lock = threading.Lock()
+        self._dias = {}          # data_str -> {(horario, numero, tipo): (nome, user_id)}
+        self._carregando = {}    # data_str -> eventos recebidos durante a carga
+        self.conectado = False
+        self.versao = 0          # Incrementa a cada evento aplicado
+        # Sem URL (SQLite embutido) não há NOTIFY: toda leitura vai direto ao banco
+        if db_url:
+            self._engine = create_engine(db_url, poolclass=NullPool)
+            threading.Thread(target=self._escutar, name="naalli-ocupacao", daemon=True).start()
+
+    # --- LEITURA ---
+    def ocupacao_dia(self, data_str):
+        with self._lock:
+            if self.conectado and data_str in self._dias:
+                return dict(self._dias[data_str])
+            acompanhar = self.conectado and data_str not in self._carregando
+            if acompanhar:
+                self._carregando[data_str] = []
+
+        df = carregar_dados_dia(data_str, self.unidade)
+        ocupacao = {
+            (r['Horario'], int(r['Numero']), r['Tipo']): (r['Nome'], None if pd.isna(r['UserId']) else int(r['UserId']))
+            for _, r in df.iterrows()
+        }
+
+        # Sem ouvinte ativo, a consulta direta é a fonte da verdade
+        if not acompanhar:
+            return ocupacao
+
+        with self._lock:
+            # Reaplica o que chegou enquanto a consulta rodava (eventos são idempotentes)
+            pendentes = self._carregando.pop(data_str, None)
+            if pendentes is not None and self.conectado:
+                for evento in pendentes:
+                    self._aplicar_na(ocupacao, evento)
+                self._dias[data_str] = ocupacao
+            return dict(ocupacao)
+
+    def invalidar(self, data_str):
+        """Força a próxima leitura do dia a ir ao banco (usado após a própria escrita)."""
+        with self._lock:
+            self._dias.pop(data_str, None)
+
+    # --- EVENTOS ---
+    @staticmethod
+    def _aplicar_na(ocupacao, evento):
+        chave = (evento['horario'], int(evento['numero']), evento['tipo'])
+        if evento['op'] == 'INSERT':
+            ocupacao[chave] = (evento['nome'], evento.get('user_id'))
+        else:
+            ocupacao.pop(chave, None)
+
+    def _aplicar(self, evento):
+        if evento.get('unidade', UNIDADE_PADRAO) != self.unidade:
+            return
+        with self._lock:
+            data_str = evento['data']
+            if data_str in self._carregando:
+                self._carregando[data_str].append(evento)
+            if data_str in self._dias:
+                self._aplicar_na(self._dias[data_str], evento)
+            self.versao += 1
+
+    def _escutar(self):
+        while True:
+            try:
+                conexao = self._engine.raw_connection()
+                try:
+                    pg = conexao.driver_connection
+                    pg.autocommit = True
+                    with pg.cursor() as cur:
+                        cur.execute(f"LISTEN {CANAL};")
+
+                    # Enquanto estávamos desconectados podemos ter perdido eventos
+                    with self._lock:
+                        self._dias.clear()
+                        self.conectado = True
+
+                    while True:
+                        if select.select([pg], [], [], TIMEOUT_ESPERA_S) == ([], [], []):
+                            with pg.cursor() as cur:
+                                cur.execute("SELECT 1")
+                            continue
+                        pg.poll()
+                        while pg.notifies:
+                            self._aplicar(json.loads(pg.notifies.pop(0).payload))
+                finally:
+                    conexao.close()
+            except Exception as e:
+                print(f"Ouvinte de ocupação desconectado: {e}")
+            with self._lock:
+                self.conectado = False
+                self._dias.clear()
+                self._carregando.clear()
+            time.sleep(ESPERA_RECONEXAO_S)
+
+
+def get_ocupacao_ao_vivo(unidade=None):
+    """O ouvinte da unidade (a da sessão, por padrão)."""
+    return _ouvinte_unidade(unidade or unidade_atual())
+
+@st.cache_resource
+def _ouvinte_unidade(unidade):
+    # Um único ouvinte por unidade e processo, compartilhado por todas as sessões
+    return OcupacaoAoVivo(get_db_url(unidade) if get_armazenamento(unidade).nome == "postgres" else None, unidade)
+
+
+if __name__ == "__main__":
+    # Teste manual contra um Postgres local:
+    #   DATABASE_URL=postgresql://... python tempo_real.py 16/12/2025 [unidade]
+    # e, em outro terminal, reserve/cancele vagas desse dia no app.
+    import sys
+    data_teste = sys.argv[1] if len(sys.argv) > 1 else time.strftime("%d/%m/%Y")
+    unidade_teste = sys.argv[2] if len(sys.argv) > 2 else UNIDADE_PADRAO
+    ocupacao = OcupacaoAoVivo(get_db_url(unidade_teste), unidade_teste)
+    versao = -1
+    while True:
+        if ocupacao.versao != versao:
+            versao = ocupacao.versao
+            vagas = ocupacao.ocupacao_dia(data_teste)
+            print(f"[v{versao}] {data_teste}: {len(vagas)} vaga(s) ocupada(s)")
+            for (horario, numero, tipo), (nome, _) in sorted(vagas.items()):
+                print(f"    {horario}  {tipo} {numero}: {nome}")
+        time.sleep(0.5)
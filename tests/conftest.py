@@ -0,0 +1,93 @@
+import os
+import sys
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from armazenamento import UNIDADE_PADRAO
+from armazenamento_sqlite import ArmazenamentoSQLite
+
+# ==========================================
+# TESTES (pytest)
+# ==========================================
+#   pip install pytest
+#   python -m pytest tests                                    (só SQLite)
+#   DATABASE_URL=postgresql://... python -m pytest tests      (SQLite + Postgres)
+#
+# No Postgres, use um banco de teste: os testes criam alunos "pytest.N@naalli.com",
+# reservam um dia daqui a mais de um ano e apagam o que gravaram no fim.
+
+DIA = date.today() + timedelta(days=400)
+if DIA.weekday() >= 5: # Dia útil: a grade padrão só tem 07:00 de segunda a sexta
+    DIA += timedelta(days=7 - DIA.weekday())
+DATA_STR = DIA.strftime("%d/%m/%Y")
+HORARIO = "07:00"
+ALUNOS = 24
+
+# Testes de recursos só do Postgres (pulados sem DATABASE_URL)
+so_postgres = pytest.mark.parametrize("armazenamento", ["postgres"], indirect=True)
+
+
+def _limpar_postgres(armazenamento, ids):
+    with armazenamento.conn.session as s:
+        params = {"unidade": armazenamento.unidade, "dia": DIA, "ids": ids}
+        s.execute(text("DELETE FROM lista_espera WHERE unidade = :unidade AND dia = :dia"), params)
+        s.execute(text("DELETE FROM bloqueios WHERE unidade = :unidade AND dia = :dia"), params)
+        s.execute(text("DELETE FROM agendamentos WHERE unidade = :unidade AND (dia = :dia OR user_id = ANY(:ids))"), params)
+        s.execute(text("DELETE FROM fila_notificacoes WHERE unidade = :unidade AND user_id = ANY(:ids)"), params)
+        s.execute(text("DELETE FROM checkins WHERE unidade = :unidade AND user_id = ANY(:ids)"), params)
+        s.execute(text("DELETE FROM engajamento_aluno WHERE unidade = :unidade AND user_id = ANY(:ids)"), params)
+        s.commit()
+
+def _alunos(armazenamento):
+    alunos = []
+    for i in range(ALUNOS):
+        email = f"pytest.{i}@naalli.com"
+        armazenamento.inserir_usuario(email, f"Pytest {i}", "-", False, "aluno")
+        alunos.append((armazenamento.buscar_usuario(email)['id'], f"Pytest {i}"))
+    return alunos
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    # Um arquivo por teste: _abrir_banco guarda a engine por caminho
+    return ArmazenamentoSQLite(str(tmp_path / "naalli.db"), UNIDADE_PADRAO)
+
+@pytest.fixture
+def postgres():
+    if not os.environ.get("DATABASE_URL"):
+        pytest.skip("sem DATABASE_URL")
+    from armazenamento_postgres import ArmazenamentoPostgres
+    armazenamento = ArmazenamentoPostgres(UNIDADE_PADRAO)
+    ids = [u for u, _ in _alunos(armazenamento)]
+    _limpar_postgres(armazenamento, ids)
+    yield armazenamento
+    _limpar_postgres(armazenamento, ids)
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def armazenamento(request):
+    return request.getfixturevalue(request.param)
+
+@pytest.fixture
+def alunos(armazenamento):
+    return _alunos(armazenamento)
+
+
+def reservar(armazenamento, aluno, numero, tipo="Esteira", horario=HORARIO):
+    user_id, nome = aluno
+    return armazenamento.inserir_agendamento(DATA_STR, DIA, horario, numero, tipo, nome, "LOGGED_USER", user_id)
+
+def cancelar(armazenamento, numero, tipo="Esteira", horario=HORARIO):
+    agendamento = armazenamento.buscar_agendamento(DIA, horario, numero, tipo)
+    return armazenamento.remover_agendamento(agendamento['id'], DIA, agendamento['user_id'])
+
+def avisos(armazenamento, evento):
+    """Avisos pendentes do dia dos testes (o banco de teste pode ter outros na fila)."""
+    df = armazenamento.notificacoes_pendentes(100000)
+    return df[(df['evento'] == evento) & (df['data'] == DATA_STR)]
+
+def total_treinos(armazenamento, user_id):
+    engajamento = armazenamento.engajamento_aluno(user_id)
+    return int(engajamento['total']) if engajamento else 0
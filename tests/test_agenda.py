@@ -0,0 +1,120 @@
+from datetime import date, timedelta
+from conftest import DIA, DATA_STR, HORARIO, reservar, cancelar, avisos
+
+
+# --- RESERVA E CANCELAMENTO ---
+def test_reserva_ocupa_a_vaga(armazenamento, alunos):
+    assert reservar(armazenamento, alunos[0], 1)
+    agendamento = armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira")
+    assert agendamento['user_id'] == alunos[0][0]
+    df = armazenamento.carregar_dados_dia(DIA)
+    assert df[['Data', 'Horario', 'Numero', 'Tipo', 'Nome']].values.tolist() == [[DATA_STR, HORARIO, 1, "Esteira", alunos[0][1]]]
+
+def test_vaga_ocupada_recusa_segunda_reserva(armazenamento, alunos):
+    assert reservar(armazenamento, alunos[0], 1)
+    assert not reservar(armazenamento, alunos[1], 1)
+    # Mesmo número em outra modalidade ou outro horário é outra vaga
+    assert reservar(armazenamento, alunos[1], 1, tipo="Elíptico")
+    assert reservar(armazenamento, alunos[1], 1, horario="08:00")
+    assert len(armazenamento.carregar_dados_dia(DIA)) == 3
+
+def test_cancelamento_libera_a_vaga(armazenamento, alunos):
+    reservar(armazenamento, alunos[0], 1)
+    id_agendamento = armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira")['id']
+    assert armazenamento.remover_agendamento(id_agendamento, DIA, alunos[0][0]) is None
+    assert armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira") is None
+    # Clique duplo: o segundo cancelamento não acha nada
+    assert armazenamento.remover_agendamento(id_agendamento, DIA, alunos[0][0]) is None
+    assert reservar(armazenamento, alunos[1], 1)
+
+
+# --- LISTA DE ESPERA ---
+def test_cancelamento_promove_o_primeiro_da_fila(armazenamento, alunos):
+    dono, primeiro, segundo = alunos[:3]
+    reservar(armazenamento, dono, 1)
+    assert armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", primeiro[1], primeiro[0])
+    assert armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", segundo[1], segundo[0])
+    assert not armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", primeiro[1], primeiro[0])
+
+    promovido = cancelar(armazenamento, 1)
+
+    assert promovido == {"user_id": primeiro[0], "nome": primeiro[1]}
+    assert armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira")['user_id'] == primeiro[0]
+    assert armazenamento.lista_espera_horario(DIA, HORARIO)['UserId'].tolist() == [segundo[0]]
+    assert avisos(armazenamento, "promocao")[['email', 'data', 'horario', 'tipo', 'numero']].values.tolist() == [
+        ["pytest.1@naalli.com", DATA_STR, HORARIO, "Esteira", 1]
+    ]
+
+def test_reserva_direta_tira_o_aluno_da_fila(armazenamento, alunos):
+    reservar(armazenamento, alunos[0], 1)
+    armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", alunos[1][1], alunos[1][0])
+    assert reservar(armazenamento, alunos[1], 2)
+    assert armazenamento.lista_espera_horario(DIA, HORARIO).empty
+    # Sem ninguém na fila, o cancelamento só libera a vaga
+    assert cancelar(armazenamento, 1) is None
+    assert armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira") is None
+
+def test_fila_e_por_modalidade(armazenamento, alunos):
+    reservar(armazenamento, alunos[0], 1)
+    armazenamento.entrar_lista_espera(DIA, HORARIO, "Elíptico", alunos[1][1], alunos[1][0])
+    assert cancelar(armazenamento, 1) is None
+    assert armazenamento.lista_espera_horario(DIA, HORARIO)['UserId'].tolist() == [alunos[1][0]]
+
+def test_fila_so_com_o_horario_lotado(armazenamento, alunos, monkeypatch):
+    # A regra do botão da grade, conferida em utils para a tela e para a API
+    import utils
+    monkeypatch.setitem(utils._armazenamentos, armazenamento.unidade, armazenamento)
+    utils.invalidar_grade(armazenamento.unidade)
+    utils._bloqueios_unidade.clear()
+    user_id, nome = alunos[-1]
+    aluno = {"id": user_id, "nome": nome}
+    vagas = [v.Numero for v in utils.gerar_estrutura_horario(DIA, HORARIO) if v.Tipo == "Esteira"]
+    ontem = (date.today() - timedelta(days=1)).strftime("%d/%m/%Y")
+
+    assert utils.entrar_lista_espera(ontem, HORARIO, "Esteira", aluno) == "Esse horário já passou."
+    assert utils.entrar_lista_espera(DATA_STR, HORARIO, "Esteira", aluno) == "Ainda há aparelho livre: reserve direto."
+    for aluno_dono, numero in zip(alunos, vagas):
+        reservar(armazenamento, aluno_dono, numero)
+    assert utils.entrar_lista_espera(DATA_STR, HORARIO, "Esteira", aluno) == "Sucesso"
+    assert utils.entrar_lista_espera(DATA_STR, HORARIO, "Esteira", aluno) == "Você já está na lista de espera."
+    assert armazenamento.lista_espera_horario(DIA, HORARIO)['UserId'].tolist() == [user_id]
+
+
+# --- FECHAMENTOS ---
+def test_fechamento_cancela_e_avisa(armazenamento, alunos):
+    reservar(armazenamento, alunos[0], 1)
+    reservar(armazenamento, alunos[1], 2)
+    reservar(armazenamento, alunos[2], 1, tipo="Elíptico")
+    reservar(armazenamento, alunos[3], 1, horario="10:00")
+
+    cancelados = armazenamento.aplicar_bloqueio(DIA, "06:00", "08:00", "Esteira", None, "Manutenção", "admin@naalli.com")
+
+    assert cancelados[['Horario', 'Numero', 'Tipo', 'UserId']].values.tolist() == [
+        [HORARIO, 1, "Esteira", alunos[0][0]], [HORARIO, 2, "Esteira", alunos[1][0]],
+    ]
+    restantes = armazenamento.carregar_dados_dia(DIA)
+    assert sorted(zip(restantes['Horario'], restantes['Tipo'])) == [(HORARIO, "Elíptico"), ("10:00", "Esteira")]
+    cancelamentos = avisos(armazenamento, "cancelamento")
+    assert sorted(cancelamentos['email']) == ["pytest.0@naalli.com", "pytest.1@naalli.com"]
+    assert set(cancelamentos['motivo']) == {"Manutenção"}
+
+def test_vaga_fechada_nao_aceita_reserva(armazenamento, alunos):
+    armazenamento.aplicar_bloqueio(DIA, HORARIO, HORARIO, "Esteira", 3, "Quebrada", "admin@naalli.com")
+    assert not reservar(armazenamento, alunos[0], 3)
+    assert reservar(armazenamento, alunos[0], 4)
+
+    bloqueios = armazenamento.bloqueios_periodo(DIA, DIA)
+    assert bloqueios[['hora_inicio', 'tipo', 'numero', 'motivo']].values.tolist() == [[HORARIO, "Esteira", 3, "Quebrada"]]
+    armazenamento.remover_bloqueio(int(bloqueios['id'].iloc[0]))
+    assert reservar(armazenamento, alunos[1], 3)
+
+def test_fechamento_nao_promove_da_fila(armazenamento, alunos):
+    reservar(armazenamento, alunos[0], 1)
+    armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", alunos[1][1], alunos[1][0])
+
+    armazenamento.aplicar_bloqueio(DIA, HORARIO, HORARIO, "Esteira", None, "Feriado", "admin@naalli.com")
+
+    assert armazenamento.carregar_dados_dia(DIA).empty
+    assert armazenamento.lista_espera_horario(DIA, HORARIO)['UserId'].tolist() == [alunos[1][0]]
+    assert avisos(armazenamento, "promocao").empty
+    assert avisos(armazenamento, "cancelamento")['email'].tolist() == ["pytest.0@naalli.com"]
@@ -0,0 +1,82 @@
+import json
+from datetime import date
+import pytest
+from sqlalchemy.exc import OperationalError
+from checkin import IngestorCheckins
+
+# Nem o Postgres (INTEGER) nem o SQLite (inteiro de 64 bits) aceitam
+ID_INVALIDO = 2 ** 64
+
+
+def _ingestor(armazenamento, pasta, **kwargs):
+    # Intervalo longo: a thread não grava sozinha, o teste chama descarregar()
+    return IngestorCheckins(armazenamento, intervalo_s=3600, pasta=str(pasta), **kwargs)
+
+def _checkins(armazenamento, user_id):
+    return armazenamento.frequencia_aluno(user_id, date.today())['checkins']
+
+def _linhas(arquivo):
+    with open(arquivo, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f]
+
+
+def test_registrar_recusa_id_fora_do_int4(armazenamento, alunos, tmp_path):
+    ingestor = _ingestor(armazenamento, tmp_path)
+    for user_id in (0, -1, 99999999999):
+        with pytest.raises(ValueError):
+            ingestor.registrar(user_id)
+    assert ingestor.pendentes == 0
+    ingestor.fechar()
+
+def test_evento_ruim_vai_para_descartados_e_a_fila_anda(armazenamento, alunos, tmp_path):
+    # Evento ruim vindo do arquivo de pendentes de uma versão anterior, no meio de eventos bons
+    bons = [u for u, _ in alunos[:5]]
+    pendentes = [{"user_id": u, "momento": date.today().isoformat() + "T07:00:00", "origem": "recepcao"}
+                 for u in [bons[0], ID_INVALIDO, bons[1]]]
+    (tmp_path / f"pendentes_{armazenamento.unidade}.jsonl").write_text("".join(json.dumps(e) + "\n" for e in pendentes))
+
+    ingestor = _ingestor(armazenamento, tmp_path, tamanho_lote=4)
+    assert ingestor.pendentes == 3
+    for u in bons[2:4]:
+        ingestor.registrar(u)
+
+    assert ingestor.descarregar() == 4
+    assert (ingestor.pendentes, ingestor.descartados, ingestor.falhas) == (0, 1, 0)
+    assert [_checkins(armazenamento, u) for u in bons] == [1, 1, 1, 1, 0]
+    descartado, = _linhas(ingestor.arquivo_descartados)
+    assert descartado['user_id'] == ID_INVALIDO and descartado['erro']
+
+    # Os check-ins seguintes continuam sendo gravados
+    ingestor.registrar(bons[4])
+    assert ingestor.descarregar() == 1
+    assert _checkins(armazenamento, bons[4]) == 1
+    ingestor.fechar()
+    assert not (tmp_path / f"pendentes_{armazenamento.unidade}.jsonl").exists()
+
+
+class _BancoForaDoAr:
+    """Armazenamento que perde a conexão nas primeiras gravações."""
+
+    unidade = "teste"
+
+    def __init__(self, quedas):
+        self.quedas = quedas
+        self.gravados = []
+
+    def inserir_checkins(self, linhas):
+        if self.quedas:
+            self.quedas -= 1
+            raise OperationalError("INSERT", {}, Exception("server closed the connection unexpectedly"))
+        self.gravados += [l['user_id'] for l in linhas]
+
+def test_queda_de_conexao_devolve_o_lote_a_fila(tmp_path):
+    banco = _BancoForaDoAr(quedas=1)
+    ingestor = _ingestor(banco, tmp_path, tamanho_lote=2)
+    for user_id in (1, 2, 3):
+        ingestor.registrar(user_id)
+    with pytest.raises(OperationalError):
+        ingestor.descarregar()
+    assert (ingestor.pendentes, ingestor.falhas, ingestor.descartados) == (3, 1, 0)
+    assert ingestor.descarregar() == 3
+    assert banco.gravados == [1, 2, 3]
+    ingestor.fechar()
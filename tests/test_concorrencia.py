@@ -0,0 +1,129 @@
+import random
+import threading
+from collections import Counter
+from conftest import DIA, DATA_STR, HORARIO, reservar, avisos, total_treinos, so_postgres
+
+# ==========================================
+# CONCORRÊNCIA: RESERVAS, CANCELAMENTOS E LISTA DE ESPERA
+# ==========================================
+# Alunos disparando juntos (threads soltas por uma barreira) contra o mesmo
+# horário, várias rodadas seguidas. Depois de cada rodada: nenhum aparelho com
+# duas reservas, ninguém promovido duas vezes, um aviso por promoção e
+# engajamento_aluno.total igual às reservas que cada aluno realmente tem.
+#   DATABASE_URL=postgresql://... python -m pytest tests/test_concorrencia.py
+
+RODADAS = 5
+NUMEROS = [1, 2, 3, 4]
+NA_FILA = 8
+TENTATIVAS_DIRETAS = 5
+
+
+def _ao_mesmo_tempo(tarefas):
+    """Roda as funções em threads soltas juntas por uma barreira; devolve os retornos."""
+    barreira = threading.Barrier(len(tarefas))
+    resultados = [None] * len(tarefas)
+
+    def rodar(i, tarefa):
+        barreira.wait()
+        resultados[i] = tarefa()
+
+    threads = [threading.Thread(target=rodar, args=(i, t)) for i, t in enumerate(tarefas)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados
+
+def _reservas(armazenamento):
+    df = armazenamento.carregar_dados_dia(DIA)
+    return df[(df['Horario'] == HORARIO) & (df['Tipo'] == "Esteira")]
+
+def _limpar(armazenamento, alunos):
+    # Fila primeiro: senão cada cancelamento da limpeza promoveria alguém
+    for user_id, _ in alunos:
+        armazenamento.sair_lista_espera(DIA, HORARIO, "Esteira", user_id)
+    for numero in NUMEROS:
+        agendamento = armazenamento.buscar_agendamento(DIA, HORARIO, numero, "Esteira")
+        if agendamento:
+            armazenamento.remover_agendamento(agendamento['id'], DIA, agendamento['user_id'])
+    pendentes = armazenamento.notificacoes_pendentes(100000)
+    pendentes = pendentes[pendentes['data'] == DATA_STR]
+    if not pendentes.empty:
+        armazenamento.marcar_notificacoes_enviadas(pendentes['id'].tolist())
+
+def _conferir_engajamento(armazenamento, alunos):
+    por_aluno = Counter(_reservas(armazenamento)['UserId'].dropna().astype(int))
+    assert {u: total_treinos(armazenamento, u) for u, _ in alunos} == {u: por_aluno[u] for u, _ in alunos}
+
+
+@so_postgres
+def test_um_vencedor_por_vaga(armazenamento, alunos):
+    for _ in range(RODADAS):
+        # Todos os alunos divididos entre os aparelhos, cada um tentando o seu ao mesmo tempo
+        tentativas = [(aluno, NUMEROS[i % len(NUMEROS)]) for i, aluno in enumerate(alunos)]
+        ok = _ao_mesmo_tempo([lambda a=aluno, n=numero: reservar(armazenamento, a, n) for aluno, numero in tentativas])
+
+        vencedores = Counter(numero for (_, numero), aceita in zip(tentativas, ok) if aceita)
+        assert vencedores == Counter(NUMEROS)
+        reservas = _reservas(armazenamento)
+        assert sorted(reservas['Numero'].astype(int)) == NUMEROS
+        assert set(reservas['UserId'].astype(int)) == {aluno[0] for (aluno, _), aceita in zip(tentativas, ok) if aceita}
+        _conferir_engajamento(armazenamento, alunos)
+        _limpar(armazenamento, alunos)
+        _conferir_engajamento(armazenamento, alunos)
+
+@so_postgres
+def test_cancelamento_simultaneo_desconta_uma_vez(armazenamento, alunos):
+    aluno = alunos[0]
+    for _ in range(RODADAS):
+        reservar(armazenamento, aluno, 1)
+        reservar(armazenamento, aluno, 1, horario="08:00")
+        id_agendamento = armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira")['id']
+
+        _ao_mesmo_tempo([lambda: armazenamento.remover_agendamento(id_agendamento, DIA, aluno[0])] * 8)
+
+        assert total_treinos(armazenamento, aluno[0]) == 1
+        agendamento = armazenamento.buscar_agendamento(DIA, "08:00", 1, "Esteira")
+        armazenamento.remover_agendamento(agendamento['id'], DIA, aluno[0])
+        assert total_treinos(armazenamento, aluno[0]) == 0
+
+@so_postgres
+def test_cancelamentos_com_fila_e_reservas_diretas(armazenamento, alunos):
+    donos = alunos[:len(NUMEROS)]
+    fila = alunos[len(NUMEROS):len(NUMEROS) + NA_FILA]
+    diretos = alunos[len(NUMEROS) + NA_FILA:]
+    emails = {u: f"pytest.{i}@naalli.com" for i, (u, _) in enumerate(alunos)}
+
+    def reservar_direto(aluno):
+        # Como quem fica tocando em "Reservar" até abrir um aparelho qualquer
+        for _ in range(TENTATIVAS_DIRETAS):
+            for numero in random.sample(NUMEROS, len(NUMEROS)):
+                if reservar(armazenamento, aluno, numero):
+                    return True
+        return False
+
+    for _ in range(RODADAS):
+        # Tipo lotado, fila cheia; os donos cancelam enquanto outros reservam direto
+        for dono, numero in zip(donos, NUMEROS):
+            assert reservar(armazenamento, dono, numero)
+        for user_id, nome in fila:
+            assert armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", nome, user_id)
+        ids = {numero: armazenamento.buscar_agendamento(DIA, HORARIO, numero, "Esteira")['id'] for numero in NUMEROS}
+
+        resultados = _ao_mesmo_tempo([
+            lambda u=dono[0], n=numero: ("promovido", armazenamento.remover_agendamento(ids[n], DIA, u))
+            for dono, numero in zip(donos, NUMEROS)
+        ] + [lambda a=aluno: ("direto", reservar_direto(a)) for aluno in diretos])
+        promovidos = [r['user_id'] for tipo, r in resultados if tipo == "promovido" and r]
+        diretos_ok = sum(1 for tipo, r in resultados if tipo == "direto" and r)
+
+        reservas = _reservas(armazenamento)
+        assert max(Counter(reservas['Numero'].astype(int)).values()) == 1
+        assert max(Counter(reservas['UserId'].astype(int)).values()) == 1
+        assert len(set(promovidos)) == len(promovidos)
+        assert len(reservas) == len(promovidos) + diretos_ok == len(NUMEROS)
+        assert len(armazenamento.lista_espera_horario(DIA, HORARIO)) == NA_FILA - len(promovidos)
+        assert sorted(avisos(armazenamento, "promocao")['email']) == sorted(emails[u] for u in promovidos)
+        _conferir_engajamento(armazenamento, alunos)
+        _limpar(armazenamento, alunos)
+        _conferir_engajamento(armazenamento, alunos)
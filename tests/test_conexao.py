@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy.exc import DBAPIError, OperationalError, ProgrammingError
+from conftest import so_postgres
+
+# Porta fechada: toda conexão falha na hora, como um Neon suspenso que não acordou
+URL_FORA_DO_AR = "postgresql+psycopg2://postgres@127.0.0.1:1/naalli"
+
+
+class _ErroPg(Exception):
+    def __init__(self, pgcode=None):
+        self.pgcode = pgcode
+
+
+def test_erro_transitorio():
+    from armazenamento_postgres import erro_transitorio
+    assert erro_transitorio(OperationalError("SELECT 1", {}, _ErroPg()))
+    assert erro_transitorio(DBAPIError("SELECT 1", {}, _ErroPg(), connection_invalidated=True))
+    # statement_timeout estourado: repetir só pioraria
+    assert not erro_transitorio(OperationalError("SELECT 1", {}, _ErroPg("57014")))
+    assert not erro_transitorio(ProgrammingError("SELECT 1", {}, _ErroPg("42P01")))
+
+def test_leitura_repete_com_espera_e_conta_a_falha(monkeypatch):
+    import armazenamento_postgres as pg
+    monkeypatch.setattr(pg, "ESPERA_INICIAL_S", 0.01)
+    conexao = pg.ConexaoPostgres(URL_FORA_DO_AR, {"tentativas": 3, "keepalive_s": 0, "timeout_conexao_s": 1})
+    with pytest.raises(OperationalError):
+        conexao.query("SELECT 1")
+    metricas = conexao.metricas()
+    assert (metricas["leituras_repetidas"], metricas["falhas_leitura"]) == (2, 1)
+    assert metricas["ultima_falha"].endswith("OperationalError")
+
+
+@so_postgres
+def test_pool_aplica_timeout_de_comando(armazenamento):
+    from armazenamento_postgres import ConexaoPostgres, get_db_url
+    conexao = ConexaoPostgres(get_db_url(armazenamento.unidade), {"timeout_comando_ms": 1234, "keepalive_s": 0})
+    # Duas leituras: o SET do connect tem que sobreviver à devolução da conexão ao pool
+    assert conexao.query("SHOW statement_timeout").iloc[0, 0] == "1234ms"
+    assert conexao.query("SHOW statement_timeout").iloc[0, 0] == "1234ms"
+    metricas = conexao.metricas()
+    assert (metricas["conexoes_abertas"], metricas["em_uso"], metricas["ociosas"]) == (1, 0, 1)
+
+@so_postgres
+def test_leituras_vao_para_a_replica_em_dia(armazenamento, monkeypatch):
+    import armazenamento_postgres as pg
+    # O próprio primário como "réplica": não está em recuperação, atraso 0
+    replica = pg.ConexaoReplica(pg.get_db_url(armazenamento.unidade))
+    monkeypatch.setitem(pg._replica_unidade, armazenamento.unidade, replica)
+    assert pg._ConexaoLeitura(armazenamento.unidade).query("SELECT 1 AS x").iloc[0, 0] == 1
+    assert (replica.atraso_s, replica.contadores["leituras_replica"], replica.contadores["desvios_primario"]) == (0, 1, 0)
+
+@so_postgres
+def test_leituras_voltam_ao_primario_sem_replica(armazenamento, monkeypatch):
+    import armazenamento_postgres as pg
+    replica = pg.ConexaoReplica(URL_FORA_DO_AR)
+    monkeypatch.setitem(pg._replica_unidade, armazenamento.unidade, replica)
+    assert pg._ConexaoLeitura(armazenamento.unidade).query("SELECT 1 AS x").iloc[0, 0] == 1
+    assert replica.atraso_s is None
+    assert (replica.contadores["leituras_replica"], replica.contadores["desvios_primario"]) == (0, 1)
+
+@so_postgres
+def test_replica_atrasada_nao_e_usada(armazenamento, monkeypatch):
+    import armazenamento_postgres as pg
+    replica = pg.ConexaoReplica(pg.get_db_url(armazenamento.unidade), atraso_max_s=-1)
+    monkeypatch.setitem(pg._replica_unidade, armazenamento.unidade, replica)
+    pg._ConexaoLeitura(armazenamento.unidade).query("SELECT 1 AS x")
+    assert (replica.contadores["leituras_replica"], replica.contadores["desvios_primario"]) == (0, 1)
@@ -0,0 +1,88 @@
+from datetime import timedelta
+from conftest import DIA, DATA_STR, HORARIO, reservar, cancelar, total_treinos, so_postgres
+
+
+def test_reserva_e_cancelamento(armazenamento, alunos):
+    aluno = alunos[0]
+    assert total_treinos(armazenamento, aluno[0]) == 0
+    reservar(armazenamento, aluno, 1)
+    reservar(armazenamento, aluno, 1, horario="08:00")
+    assert total_treinos(armazenamento, aluno[0]) == 2
+
+    cancelar(armazenamento, 1, horario="08:00")
+    assert total_treinos(armazenamento, aluno[0]) == 1
+    cancelar(armazenamento, 1)
+    assert total_treinos(armazenamento, aluno[0]) == 0
+
+def test_cancelamento_repetido_desconta_uma_vez(armazenamento, alunos):
+    aluno = alunos[0]
+    reservar(armazenamento, aluno, 1)
+    reservar(armazenamento, aluno, 2, horario="08:00")
+    id_agendamento = armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira")['id']
+
+    armazenamento.remover_agendamento(id_agendamento, DIA, aluno[0])
+    armazenamento.remover_agendamento(id_agendamento, DIA, aluno[0])
+
+    assert total_treinos(armazenamento, aluno[0]) == 1
+
+def test_reserva_recusada_nao_conta(armazenamento, alunos):
+    reservar(armazenamento, alunos[0], 1)
+    assert not reservar(armazenamento, alunos[1], 1)
+    assert total_treinos(armazenamento, alunos[1][0]) == 0
+
+def test_promocao_conta_para_o_promovido(armazenamento, alunos):
+    dono, na_fila = alunos[:2]
+    reservar(armazenamento, dono, 1)
+    armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", na_fila[1], na_fila[0])
+    cancelar(armazenamento, 1)
+    assert total_treinos(armazenamento, dono[0]) == 0
+    assert total_treinos(armazenamento, na_fila[0]) == 1
+
+def test_fechamento_desconta_cada_aluno(armazenamento, alunos):
+    reservar(armazenamento, alunos[0], 1)
+    reservar(armazenamento, alunos[0], 1, horario="08:00")
+    reservar(armazenamento, alunos[0], 1, horario="10:00")
+    reservar(armazenamento, alunos[1], 2)
+
+    armazenamento.aplicar_bloqueio(DIA, "06:00", "08:00", None, None, "Feriado", "admin@naalli.com")
+
+    assert total_treinos(armazenamento, alunos[0][0]) == 1
+    assert total_treinos(armazenamento, alunos[1][0]) == 0
+
+def test_primeira_e_ultima_visita(armazenamento, alunos):
+    user_id, nome = alunos[0]
+    depois = DIA + timedelta(days=7)
+    reservar(armazenamento, alunos[0], 1)
+    armazenamento.inserir_agendamento(depois.strftime("%d/%m/%Y"), depois, HORARIO, 1, "Esteira", nome, "LOGGED_USER", user_id)
+    engajamento = armazenamento.engajamento_aluno(user_id)
+    assert (engajamento['primeira_visita'], engajamento['ultima_visita']) == (DIA, depois)
+
+    id_depois = armazenamento.buscar_agendamento(depois, HORARIO, 1, "Esteira")['id']
+    armazenamento.remover_agendamento(id_depois, depois, user_id)
+    engajamento = armazenamento.engajamento_aluno(user_id)
+    assert (engajamento['primeira_visita'], engajamento['ultima_visita']) == (DIA, DIA)
+
+
+@so_postgres
+def test_contadores_batem_com_a_reconciliacao(armazenamento, alunos):
+    # O incremental (reserva, cancelamento, promoção, fechamento) tem que dar o
+    # mesmo que o recálculo noturno a partir das reservas
+    from armazenamento_postgres import reconciliar_engajamento
+    for i, aluno in enumerate(alunos[:6]):
+        reservar(armazenamento, aluno, i + 1)
+        reservar(armazenamento, aluno, i + 1, horario="10:00")
+    for aluno in alunos[6:9]:
+        armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", aluno[1], aluno[0])
+    cancelar(armazenamento, 1)
+    cancelar(armazenamento, 2)
+    cancelar(armazenamento, 3, horario="10:00")
+    armazenamento.aplicar_bloqueio(DIA, "10:00", "10:00", "Esteira", 4, "", "admin@naalli.com")
+
+    ids = [u for u, _ in alunos[:9]]
+    antes = {u: total_treinos(armazenamento, u) for u in ids}
+    reconciliar_engajamento(armazenamento.unidade)
+    depois = {u: total_treinos(armazenamento, u) for u in ids}
+    assert antes == depois
+    reservas = armazenamento.carregar_dados_dia(DIA)
+    assert sum(depois.values()) == len(reservas) == 10
+    assert set(reservas['Data']) == {DATA_STR}
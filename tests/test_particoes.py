@@ -0,0 +1,78 @@
+import threading
+import pytest
+from datetime import date
+from sqlalchemy import text
+from armazenamento import UNIDADES
+from conftest import DIA, HORARIO, reservar, so_postgres
+
+
+def _particao_da_reserva(armazenamento, dia):
+    with armazenamento.conn.engine.connect() as c:
+        return c.execute(
+            text("SELECT tableoid::regclass::text FROM agendamentos WHERE unidade = :unidade AND dia = :dia AND horario = :h"),
+            {"unidade": armazenamento.unidade, "dia": dia, "h": HORARIO}
+        ).scalar_one()
+
+def _existe(armazenamento, tabela):
+    with armazenamento.conn.engine.connect() as c:
+        return c.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": tabela}).scalar_one()
+
+
+def test_nome_particao():
+    from armazenamento_postgres import nome_particao
+    assert nome_particao("centro") == "agendamentos_centro"
+    assert nome_particao("centro", date(2027, 3, 15)) == "agendamentos_centro_2027_03"
+    assert nome_particao(None, date(2027, 3, 15)) == "agendamentos_2027_03"
+
+@so_postgres
+def test_reserva_vai_para_a_particao_da_unidade_e_do_mes(armazenamento, alunos):
+    from armazenamento_postgres import particionamento_agendamentos, nome_particao
+    assert particionamento_agendamentos(armazenamento.unidade) == "unidade"
+    reservar(armazenamento, alunos[0], 1)
+    assert _particao_da_reserva(armazenamento, DIA) == nome_particao(armazenamento.unidade, DIA)
+
+@so_postgres
+def test_cada_unidade_na_sua_particao(armazenamento, alunos):
+    from armazenamento_postgres import ArmazenamentoPostgres, nome_particao
+    outras = [u for u in UNIDADES if u != armazenamento.unidade]
+    if not outras:
+        pytest.skip("NAALLI_UNIDADES com uma unidade só")
+    outra = ArmazenamentoPostgres(outras[0])
+    reservar(armazenamento, alunos[0], 1)
+    reservar(outra, alunos[0], 1)
+    try:
+        assert _particao_da_reserva(outra, DIA) == nome_particao(outra.unidade, DIA)
+        # Cada instância só enxerga a própria unidade
+        assert len(armazenamento.carregar_dados_dia(DIA)) == len(outra.carregar_dados_dia(DIA)) == 1
+    finally:
+        with outra.conn.session as s:
+            s.execute(text("DELETE FROM agendamentos WHERE unidade = :unidade AND dia = :dia"), {"unidade": outra.unidade, "dia": DIA})
+            s.execute(text("DELETE FROM engajamento_aluno WHERE unidade = :unidade AND user_id = :u"), {"unidade": outra.unidade, "u": alunos[0][0]})
+            s.commit()
+
+@so_postgres
+def test_garantir_particao_cria_o_mes_sob_a_trava(armazenamento):
+    import armazenamento_postgres as pg
+    # Um mês que nenhum teste ou reserva usa; a partição é apagada no fim
+    mes = date(DIA.year + 30, 1, 1)
+    particao = pg.nome_particao(armazenamento.unidade, mes)
+    assert not _existe(armazenamento, particao)
+    try:
+        with armazenamento.conn.engine.connect() as c:
+            c.execute(text("SELECT pg_advisory_lock(:ns, :m)"), {"ns": pg.TRAVA_PARTICAO, "m": mes.toordinal()})
+            criar = threading.Thread(target=pg.garantir_particao, args=(date(mes.year, 1, 20), armazenamento.unidade), daemon=True)
+            criar.start()
+            criar.join(0.5)
+            assert criar.is_alive() # Esperando a trava do mês
+            c.execute(text("SELECT pg_advisory_unlock(:ns, :m)"), {"ns": pg.TRAVA_PARTICAO, "m": mes.toordinal()})
+            c.commit()
+        criar.join(10)
+        assert not criar.is_alive() and _existe(armazenamento, particao)
+        # Segunda vez no mesmo processo: nem vai ao banco
+        assert (armazenamento.unidade, mes) in pg._particoes_conhecidas
+        pg.garantir_particao(mes, armazenamento.unidade)
+    finally:
+        with armazenamento.conn.session as s:
+            s.execute(text(f"DROP TABLE IF EXISTS {particao}"))
+            s.commit()
+        pg._particoes_conhecidas.discard((armazenamento.unidade, mes))
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import text
+from armazenamento import UNIDADES
+from conftest import so_postgres
+
+# Ids de agendamento que não existem: lápides só deste teste
+ID_LAPIDE = -424242
+
+
+def _lapides(s):
+    return dict(s.execute(text(
+        "SELECT unidade, count(*) FROM agendamentos_removidos WHERE id = :id GROUP BY unidade"
+    ), {"id": ID_LAPIDE}).fetchall())
+
+
+@so_postgres
+def test_limpar_remocoes_so_apaga_a_unidade(armazenamento):
+    from armazenamento_postgres import limpar_remocoes
+    if len(UNIDADES) < 2:
+        pytest.skip("NAALLI_UNIDADES com uma unidade só")
+    outra = next(u for u in UNIDADES if u != armazenamento.unidade)
+    with armazenamento.conn.session as s:
+        for unidade in (armazenamento.unidade, outra):
+            s.execute(text(
+                "INSERT INTO agendamentos_removidos (unidade, id, removido_em) VALUES (:u, :id, now() - interval '30 days')"
+            ), {"u": unidade, "id": ID_LAPIDE})
+        s.commit()
+    try:
+        limpar_remocoes(unidade=armazenamento.unidade)
+        with armazenamento.conn.session as s:
+            assert _lapides(s) == {outra: 1}
+    finally:
+        with armazenamento.conn.session as s:
+            s.execute(text("DELETE FROM agendamentos_removidos WHERE id = :id"), {"id": ID_LAPIDE})
+            s.commit()
+
+def test_cron_passo_a_partir_de_um_valor():
+    from agendador import Cron
+    assert Cron("5/10 * * * *").minutos == {5, 15, 25, 35, 45, 55}
+    assert Cron("0 1/6 * * *").horas == {1, 7, 13, 19}
+    assert Cron("*/20,7 * * * *").minutos == {0, 7, 20, 40}
+    for expressao in ("5/0 * * * *", "60/5 * * * *", "1-5/-1 * * * *"):
+        with pytest.raises(ValueError):
+            Cron(expressao)
@@ -0,0 +1,43 @@
+import time
+from conftest import DATA_STR, HORARIO, reservar, cancelar, so_postgres
+
+ESPERA_S = 10
+
+def _esperar(condicao):
+    limite = time.monotonic() + ESPERA_S
+    while not condicao():
+        assert time.monotonic() < limite, "o ouvinte não recebeu o evento a tempo"
+        time.sleep(0.05)
+
+
+@so_postgres
+def test_ouvinte_acompanha_reservas_e_cancelamentos(armazenamento, alunos):
+    from armazenamento_postgres import get_db_url
+    from tempo_real import OcupacaoAoVivo
+
+    ocupacao = OcupacaoAoVivo(get_db_url(armazenamento.unidade), armazenamento.unidade)
+    _esperar(lambda: ocupacao.conectado)
+    assert ocupacao.ocupacao_dia(DATA_STR) == {}
+
+    # Daqui em diante o dia vem da memória: só o NOTIFY pode mudá-lo
+    versao = ocupacao.versao
+    reservar(armazenamento, alunos[0], 1)
+    _esperar(lambda: ocupacao.versao > versao)
+    assert ocupacao.ocupacao_dia(DATA_STR) == {(HORARIO, 1, "Esteira"): (alunos[0][1], alunos[0][0])}
+
+    versao = ocupacao.versao
+    cancelar(armazenamento, 1)
+    _esperar(lambda: ocupacao.versao > versao)
+    assert ocupacao.ocupacao_dia(DATA_STR) == {}
+
+@so_postgres
+def test_ouvinte_ignora_outras_unidades(armazenamento, alunos):
+    from armazenamento_postgres import get_db_url
+    from tempo_real import OcupacaoAoVivo
+
+    ocupacao = OcupacaoAoVivo(get_db_url(armazenamento.unidade), "outra_unidade")
+    _esperar(lambda: ocupacao.conectado)
+    versao = ocupacao.versao
+    reservar(armazenamento, alunos[0], 1)
+    time.sleep(0.5)
+    assert ocupacao.versao == versao
@@ -0,0 +1,106 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from sqlalchemy import text
+from conftest import DIA, DATA_STR, HORARIO, reservar, so_postgres
+
+ESPERA_S = 0.5
+
+
+class _EmSegundoPlano(threading.Thread):
+    """Roda 'funcao' numa thread; 'resultado' fica com o retorno."""
+
+    def __init__(self, funcao):
+        super().__init__(daemon=True)
+        self.funcao = funcao
+        self.resultado = None
+        self.start()
+
+    def run(self):
+        self.resultado = self.funcao()
+
+    def terminou(self, espera=ESPERA_S):
+        self.join(espera)
+        return not self.is_alive()
+
+@contextmanager
+def _trava(armazenamento, namespace, chave, compartilhada=False):
+    """Segura a trava consultiva numa conexão à parte, como outra transação em andamento."""
+    sufixo = "_shared" if compartilhada else ""
+    with armazenamento.conn.engine.connect() as c:
+        c.execute(text(f"SELECT pg_advisory_lock{sufixo}(:ns, :k)"), {"ns": namespace, "k": chave})
+        try:
+            yield
+        finally:
+            c.execute(text(f"SELECT pg_advisory_unlock{sufixo}(:ns, :k)"), {"ns": namespace, "k": chave})
+            c.commit()
+
+
+# --- RESERVA x FECHAMENTO (os dois backends) ---
+def test_fechamento_simultaneo_nao_deixa_reserva_na_faixa(armazenamento, alunos):
+    # Cada reserva ou entra antes (e o fechamento a cancela) ou depois (e é recusada)
+    barreira = threading.Barrier(len(alunos) + 1)
+
+    def tentar(aluno, numero):
+        barreira.wait()
+        return reservar(armazenamento, aluno, numero)
+
+    def fechar():
+        barreira.wait()
+        return armazenamento.aplicar_bloqueio(DIA, HORARIO, HORARIO, None, None, "Feriado", "admin@naalli.com")
+
+    reservas = [_EmSegundoPlano(lambda a=aluno, n=i + 1: tentar(a, n)) for i, aluno in enumerate(alunos)]
+    fechamento = _EmSegundoPlano(fechar)
+    for t in (*reservas, fechamento):
+        assert t.terminou(30)
+
+    aceitas = sum(t.resultado for t in reservas)
+    assert len(fechamento.resultado) == aceitas
+    assert armazenamento.carregar_dados_dia(DIA).empty
+
+
+# --- TRAVAS CONSULTIVAS DO POSTGRES ---
+@so_postgres
+def test_reserva_espera_fechamento_do_dia(armazenamento, alunos):
+    from armazenamento_postgres import TRAVA_AGENDA_DIA, chave_agenda_dia
+    with _trava(armazenamento, TRAVA_AGENDA_DIA, chave_agenda_dia(armazenamento.unidade, DIA)):
+        reserva = _EmSegundoPlano(lambda: reservar(armazenamento, alunos[0], 1))
+        assert not reserva.terminou()
+        # Outro dia tem outra chave: não espera
+        outro_dia = DIA + timedelta(days=1)
+        assert armazenamento.inserir_agendamento(outro_dia.strftime("%d/%m/%Y"), outro_dia, HORARIO, 1, "Esteira",
+                                                 alunos[1][1], "LOGGED_USER", alunos[1][0])
+    assert reserva.terminou(10) and reserva.resultado
+
+@so_postgres
+def test_fechamento_espera_reservas_em_andamento(armazenamento, alunos):
+    from armazenamento_postgres import TRAVA_AGENDA_DIA, chave_agenda_dia
+    with _trava(armazenamento, TRAVA_AGENDA_DIA, chave_agenda_dia(armazenamento.unidade, DIA), compartilhada=True):
+        fechamento = _EmSegundoPlano(
+            lambda: armazenamento.aplicar_bloqueio(DIA, HORARIO, HORARIO, None, None, "Feriado", "admin@naalli.com")
+        )
+        assert not fechamento.terminou()
+        # Com o fechamento na fila da trava exclusiva, reservas novas esperam atrás dele
+        reserva = _EmSegundoPlano(lambda: reservar(armazenamento, alunos[0], 1))
+        assert not reserva.terminou()
+    assert fechamento.terminou(10) and fechamento.resultado.empty
+    assert reserva.terminou(10) and not reserva.resultado # Já enxerga o bloqueio
+
+@so_postgres
+def test_cancelamento_espera_fechamento_do_dia(armazenamento, alunos):
+    from armazenamento_postgres import TRAVA_AGENDA_DIA, chave_agenda_dia
+    reservar(armazenamento, alunos[0], 1)
+    armazenamento.entrar_lista_espera(DIA, HORARIO, "Esteira", alunos[1][1], alunos[1][0])
+    id_agendamento = armazenamento.buscar_agendamento(DIA, HORARIO, 1, "Esteira")['id']
+    with _trava(armazenamento, TRAVA_AGENDA_DIA, chave_agenda_dia(armazenamento.unidade, DIA)):
+        cancelamento = _EmSegundoPlano(lambda: armazenamento.remover_agendamento(id_agendamento, DIA, alunos[0][0]))
+        assert not cancelamento.terminou()
+    assert cancelamento.terminou(10)
+    assert cancelamento.resultado['user_id'] == alunos[1][0]
+    assert armazenamento.carregar_dados_dia(DIA)['Data'].tolist() == [DATA_STR]
+
+def test_chave_agenda_dia_separa_unidades_e_dias():
+    from armazenamento_postgres import chave_agenda_dia
+    chaves = {chave_agenda_dia(u, d) for u in ("centro", "zona_sul") for d in (DIA, DIA + timedelta(days=1))}
+    assert len(chaves) == 4
+    assert all(-2 ** 31 <= k < 2 ** 31 for k in chaves) # int4 do pg_advisory_lock(int, int)
@@ -0,0 +1,141 @@
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from datetime import date, timedelta
+
+# ==========================================
+# CUBO DE UTILIZAÇÃO (DATA x HORÁRIO x MODALIDADE)
+# ==========================================
+# Utilização = reservas / capacidade da grade (capacidade.py) em cada
+# célula. As reservas são contadas de uma vez com np.bincount sobre o
+# índice achatado (dia, hora, tipo) e a capacidade vem das matrizes por dia
+# da semana da grade, indexadas pelo dia da semana de cada data. As vistas
+# (mapas de calor, horários lotados, horários ociosos) são reduções do
+# cubo: nenhum laço em Python por reserva ou por célula.
+#
+# A capacidade de datas passadas é a dos modelos atuais: mudar a grade
+# muda também a utilização histórica mostrada.
+
+DIAS_CURTOS = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+
+
+def rotulos_dias(datas):
+    """DatetimeIndex -> "Seg, 19/10" (vetorizado)."""
+    return np.array(DIAS_CURTOS, dtype=object)[datas.dayofweek.to_numpy()] + ", " + datas.strftime("%d/%m").to_numpy(dtype=object)
+
+
+def _posicoes(coluna, valores):
+    """Posição de cada texto da coluna em 'valores' (-1 se não está), em C pelo Arrow."""
+    return pc.index_in(pa.array(coluna), value_set=pa.array(valores, pa.string())).fill_null(-1).to_numpy()
+
+
+class CuboUtilizacao:
+    """reservas e capacidade em arrays [dias x horas x tipos]."""
+
+    def __init__(self, df, inicio, fim, grade, tipos=None):
+        self.horas = list(grade.horas_possiveis)
+        self.tipos = [t for t in grade.tipos() if tipos is None or t in tipos]
+        self.dias = np.arange(np.datetime64(inicio, "D"), np.datetime64(fim, "D") + np.timedelta64(1, "D"))
+        # 01/01/1970 foi uma quinta-feira (3, com Segunda = 0)
+        self.dia_semana = (self.dias.astype(np.int64) + 3) % 7
+        forma = (len(self.dias), len(self.horas), len(self.tipos))
+
+        por_semana, por_data = grade.matrizes_capacidade(self.horas, self.tipos)
+        self.capacidade = por_semana[self.dia_semana]
+        for dia, matriz in por_data.items(): # Só as datas com exceção na grade
+            i = (np.datetime64(dia, "D") - self.dias[0]).astype(np.int64) if len(self.dias) else -1
+            if 0 <= i < len(self.dias):
+                self.capacidade[i] = matriz
+
+        self.reservas = np.zeros(forma, dtype=np.int64)
+        if not df.empty and all(forma):
+            i_dia = (pd.to_datetime(df["Data_dt"]).to_numpy(dtype="datetime64[D]") - self.dias[0]).astype(np.int64)
+            i_hora = _posicoes(df["Horario"], self.horas)
+            i_tipo = _posicoes(df["Tipo"], self.tipos)
+            # Fora do período ou em horário/modalidade que não existe mais na grade: fica de fora
+            ok = (i_dia >= 0) & (i_dia < forma[0]) & (i_hora >= 0) & (i_tipo >= 0)
+            plano = np.ravel_multi_index((i_dia[ok], i_hora[ok], i_tipo[ok]), forma)
+            self.reservas = np.bincount(plano, minlength=np.prod(forma)).reshape(forma)
+
+    @staticmethod
+    def _razao(reservas, capacidade):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(capacidade > 0, reservas / capacidade, np.nan)
+
+    # --- VISTAS ---
+    def por_dia_hora(self):
+        """DataFrame datas x horários com a utilização (0-1) somando as modalidades; NaN = fechado."""
+        util = self._razao(self.reservas.sum(axis=2), self.capacidade.sum(axis=2))
+        return pd.DataFrame(util, index=pd.to_datetime(self.dias), columns=self.horas)
+
+    def por_semana_hora(self):
+        """DataFrame dias da semana x horários: utilização média do período."""
+        reservas = np.zeros((7, len(self.horas)), dtype=np.int64)
+        capacidade = np.zeros((7, len(self.horas)), dtype=np.int64)
+        np.add.at(reservas, self.dia_semana, self.reservas.sum(axis=2))
+        np.add.at(capacidade, self.dia_semana, self.capacidade.sum(axis=2))
+        util = self._razao(reservas, capacidade)
+        return pd.DataFrame(util, index=DIAS_CURTOS, columns=self.horas).dropna(how="all")
+
+    def saturados(self, limiar=1.0):
+        """Células (data, horário, modalidade) com utilização >= limiar, mais cheias primeiro."""
+        util = self._razao(self.reservas, self.capacidade)
+        i_dia, i_hora, i_tipo = np.nonzero(np.nan_to_num(util) >= limiar)
+        df = pd.DataFrame({
+            "Data": pd.to_datetime(self.dias[i_dia]),
+            "Horario": np.array(self.horas, dtype=object)[i_hora],
+            "Tipo": np.array(self.tipos, dtype=object)[i_tipo],
+            "Reservas": self.reservas[i_dia, i_hora, i_tipo],
+            "Capacidade": self.capacidade[i_dia, i_hora, i_tipo],
+            "Utilizacao": util[i_dia, i_hora, i_tipo],
+        })
+        return df.sort_values(["Utilizacao", "Data"], ascending=[False, True], ignore_index=True)
+
+    def ociosos(self, limiar=0.3):
+        """(Horário, modalidade) com utilização média abaixo do limiar no período, mais vazios primeiro."""
+        reservas = self.reservas.sum(axis=0)
+        capacidade = self.capacidade.sum(axis=0)
+        util = self._razao(reservas, capacidade)
+        i_hora, i_tipo = np.nonzero((capacidade > 0) & (np.nan_to_num(util) < limiar))
+        df = pd.DataFrame({
+            "Horario": np.array(self.horas, dtype=object)[i_hora],
+            "Tipo": np.array(self.tipos, dtype=object)[i_tipo],
+            "Reservas": reservas[i_hora, i_tipo],
+            "Capacidade": capacidade[i_hora, i_tipo],
+            "Utilizacao": util[i_hora, i_tipo],
+        })
+        return df.sort_values(["Utilizacao", "Horario"], ignore_index=True)
+
+    def geral(self):
+        """Utilização do período inteiro (0-1), ou None sem capacidade."""
+        capacidade = self.capacidade.sum()
+        return float(self.reservas.sum() / capacidade) if capacidade else None
+
+
+if __name__ == "__main__":
+    # Benchmark com histórico sintético: python utilizacao.py [anos]
+    import sys
+    from capacidade import GradeCapacidade, MODELOS_PADRAO
+
+    anos = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    grade = GradeCapacidade(MODELOS_PADRAO)
+    fim = date.today()
+    inicio = fim - timedelta(days=365 * anos)
+    rng = np.random.default_rng(0)
+    n = 120 * 365 * anos # ~120 reservas por dia
+    dias = pd.to_datetime(np.datetime64(inicio, "D") + rng.integers(0, (fim - inicio).days + 1, n))
+    df = pd.DataFrame({
+        "Data_dt": dias,
+        "Horario": [f"{h:02d}:00" for h in rng.integers(6, 21, n)],
+        "Tipo": rng.choice(["Treino", "Esteira", "Elíptico"], n, p=[0.75, 0.17, 0.08]),
+    })
+
+    t0 = time.perf_counter()
+    cubo = CuboUtilizacao(df, inicio, fim, grade)
+    t1 = time.perf_counter()
+    vistas = (cubo.por_dia_hora(), cubo.por_semana_hora(), cubo.saturados(), cubo.ociosos())
+    t2 = time.perf_counter()
+    print(f"{n} reservas, cubo {cubo.reservas.shape}: montagem {(t1 - t0) * 1000:.0f} ms, vistas {(t2 - t1) * 1000:.0f} ms")
+    print(f"Utilização geral: {cubo.geral():.0%} | lotados: {len(vistas[2])} | ociosos: {len(vistas[3])}")
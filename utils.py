@@ -1,63 +1,144 @@
 import os
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import hashlib
 import smtplib
 from email.mime.text import MIMEText
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import random
 import string
-from sqlalchemy import text
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from armazenamento import criar_armazenamento, metricas_thread, rotulo_unidade, UNIDADES, UNIDADE_PADRAO
+from instantaneo import InstantaneoAgendamentos
+from capacidade import GradeCapacidade, validar_modelo
+from previsao import PrevisaoDemanda, SEMANAS_HISTORICO
+from comentarios import IndiceComentarios
+from checkin import IngestorCheckins, ID_MAXIMO as ID_MAXIMO_CHECKIN
 
 # ==========================================
-# 0. FUNÇÃO DE CONEXÃO ROBUSTA (UNIVERSAL)
+# 0. ARMAZENAMENTO (POSTGRES OU SQLITE)
 # ==========================================
-def get_db_connection():
-    """
-    Função inteligente que busca a credencial no Render (Variável de Ambiente)
-    ou no Local (secrets.toml), corrigindo bugs do SQLAlchemy.
-    """
-    # 1. Tenta pegar do Render (Variável de Ambiente)
-    db_url = os.environ.get("DATABASE_URL")
+# As funções abaixo não falam SQL: usam o backend de armazenamento.py,
+# criado no primeiro uso (importar este módulo não conecta em nada).
+#
+# Tudo o que lê ou grava dados é da unidade atual: a escolhida na sessão
+# (st.session_state['unidade']), a de usar_unidade() em scripts e na API,
+# ou a unidade padrão. Cada unidade tem seu armazenamento, instantâneo,
+# grade e caches.
+_armazenamentos = {}
+_lock_armazenamento = threading.Lock()
+_unidade_thread = threading.local()
 
-    # 2. Se não achou (estamos Local), tenta pegar do secrets.toml
-    if not db_url:
-        try:
-            # Tenta pegar com o nome 'postgres' OU 'postgresql' para garantir
-            if "connections" in st.secrets:
-                if "postgres" in st.secrets["connections"]:
-                    db_url = st.secrets["connections"]["postgres"]["url"]
-                elif "postgresql" in st.secrets["connections"]:
-                    db_url = st.secrets["connections"]["postgresql"]["url"]
-        except:
-            # Se der erro ao ler secrets, ignoramos por enquanto
-            pass
-    
-    # 3. Correção do bug do SQLAlchemy (postgres:// -> postgresql://)
-    # O Render/Neon costuma mandar postgres://, mas o Python exige postgresql://
-    if db_url and db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql://", 1)
+@contextmanager
+def usar_unidade(unidade):
+    """Faz as funções deste módulo atenderem 'unidade' dentro do bloco (scripts, API)."""
+    if unidade not in UNIDADES:
+        raise ValueError(f"Unidade desconhecida: {unidade}")
+    anterior = getattr(_unidade_thread, "unidade", None)
+    _unidade_thread.unidade = unidade
+    try:
+        yield
+    finally:
+        _unidade_thread.unidade = anterior
+
+def unidade_atual():
+    unidade = getattr(_unidade_thread, "unidade", None)
+    if unidade:
+        return unidade
+    # Fora de uma execução do Streamlit (tarefas, benchmarks) não há sessão
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        unidade = st.session_state.get("unidade")
+        if unidade in UNIDADES:
+            return unidade
+    return UNIDADE_PADRAO
+
+def get_armazenamento(unidade=None):
+    unidade = unidade or unidade_atual()
+    armazenamento = _armazenamentos.get(unidade)
+    if armazenamento is None:
+        with _lock_armazenamento:
+            armazenamento = _armazenamentos.get(unidade)
+            if armazenamento is None:
+                armazenamento = criar_armazenamento(unidade=unidade)
+                # Cria Admin padrão se a tabela estiver vazia (uma vez por banco)
+                if not armazenamento.tem_usuarios():
+                    armazenamento.inserir_usuario(DEFAULT_ADMIN_EMAIL, "Administrador", hash_senha(DEFAULT_ADMIN_PASS), True, "admin")
+                _armazenamentos[unidade] = armazenamento
+    return armazenamento
+
+_aquecendo = False
+
+def aquecer_armazenamento():
+    """Abre o banco em segundo plano: o Neon acorda enquanto a tela de login carrega."""
+    global _aquecendo
+    if not _armazenamentos and not _aquecendo:
+        _aquecendo = True
+        threading.Thread(target=_aquecer, name="naalli-aquecimento", daemon=True).start()
 
-    # 4. Verifica se a URL foi encontrada antes de conectar
-    if not db_url:
-        # Se chegamos aqui sem URL, o app vai quebrar, então avisamos
-        st.error("Erro Crítico: Não foi possível encontrar a URL do Banco de Dados.")
-        st.stop()
+def _aquecer():
+    try:
+        for unidade in UNIDADES:
+            get_armazenamento(unidade)
+    except Exception as e:
+        print(f"Aquecimento do banco falhou: {e}")
+
+# Histórico de agendamentos da unidade, compartilhado por todas as sessões do processo
+_instantaneos = {}
+
+def get_instantaneo(unidade=None):
+    unidade = unidade or unidade_atual()
+    if unidade not in _instantaneos:
+        armazenamento = get_armazenamento(unidade)
+        with _lock_armazenamento:
+            if unidade not in _instantaneos:
+                _instantaneos[unidade] = InstantaneoAgendamentos(armazenamento)
+    return _instantaneos[unidade]
+
+# Grade de capacidade (capacidade.py): lida uma vez e trocada inteira quando
+# um admin edita os modelos. Outros processos a releem a cada RECARGA_GRADE_S.
+RECARGA_GRADE_S = 60
+_grades = {} # unidade -> (grade, lida_em)
 
-    # 5. Retorna a conexão configurada
-    return st.connection("postgres", type="sql", url=db_url)
+def get_grade(unidade=None):
+    unidade = unidade or unidade_atual()
+    grade, lida_em = _grades.get(unidade, (None, 0.0))
+    if grade is None or time.monotonic() - lida_em > RECARGA_GRADE_S:
+        grade = GradeCapacidade(modelos_horario_linhas(unidade))
+        _grades[unidade] = (grade, time.monotonic())
+    return grade
+
+def invalidar_grade(unidade=None):
+    _grades.pop(unidade or unidade_atual(), None)
 
 # ==========================================
-# CONFIGURAÇÃO GLOBAL
+# DIAGNÓSTICO: CONSULTAS E TEMPO POR EXECUÇÃO
 # ==========================================
-
-# AQUI ESTAVA O ERRO: Agora usamos a função robusta para definir a conexão global
-conn = get_db_connection()
+@contextmanager
+def medir_execucao(rotulo):
+    """
+    Mede quantas consultas ao banco e quanto tempo de servidor um trecho da
+    tela gastou. Com NAALLI_DEBUG=1 o resultado aparece como legenda na tela.
+    """
+    consultas_inicio = getattr(metricas_thread, "consultas", 0)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        consultas = getattr(metricas_thread, "consultas", 0) - consultas_inicio
+        ms = (time.perf_counter() - inicio) * 1000
+        if os.environ.get("NAALLI_DEBUG"):
+            st.caption(f"🔧 {rotulo}: {consultas} consulta(s) ao banco | {ms:.0f} ms")
 
 # Constantes
 SENHA_ADMIN = "naalli2025" 
 DEFAULT_ADMIN_EMAIL = "admin@naalli.com"
 DEFAULT_ADMIN_PASS = "mudar123"
+JANELA_AVALIACAO_DIAS = 60 # Treinos mais antigos que isso não pedem mais avaliação
+CACHE_BLOQUEIOS_S = 30     # Fechamentos feitos em outro processo aparecem na grade em até 30s
 
 # ==========================================
 # 1. FUNÇÕES DE SEGURANÇA E USUÁRIOS
@@ -66,237 +147,400 @@ DEFAULT_ADMIN_PASS = "mudar123"
 def hash_senha(senha):
     return hashlib.sha256(senha.encode()).hexdigest()
 
-def inicializar_banco():
-    """Cria as tabelas no Neon se não existirem."""
-    try:
-        with conn.session as s:
-            # Tabela Usuários
-            s.execute(text("""
-                CREATE TABLE IF NOT EXISTS users (
-                    email TEXT PRIMARY KEY,
-                    nome TEXT,
-                    senha TEXT,
-                    mudar_senha BOOLEAN,
-                    tipo TEXT
-                );
-            """))
-            
-            # Tabela Agendamentos
-            s.execute(text("""
-                CREATE TABLE IF NOT EXISTS agendamentos (
-                    id SERIAL PRIMARY KEY,
-                    data TEXT,
-                    horario TEXT,
-                    numero INTEGER,
-                    tipo TEXT,
-                    nome TEXT,
-                    pin TEXT,
-                    criado_em TEXT
-                );
-            """))
-            
-            # Tabela Avaliações
-            s.execute(text("""
-                CREATE TABLE IF NOT EXISTS avaliacoes (
-                    id SERIAL PRIMARY KEY,
-                    id_agendamento INTEGER,
-                    nome_aluno TEXT,
-                    data_aula TEXT,
-                    modalidade TEXT,
-                    nota INTEGER,
-                    comentario TEXT,
-                    data_avaliacao TEXT
-                );
-            """))
-            s.commit()
-
-        # Cria Admin padrão se a tabela estiver vazia
-        users = conn.query("SELECT * FROM users", ttl=0)
-        if users.empty:
-            criar_usuario(DEFAULT_ADMIN_EMAIL, "Administrador", DEFAULT_ADMIN_PASS, "admin")
-            
-    except Exception as e:
-        st.error(f"Erro ao inicializar banco de dados: {e}")
-
 def verificar_login(email, senha_digitada):
-    # Usa a conexão global já configurada
     email = email.strip()
     senha_digitada = senha_digitada.strip()
     
     try:
-        # Busca segura com parâmetros (evita SQL Injection)
-        df = conn.query("SELECT * FROM users WHERE email = :email", params={"email": email}, ttl=0)
-        
-        if not df.empty:
-            user_data = df.iloc[0].to_dict()
-            if user_data['senha'] == hash_senha(senha_digitada):
-                return user_data
+        user_data = get_armazenamento().buscar_usuario(email)
+        if user_data and user_data['senha'] == hash_senha(senha_digitada):
+            return user_data
     except Exception as e:
         st.error(f"Erro no login: {e}")
         
     return None
 
+def trocar_unidade(unidade, email=None):
+    """
+    Passa a sessão para 'unidade'. Com 'email', devolve a conta no banco da
+    unidade nova (o id muda se a unidade tem banco próprio) ou None se ela
+    não existe lá; a sessão só troca de unidade se a conta existir.
+    """
+    usuario = get_armazenamento(unidade).buscar_usuario(email) if email else None
+    if email is None or usuario is not None:
+        st.session_state.unidade = unidade
+    return usuario
+
+def _ao_trocar_unidade(chave):
+    nova = st.session_state[chave]
+    user = st.session_state.get("user")
+    if user is None:
+        trocar_unidade(nova)
+        return
+    conta = trocar_unidade(nova, user['email'])
+    if conta is None:
+        st.session_state[chave] = unidade_atual() # Fica onde estava
+        st.session_state.erro_unidade = f"Sua conta não está cadastrada na unidade {rotulo_unidade(nova)}."
+    else:
+        st.session_state.user = conta
+
+def seletor_unidade(rotulo="Unidade", chave="seletor_unidade"):
+    """Escolha da unidade (só aparece com mais de uma). Logado, a conta é relida no banco da unidade nova."""
+    if len(UNIDADES) < 2:
+        return
+    st.session_state[chave] = unidade_atual() # Outros seletores da tela podem ter trocado
+    st.selectbox(rotulo, UNIDADES, format_func=rotulo_unidade, key=chave, on_change=_ao_trocar_unidade, args=(chave,))
+    erro = st.session_state.pop("erro_unidade", None)
+    if erro:
+        st.error(erro)
+
+# Avisados com (unidade, email) a cada troca de senha neste processo: a API esquece os logins guardados
+ao_trocar_senha = []
+
+def _senha_trocada(email):
+    for funcao in ao_trocar_senha:
+        funcao(unidade_atual(), email)
+
 def atualizar_senha(email, nova_senha):
-    with conn.session as s:
-        s.execute(
-            text("UPDATE users SET senha = :s, mudar_senha = :m WHERE email = :e"),
-            params={"s": hash_senha(nova_senha), "m": False, "e": email}
-        )
-        s.commit()
+    get_armazenamento().atualizar_senha(email, hash_senha(nova_senha), False)
+    _senha_trocada(email)
     return True
 
 def recuperar_senha_email(email_destino):
-    df = conn.query("SELECT * FROM users WHERE email = :e", params={"e": email_destino}, ttl=0)
-    
-    if df.empty:
+    armazenamento = get_armazenamento()
+    if armazenamento.buscar_usuario(email_destino) is None:
         return False, "E-mail não cadastrado."
 
     nova_senha_temp = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
     
-    with conn.session as s:
-        s.execute(
-            text("UPDATE users SET senha = :s, mudar_senha = :m WHERE email = :e"),
-            params={"s": hash_senha(nova_senha_temp), "m": True, "e": email_destino}
-        )
-        s.commit()
+    armazenamento.atualizar_senha(email_destino, hash_senha(nova_senha_temp), True)
+    _senha_trocada(email_destino)
 
     try:
-        if "email" in st.secrets:
-            secrets = st.secrets["email"]
-            msg = MIMEText(f"Olá! Para recuperar seu acesso, utilize a senha temporária: {nova_senha_temp}")
-            msg['Subject'] = "[Agenda Naalli] Recuperação de Senha"
-            msg['From'] = secrets["sender_email"]  
-            msg['To'] = email_destino
-
-            with smtplib.SMTP_SSL(secrets["smtp_server"], secrets["smtp_port"]) as server:
-                server.login(secrets["sender_email"], secrets["sender_password"])
-                server.sendmail(secrets["sender_email"], email_destino, msg.as_string())
+        if email_configurado():
+            enviar_email(email_destino, "[Agenda Naalli] Recuperação de Senha", f"Olá! Para recuperar seu acesso, utilize a senha temporária: {nova_senha_temp}")
             return True, "E-mail enviado!"
         else:
             return True, f"Modo Debug: {nova_senha_temp}"
     except Exception as e:
         return False, f"Erro: {str(e)}"
 
-def criar_usuario(email, nome, senha_inicial, tipo='aluno'):
-    # Verifica duplicidade
-    df = conn.query("SELECT email FROM users WHERE email = :e", params={"e": email}, ttl=0)
-    if not df.empty:
+def email_configurado():
+    try:
+        return "email" in st.secrets
+    except Exception:
         return False
-    
-    with conn.session as s:
-        s.execute(
-            text("INSERT INTO users (email, nome, senha, mudar_senha, tipo) VALUES (:e, :n, :s, :m, :t)"),
-            params={
-                "e": email, "n": nome, "s": hash_senha(senha_inicial), 
-                "m": True, "t": tipo
-            }
-        )
-        s.commit()
-    return True
+
+def enviar_email(email_destino, assunto, corpo):
+    secrets = st.secrets["email"]
+    msg = MIMEText(corpo)
+    msg['Subject'] = assunto
+    msg['From'] = secrets["sender_email"]
+    msg['To'] = email_destino
+
+    with smtplib.SMTP_SSL(secrets["smtp_server"], secrets["smtp_port"]) as server:
+        server.login(secrets["sender_email"], secrets["sender_password"])
+        server.sendmail(secrets["sender_email"], email_destino, msg.as_string())
+
+def criar_usuario(email, nome, senha_inicial, tipo='aluno'):
+    # Retorna False se o e-mail já existe
+    return get_armazenamento().inserir_usuario(email, nome, hash_senha(senha_inicial), True, tipo)
 
 # ==========================================
 # 2. FUNÇÕES OPERACIONAIS (AGENDA)
 # ==========================================
 
-def carregar_dados_dia(data_str):
+def data_para_dia(data_str):
+    """Converte a data do Frontend (DD/MM/YYYY) para date, usado na chave de partição."""
+    return datetime.strptime(data_str, "%d/%m/%Y").date()
+
+def carregar_dados_dia(data_str, unidade=None):
     # Retorna com as colunas renomeadas para bater com o Frontend
-    query = "SELECT data AS \"Data\", horario AS \"Horario\", numero AS \"Numero\", tipo AS \"Tipo\", nome AS \"Nome\", pin AS \"Pin\", criado_em AS \"CriadoEm\" FROM agendamentos WHERE data = :d"
-    df = conn.query(query, params={"d": data_str}, ttl=0)
+    df = get_armazenamento(unidade).carregar_dados_dia(data_para_dia(data_str))
     
     if df.empty:
-        return pd.DataFrame(columns=["Data", "Horario", "Numero", "Tipo", "Nome", "Pin", "CriadoEm"])
+        return pd.DataFrame(columns=["Data", "Horario", "Numero", "Tipo", "Nome", "Pin", "CriadoEm", "UserId"])
     return df
 
-def carregar_tudo_formatado():
-    query = "SELECT data AS \"Data\", horario AS \"Horario\", numero AS \"Numero\", tipo AS \"Tipo\", nome AS \"Nome\", pin AS \"Pin\", criado_em AS \"CriadoEm\" FROM agendamentos"
-    df = conn.query(query, ttl=0)
+def carregar_tudo_formatado(inicio=None, fim=None):
+    # Sem período, lê tudo que está no banco (o arquivo morto fica em particoes.py).
+    # Vem do instantâneo do processo: só o delta desde a última leitura vai ao banco
+    df = get_instantaneo().agendamentos(inicio, fim)
     
     if df.empty:
         return pd.DataFrame(columns=["Data", "Horario", "Numero", "Tipo", "Nome", "Pin", "CriadoEm", "Data_dt"])
     
-    df['Data_dt'] = pd.to_datetime(df['Data'], format="%d/%m/%Y", errors='coerce')
-    return df
+    df['Data_dt'] = df['dia'].astype("datetime64[ns]")
+    return df.drop(columns=["id", "dia"])
 
-def salvar_agendamento(data_str, horario, numero, tipo, nome, pin):
-    # Verifica duplicidade
-    check = conn.query(
-        "SELECT id FROM agendamentos WHERE data = :d AND horario = :h AND numero = :n AND tipo = :t",
-        params={"d": data_str, "h": horario, "n": numero, "t": tipo},
-        ttl=0
-    )
-    if not check.empty:
-        return False
-    
-    with conn.session as s:
-        s.execute(
-            text("INSERT INTO agendamentos (data, horario, numero, tipo, nome, pin, criado_em) VALUES (:d, :h, :n, :t, :nm, :p, :c)"),
-            params={
-                "d": data_str, "h": horario, "n": numero, "t": tipo, 
-                "nm": nome, "p": pin, "c": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-        )
-        s.commit()
-    return True
+def salvar_agendamento(data_str, horario, numero, tipo, nome, pin, user_id=None):
+    # Retorna False se a vaga já foi ocupada
+    return get_armazenamento().inserir_agendamento(data_str, data_para_dia(data_str), horario, numero, tipo, nome, pin, user_id)
 
-def remover_agendamento_por_pin(data_str, horario, numero, tipo, pin_usuario, is_admin=False):
-    # Busca o ID e o PIN para validar
-    df = conn.query(
-        "SELECT id, pin FROM agendamentos WHERE data = :d AND horario = :h AND numero = :n AND tipo = :t",
-        params={"d": data_str, "h": horario, "n": numero, "t": tipo},
-        ttl=0
-    )
-    
-    if df.empty:
+def remover_agendamento_do_aluno(data_str, horario, numero, tipo, user_id, is_admin=False):
+    """Cancela a reserva se ela for do aluno (user_id) ou se quem pede é admin. Retorna "Sucesso" ou o motivo."""
+    dia = data_para_dia(data_str)
+    armazenamento = get_armazenamento()
+    agendamento = armazenamento.buscar_agendamento(dia, horario, numero, tipo)
+
+    if agendamento is None:
         return "Agendamento não encontrado."
-    
-    agendamento = df.iloc[0]
-    
-    if is_admin or agendamento['pin'] == pin_usuario:
-        with conn.session as s:
-            s.execute(text("DELETE FROM agendamentos WHERE id = :id"), params={"id": int(agendamento['id'])})
-            s.commit()
+    if is_admin or agendamento['user_id'] == user_id:
+        armazenamento.remover_agendamento(agendamento['id'], dia, agendamento['user_id'])
         return "Sucesso"
-    else:
-        return "Permissão negada."
-
-def gerar_estrutura_horario(hora):
-    hora_int = int(hora.split(":")[0])
-    eh_almoco = 12 <= hora_int <= 14
-    estrutura = []
-    if eh_almoco:
-        for i in range(1, 7): estrutura.append({"Numero": i, "Tipo": "Treino"})
-        for i in range(7, 9): estrutura.append({"Numero": i, "Tipo": "Esteira"})
-        estrutura.append({"Numero": 9, "Tipo": "Elíptico"})
-    else:
-        for i in range(1, 11): estrutura.append({"Numero": i, "Tipo": "Treino"})
-        for i in range(11, 13): estrutura.append({"Numero": i, "Tipo": "Esteira"})
-        estrutura.append({"Numero": 13, "Tipo": "Elíptico"})
-    return estrutura
+    return "Permissão negada."
+
+def carregar_historico_aluno(user_id, limite=5):
+    # Últimos treinos do aluno
+    return get_armazenamento().historico_aluno(user_id, limite)
+
+def contar_modalidades_aluno(user_id):
+    return get_armazenamento().modalidades_aluno(user_id)
+
+def gerar_estrutura_horario(dia, hora):
+    """Vagas (Numero, Tipo) do horário, da grade em memória: a mesma tupla a cada chamada."""
+    return get_grade().estrutura(dia, hora)
+
+def horarios_funcionamento(dia):
+    """Horários de início das aulas no dia (vazio = fechado), conforme os modelos de horário."""
+    return get_grade().horarios(dia)
+
+def modalidades():
+    return get_grade().tipos()
+
+def numero_maximo_vaga():
+    return get_grade().numero_maximo()
+
+def horas_possiveis():
+    """Todos os horários em que a academia abre em algum dia (filtros de busca e fechamentos)."""
+    return list(get_grade().horas_possiveis)
+
+def modelos_horario_linhas(unidade=None):
+    """Modelos da unidade como lista de dicts (NULL -> None)."""
+    return [
+        {
+            "dia_semana": None if pd.isna(r.dia_semana) else int(r.dia_semana),
+            "dia": None if pd.isna(r.dia) else pd.Timestamp(r.dia).date(),
+            "hora_inicio": r.hora_inicio, "hora_fim": r.hora_fim, "layout": r.layout or "",
+        }
+        for r in get_armazenamento(unidade).modelos_horario().itertuples(index=False)
+    ]
+
+def salvar_modelos_horario(linhas):
+    """Valida e grava os modelos editados pelo admin; a grade nova vale na hora neste processo."""
+    for linha in linhas:
+        validar_modelo(linha)
+    get_armazenamento().substituir_modelos_horario(linhas)
+    invalidar_grade()
+
+def buscar_vagas_livres(tipo, hora_inicio, hora_fim, dias=14, limite=3):
+    """
+    Próximos horários com vaga livre de 'tipo' entre hora_inicio e hora_fim
+    (inclusive) nos próximos 'dias'. Uma única consulta de intervalo monta um
+    bitmap de ocupação por (dia, horário): o bit N ligado = aparelho N ocupado.
+    Aparelhos bloqueados por fechamento não entram na capacidade.
+    Retorna até 'limite' dicts com Data, Horario, Tipo, Numero (primeiro livre) e Livres.
+    """
+    agora = datetime.now()
+    hoje = agora.date()
+    df = get_armazenamento().ocupacao_periodo(hoje, hoje + timedelta(days=dias - 1), tipo)
+    bloqueios = listar_bloqueios(hoje, hoje + timedelta(days=dias - 1))
+
+    ocupadas = {}
+    for dia, horario, numero in df.itertuples(index=False):
+        ocupadas[(dia, horario)] = ocupadas.get((dia, horario), 0) | (1 << int(numero))
+
+    resultado = []
+    for i in range(dias):
+        dia = hoje + timedelta(days=i)
+        for horario in horarios_funcionamento(dia):
+            if not hora_inicio <= horario <= hora_fim:
+                continue
+            if datetime.strptime(f"{dia} {horario}", "%Y-%m-%d %H:%M") < agora:
+                continue
+
+            capacidade = 0
+            bloqueios_hora = bloqueios_horario(bloqueios, dia, horario)
+            for vaga in gerar_estrutura_horario(dia, horario):
+                if vaga.Tipo == tipo and motivo_bloqueio(bloqueios_hora, vaga.Numero, tipo) is None:
+                    capacidade |= 1 << vaga.Numero
+
+            livres = capacidade & ~ocupadas.get((dia, horario), 0)
+            if livres:
+                resultado.append({
+                    "Data": dia.strftime("%d/%m/%Y"), "Horario": horario, "Tipo": tipo,
+                    "Numero": (livres & -livres).bit_length() - 1, # Bit mais baixo = menor número livre
+                    "Livres": bin(livres).count("1"),
+                })
+                if len(resultado) >= limite:
+                    return resultado
+    return resultado
 
 # ==========================================
-# 3. FUNÇÕES DE AVALIAÇÃO
+# 2.1 FECHAMENTOS (FERIADO, MANUTENÇÃO)
 # ==========================================
+# Um fechamento bloqueia uma faixa de horários de um dia (todos os
+# aparelhos, um tipo ou um aparelho), cancela as reservas atingidas numa
+# transação só e deixa os alunos na fila de avisos.
 
-def get_aulas_pendentes_avaliacao(nome_aluno):
-    # Pega agendamentos do aluno
-    df_agend = conn.query(
-        "SELECT id, data AS \"Data\", horario AS \"Horario\", tipo AS \"Tipo\" FROM agendamentos WHERE nome = :n",
-        params={"n": nome_aluno}, ttl=0
+def aplicar_fechamento(data_str, hora_inicio, hora_fim, tipo=None, numero=None, motivo="", criado_por=None):
+    """Retorna o DataFrame das reservas canceladas (Data, Horario, Numero, Tipo, Nome, UserId)."""
+    cancelados = get_armazenamento().aplicar_bloqueio(
+        data_para_dia(data_str), hora_inicio, hora_fim, tipo, None if numero is None else int(numero), motivo, criado_por
     )
-    
-    # Pega avaliações já feitas
-    df_aval = conn.query(
-        "SELECT id_agendamento FROM avaliacoes WHERE nome_aluno = :n",
-        params={"n": nome_aluno}, ttl=0
-    )
-    ids_avaliados = df_aval['id_agendamento'].tolist() if not df_aval.empty else []
+    _bloqueios_unidade.clear()
+    return cancelados
+
+def remover_fechamento(id_bloqueio):
+    get_armazenamento().remover_bloqueio(int(id_bloqueio))
+    _bloqueios_unidade.clear()
+
+def listar_bloqueios(inicio, fim):
+    """Fechamentos do período (a grade relê a cada 5s; o banco, no máximo a cada 30s)."""
+    return _bloqueios_unidade(inicio, fim, unidade_atual())
+
+@st.cache_data(ttl=CACHE_BLOQUEIOS_S, show_spinner=False)
+def _bloqueios_unidade(inicio, fim, unidade):
+    # A unidade entra na chave do cache
+    return get_armazenamento(unidade).bloqueios_periodo(inicio, fim)
+
+def bloqueios_horario(bloqueios, dia, horario):
+    """Linhas de 'bloqueios' que cobrem o horário do dia."""
+    if bloqueios.empty:
+        return []
+    return [
+        b for b in bloqueios.itertuples(index=False)
+        if b.dia == dia and b.hora_inicio <= horario <= b.hora_fim
+    ]
+
+def motivo_bloqueio(bloqueios, numero, tipo):
+    """Motivo do bloqueio que pega a vaga ('' se sem motivo) ou None se ela está liberada."""
+    for b in bloqueios:
+        if (pd.isna(b.tipo) or b.tipo == tipo) and (pd.isna(b.numero) or int(b.numero) == numero):
+            return b.motivo or ""
+    return None
+
+def bloqueios_do_horario(data_str, horario):
+    dia = data_para_dia(data_str)
+    return bloqueios_horario(listar_bloqueios(dia, dia), dia, horario)
+
+def enviar_notificacoes_pendentes(limite=100, unidade=None):
+    """
+    Manda por e-mail os avisos da fila da unidade (python tarefas.py enviar-notificacoes).
+    Sem SMTP configurado os avisos ficam na fila. Retorna quantos foram enviados.
+    """
+    if not email_configurado():
+        print("E-mail não configurado (secrets.toml [email]): avisos continuam na fila.")
+        return 0
+    armazenamento = get_armazenamento(unidade)
+    enviados = []
+    for aviso in armazenamento.notificacoes_pendentes(limite).itertuples(index=False):
+        if aviso.evento == "promocao":
+            assunto = "[Agenda Naalli] Abriu uma vaga para você"
+            corpo = (
+                f"Olá, {aviso.nome}! Abriu uma vaga em {aviso.data} às {aviso.horario} e ela já é sua "
+                f"({aviso.tipo} {aviso.numero}), pela lista de espera. Se não puder ir, libere a vaga na Agenda Naalli."
+            )
+        elif aviso.evento == "avaliacao":
+            assunto = "[Agenda Naalli] Como foi seu treino?"
+            corpo = (
+                f"Olá, {aviso.nome}! Conta pra gente como foi seu treino de {aviso.data} ({aviso.tipo}): "
+                f"avalie na aba Avaliação da Agenda Naalli. Leva menos de um minuto."
+            )
+        else:
+            motivo = f" Motivo: {aviso.motivo}." if aviso.motivo else ""
+            assunto = "[Agenda Naalli] Reserva cancelada"
+            corpo = (
+                f"Olá, {aviso.nome}! Sua reserva de {aviso.data} às {aviso.horario} "
+                f"({aviso.tipo} {aviso.numero}) foi cancelada pela academia.{motivo} "
+                f"Escolha outro horário na Agenda Naalli."
+            )
+        try:
+            enviar_email(aviso.email, assunto, corpo)
+            enviados.append(aviso.id)
+        except Exception as e:
+            print(f"Falha ao avisar {aviso.email}: {e}")
+    if enviados:
+        armazenamento.marcar_notificacoes_enviadas(enviados)
+    return len(enviados)
+
+# ==========================================
+# 2.2 PREVISÃO DE DEMANDA (previsao.py)
+# ==========================================
+# O ajuste é refeito só quando o instantâneo recebe reservas ou remoções
+# novas, a grade muda ou o dia vira; fora isso todas as sessões do processo
+# leem o mesmo resultado (um por unidade).
+_previsoes = {} # unidade -> (chave, previsão)
+_lock_previsao = threading.Lock()
+
+def prever_demanda(dias=7):
+    """DataFrame de PrevisaoDemanda.proximos_dias a partir de hoje (Data, Horario, Tipo, Previsto...)."""
+    unidade = unidade_atual()
+    instantaneo, grade, hoje = get_instantaneo(unidade), get_grade(unidade), date.today()
+    instantaneo.atualizar()
+    chave = (instantaneo.versao, id(grade), hoje, dias)
+    with _lock_previsao:
+        if _previsoes.get(unidade, (None,))[0] != chave:
+            inicio = hoje - timedelta(days=7 * SEMANAS_HISTORICO)
+            modelo = PrevisaoDemanda(carregar_tudo_formatado(inicio, hoje), hoje, grade)
+            _previsoes[unidade] = (chave, modelo.proximos_dias(hoje, dias))
+        return _previsoes[unidade][1]
+
+# ==========================================
+# 2.3 LISTA DE ESPERA
+# ==========================================
+# Com todos os aparelhos de um tipo ocupados, o aluno entra na fila do
+# horário. Quando alguém cancela, o armazenamento passa a vaga ao primeiro
+# da fila na mesma transação e deixa o aviso na fila de notificações.
+
+def entrar_lista_espera(data_str, horario, tipo, user):
+    """
+    Põe o aluno na fila do horário. Só vale para horário futuro com todos os
+    aparelhos do tipo ocupados (ou fechados): é a regra do botão da grade,
+    conferida aqui também para a API. Retorna "Sucesso" ou o motivo da recusa.
+    """
+    dia = data_para_dia(data_str)
+    if datetime.strptime(f"{data_str} {horario}", "%d/%m/%Y %H:%M") <= datetime.now():
+        return "Esse horário já passou."
+    reservas = carregar_dados_dia(data_str)
+    reservas = reservas[(reservas['Horario'] == horario) & (reservas['Tipo'] == tipo)]
+    if (reservas['UserId'] == user['id']).any():
+        return "Você já tem esse horário."
+    ocupados = set(reservas['Numero'].astype(int))
+    bloqueios = bloqueios_do_horario(data_str, horario)
+    if any(v.Tipo == tipo and v.Numero not in ocupados and motivo_bloqueio(bloqueios, v.Numero, tipo) is None
+           for v in gerar_estrutura_horario(dia, horario)):
+        return "Ainda há aparelho livre: reserve direto."
+    if reservas.empty:
+        # Tudo fechado e ninguém para cancelar: a fila nunca andaria
+        return "Esse horário está fechado."
+    if not get_armazenamento().entrar_lista_espera(dia, horario, tipo, user['nome'], user['id']):
+        return "Você já está na lista de espera."
+    return "Sucesso"
+
+def sair_lista_espera(data_str, horario, tipo, user_id):
+    get_armazenamento().sair_lista_espera(data_para_dia(data_str), horario, tipo, user_id)
+
+def lista_espera_do_horario(data_str, horario):
+    """{tipo: [user_id, ...]} na ordem da fila."""
+    fila = {}
+    for r in get_armazenamento().lista_espera_horario(data_para_dia(data_str), horario).itertuples(index=False):
+        fila.setdefault(r.Tipo, []).append(int(r.UserId))
+    return fila
+
+# ==========================================
+# 3. FUNÇÕES DE AVALIAÇÃO
+# ==========================================
+
+def get_aulas_pendentes_avaliacao(user_id):
+    # Treinos recentes do aluno (janela de avaliação) que ainda não têm avaliação
+    hoje = date.today()
+    df_agend = get_armazenamento().aulas_sem_avaliacao(user_id, hoje - timedelta(days=JANELA_AVALIACAO_DIAS), hoje)
     
     pendentes = []
     agora = datetime.now()
     
     for _, row in df_agend.iterrows():
-        if row['id'] in ids_avaliados: continue
-        
         try:
             dt_str = f"{row['Data']} {row['Horario']}"
             dt_obj = datetime.strptime(dt_str, "%d/%m/%Y %H:%M")
@@ -308,40 +552,163 @@ def get_aulas_pendentes_avaliacao(nome_aluno):
             
     return sorted(pendentes, key=lambda x: datetime.strptime(f"{x['Data']} {x['Horario']}", "%d/%m/%Y %H:%M"), reverse=True)
 
-def salvar_avaliacao_aluno(id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario):
-    with conn.session as s:
-        s.execute(
-            text("""
-                INSERT INTO avaliacoes (id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario, data_avaliacao)
-                VALUES (:id, :n, :d, :m, :nt, :c, :da)
-            """),
-            params={
-                "id": int(id_agendamento), "n": nome_aluno, "d": data_aula, "m": modalidade,
-                "nt": nota, "c": comentario, "da": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-        )
-        s.commit()
+def salvar_avaliacao_aluno(id_agendamento, nome_aluno, data_aula, modalidade, nota, comentario, user_id=None):
+    get_armazenamento().inserir_avaliacao(
+        int(id_agendamento), nome_aluno, data_aula, modalidade, nota, comentario,
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id
+    )
     return True
 
-def carregar_avaliacoes_formatado():
-    # 1. Carrega os dados brutos (que vêm como texto)
-    df = conn.query("SELECT modalidade AS \"Modalidade\", nota AS \"Nota\", comentario AS \"Comentario\", nome_aluno AS \"NomeAluno\", data_aula AS \"DataAula\", data_avaliacao AS \"DataAvaliacao\" FROM avaliacoes", ttl=0)
-    
+# Comentários do painel: só os do aluno e/ou do período saem do banco
+LIMITE_COMENTARIOS = 200
+
+def carregar_comentarios(inicio=None, fim=None, user_id=None, limite=LIMITE_COMENTARIOS):
+    """Avaliações com comentário (Modalidade, Nota, Comentario, NomeAluno, DataAula, DataAvaliacao, UserId), mais recentes primeiro."""
+    return get_armazenamento().comentarios_avaliacoes(inicio, fim, user_id, limite)
+
+# Gráficos de qualidade: somas por dia e modalidade ('avaliacoes_diarias'),
+# juntadas em semanas ou meses para períodos longos
+AGRUPAMENTOS_AVALIACAO = ["Dia", "Semana", "Mês"]
+
+def agrupamento_avaliacoes(inicio, fim):
+    """Agrupamento padrão para o tamanho do período: até 2 meses por dia, até 1 ano por semana."""
+    dias = (fim - inicio).days if inicio and fim else None
+    if dias is not None and dias <= 62:
+        return "Dia"
+    if dias is not None and dias <= 366:
+        return "Semana"
+    return "Mês"
+
+def resumo_avaliacoes(inicio=None, fim=None):
+    """Quantidade, Media (None sem avaliações) e Notas ({1: qtd, ..., 5: qtd}) do período, somados de 'avaliacoes_diarias'."""
+    df = get_armazenamento().avaliacoes_diarias(inicio, fim)
+    quantidade = int(df['Quantidade'].sum())
+    return {
+        "Quantidade": quantidade,
+        "Media": df['Soma'].sum() / quantidade if quantidade else None,
+        "Notas": {nota: int(df[f'Nota{nota}'].sum()) for nota in range(1, 6)},
+    }
+
+def avaliacoes_por_periodo(inicio=None, fim=None, agrupar="Dia"):
+    """
+    Colunas: Periodo (início do dia/semana/mês, datetime), Modalidade,
+    Quantidade, Soma, Nota1..Nota5 e Media, em ordem cronológica.
+    """
+    df = get_armazenamento().avaliacoes_diarias(inicio, fim)
     if df.empty:
-        return pd.DataFrame(columns=["Modalidade", "Nota", "Comentario", "NomeAluno", "DataAula"])
-    
-    # 2. CONVERSÃO INTELIGENTE
-    # Cria uma coluna temporária convertendo o texto DD/MM/YYYY para Data Real
-    # 'dayfirst=True' avisa o Python que o dia vem antes do mês (padrão Brasil)
-    df['ordem_cronologica'] = pd.to_datetime(df['DataAula'], dayfirst=True, errors='coerce')
-    
-    # 3. ORDENAÇÃO
-    # Ordena pela data real (Ascending=False coloca os mais recentes no topo)
-    df = df.sort_values(by='ordem_cronologica', ascending=False)
-    
-    # 4. LIMPEZA
-    # Remove a coluna temporária para não sujar a tabela visual
-    return df.drop(columns=['ordem_cronologica'])
+        return pd.DataFrame(columns=["Periodo", "Modalidade", "Quantidade", "Soma", "Nota1", "Nota2", "Nota3", "Nota4", "Nota5", "Media"])
+    periodo = pd.to_datetime(df.pop('Dia'))
+    if agrupar == "Semana":
+        periodo = periodo - pd.to_timedelta(periodo.dt.dayofweek, unit="D")
+    elif agrupar == "Mês":
+        periodo = periodo.dt.to_period("M").dt.to_timestamp()
+    df = df.groupby([periodo.rename('Periodo'), 'Modalidade'], as_index=False).sum()
+    df['Media'] = df['Soma'] / df['Quantidade']
+    return df.sort_values('Periodo', ignore_index=True)
+
+# Termos e sentimento dos comentários (comentarios.py): um índice por
+# processo e unidade, que só tokeniza as avaliações novas
+_indices_comentarios = {}
+
+def get_indice_comentarios(unidade=None):
+    unidade = unidade or unidade_atual()
+    if unidade not in _indices_comentarios:
+        armazenamento = get_armazenamento(unidade)
+        with _lock_armazenamento:
+            if unidade not in _indices_comentarios:
+                _indices_comentarios[unidade] = IndiceComentarios(armazenamento)
+    return _indices_comentarios[unidade]
+
+def termos_reclamacoes(inicio=None, fim=None, tipos=None, limite=15):
+    """Termos mais citados nas reclamações (Termo, Reclamacoes, Mencoes, NotaMedia, Sentimento)."""
+    return get_indice_comentarios().termos_reclamacoes(inicio, fim, tipos, limite)
+
+def sentimento_por_modalidade(inicio=None, fim=None):
+    """Modalidade, Comentarios, Sentimento médio e fração de Reclamacoes."""
+    return get_indice_comentarios().sentimento_por_modalidade(inicio, fim)
+
+# ==========================================
+# 4. ENGAJAMENTO DOS ALUNOS
+# ==========================================
+# Total, primeira e última visita de cada aluno. No Postgres vêm prontos
+# de 'engajamento_aluno' (ver armazenamento_postgres.py).
+
+def status_engajamento(ultima_visita):
+    """Retorna (dias_sem_vir, status, cor) a partir da última visita."""
+    dias_sem_vir = (date.today() - ultima_visita).days
+    if dias_sem_vir <= 7:
+        return dias_sem_vir, "🟢 Ativo", "green"
+    elif dias_sem_vir <= 30:
+        return dias_sem_vir, "🟡 Atenção", "orange"
+    return dias_sem_vir, "🔴 Inativo", "red"
+
+def get_engajamento_aluno(user_id):
+    eng = get_armazenamento().engajamento_aluno(user_id)
+    if eng is None:
+        return None
+
+    semanas = ((eng['ultima_visita'] - eng['primeira_visita']).days / 7) or 1
+    eng['media_semanal'] = round(eng['total'] / semanas, 1)
+    eng['dias_sem_vir'], eng['status'], eng['cor'] = status_engajamento(eng['ultima_visita'])
+    return eng
+
+# Frequência real: check-ins da recepção (checkin.py), gravados em lotes
+# por uma fila por processo e unidade. Falta = reserva passada sem check-in.
+_ingestores = {}
+
+def get_ingestor_checkins(unidade=None):
+    unidade = unidade or unidade_atual()
+    if unidade not in _ingestores:
+        armazenamento = get_armazenamento(unidade)
+        with _lock_armazenamento:
+            if unidade not in _ingestores:
+                _ingestores[unidade] = IngestorCheckins(armazenamento)
+    return _ingestores[unidade]
+
+def registrar_checkin(user_id, origem="recepcao"):
+    """
+    Enfileira o check-in do aluno agora; a gravação no banco sai no próximo lote.
+    Devolve quantos estão na fila, ou None se o aluno não existe (nada entra na fila).
+    """
+    user_id = int(user_id)
+    if not 0 < user_id <= ID_MAXIMO_CHECKIN or not get_armazenamento().usuario_existe(user_id):
+        return None
+    return get_ingestor_checkins().registrar(user_id, origem=origem)
+
+def fechar_ingestores():
+    """Grava o que está na fila de todas as unidades (parada do processo)."""
+    for ingestor in list(_ingestores.values()):
+        ingestor.fechar()
+
+def _taxa_faltas(freq):
+    freq['taxa_faltas'] = freq['faltas'] / freq['reservas'] if freq['reservas'] else None
+    return freq
+
+def get_frequencia_aluno(user_id):
+    """checkins, ultimo_checkin, reservas (até ontem), faltas e taxa_faltas (None sem reservas)."""
+    return _taxa_faltas(get_armazenamento().frequencia_aluno(user_id, date.today()))
+
+def frequencia_periodo(inicio, fim, tipos=None):
+    """Mesmo formato de get_frequencia_aluno, para a unidade toda no período."""
+    return _taxa_faltas(get_armazenamento().frequencia_periodo(inicio, fim, date.today(), tipos))
+
+# Busca do painel (Raio-X, filtro de comentários): os alunos saem do banco
+# a cada trecho digitado, LIMITE_BUSCA_ALUNOS por vez
+LIMITE_BUSCA_ALUNOS = 10
+
+def texto_busca(texto):
+    """Minúsculas, sem acento e sem curingas do LIKE (mesma forma da coluna users.busca)."""
+    texto = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode()
+    return " ".join(texto.replace("%", " ").replace("_", " ").split())
+
+def buscar_alunos(termo, limite=LIMITE_BUSCA_ALUNOS):
+    """Colunas: id, nome, email dos alunos cujo nome ou e-mail contém o termo (2+ letras)."""
+    termo = texto_busca(termo or "")
+    if len(termo) < 2:
+        return pd.DataFrame(columns=["id", "nome", "email"])
+    return get_armazenamento().buscar_alunos(termo, limite)
 
-# Inicializa tabelas no final, agora seguro com a conexão configurada
-inicializar_banco()
\ No newline at end of file
+def listar_alunos_em_risco(min_dias=8, max_dias=30):
+    """Alunos que não vêm há entre min_dias e max_dias dias (faixa 🟡), mais antigos primeiro."""
+    hoje = date.today()
+    return get_armazenamento().alunos_em_risco(hoje, hoje - timedelta(days=max_dias), hoje - timedelta(days=min_dias))